@@ -1,6 +1,7 @@
 import os
 import json
-from typing import Dict, Any, List
+import asyncio
+from typing import Dict, Any, List, Optional, AsyncIterator
 from datetime import datetime
 import pytz  # Necessário para horário do Brasil
 
@@ -9,9 +10,21 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from dotenv import load_dotenv
 
+from app.core.prompt_builder import prompt_assembler
+from app.core.fast_path import fast_path_router
+from app.core.llm_gateway import llm_gateway
+from app.core.slo_guard import SLOGuard, LLM_FALLBACK_MODEL, LLM_DEADLINE_SECONDS
+from app.core.stub_llm import StubChain
+from app.core.text_utils import estimate_tokens
+from app.core.memory import ConversationMemory, build_destination_index
+from app.services.catalog_index import parse_search_filters
+from app.services.session_store import session_store, SessionMap
+
 # Tenta importar o serviço de RAG (Garanta que esse arquivo existe no seu projeto)
 try:
-    from app.services.rag_service import rag_service
+    from app.services.rag_service import rag_service, RAG_TIMEOUT_SECONDS
+    from app.services.semantic_cache import semantic_cache
+    from app.services.index_reloader import index_reloader
     RAG_AVAILABLE = True
 except ImportError:
     print("⚠️ AVISO: rag_service não encontrado. O bot rodará sem memória de longo prazo.")
@@ -27,11 +40,34 @@ if not GOOGLE_API_KEY:
     print("❌ ERRO CRÍTICO: GOOGLE_API_KEY não encontrada no .env")
 
 # Configuração do Gemini (Usando Flash para velocidade)
+LLM_MODEL = "gemini-2.0-flash" # Ou 'gemini-1.5-flash' dependendo da disponibilidade
+# Tokens de saída esperados por resposta (entra na estimativa do rate limit)
+LLM_OUTPUT_TOKENS_ESTIMATE = 300
+# Testes offline: distribuição de latência do LLM simulado (ex: "lognormal:1.2,0.6").
+# Com isso definido, as respostas vêm do StubChain e o Gemini não é chamado.
+LLM_STUB = os.getenv("LLM_STUB")
+LLM_STUB_FALLBACK = os.getenv("LLM_STUB_FALLBACK", "fixed:0.3")
+LLM_STUB_FAILURE_RATE = float(os.getenv("LLM_STUB_FAILURE_RATE", "0"))
+
 llm = ChatGoogleGenerativeAI(
-    model="gemini-2.0-flash", # Ou 'gemini-1.5-flash' dependendo da disponibilidade
+    model=LLM_MODEL,
     temperature=0.4, # Baixei a temperatura para ele ser mais "sério" e consistente
     google_api_key=GOOGLE_API_KEY,
-    convert_system_message_to_human=True
+    convert_system_message_to_human=True,
+    # O prazo de verdade é controlado pelo slo_guard; aqui é só a rede de segurança do HTTP.
+    # Poucas tentativas: retry com backoff estoura o prazo, quem cobre falhas é o fallback.
+    timeout=LLM_DEADLINE_SECONDS,
+    max_retries=1
+)
+
+# Modelo secundário, usado quando o principal não responde dentro do prazo
+fallback_llm = ChatGoogleGenerativeAI(
+    model=LLM_FALLBACK_MODEL,
+    temperature=0.4,
+    google_api_key=GOOGLE_API_KEY,
+    convert_system_message_to_human=True,
+    timeout=LLM_DEADLINE_SECONDS,
+    max_retries=0
 )
 
 # --- FUNÇÕES AUXILIARES ---
@@ -51,30 +87,47 @@ def get_time_greeting() -> str:
     except Exception:
         return "Olá" # Fallback caso dê erro no timezone
 
-def load_catalog_summary():
-    """Carrega um resumo simples do catálogo para contexto geral."""
+def load_catalog() -> List[Dict[str, Any]]:
+    """Carrega o catálogo completo (usado no resumo orçado do prompt)."""
     try:
         # Ajuste o caminho conforme sua estrutura de pastas
         catalog_path = os.path.join(os.path.dirname(__file__), "..", "..", "data", "catalog.json")
         
         if not os.path.exists(catalog_path):
-            return "Resumo do catálogo indisponível no momento."
+            return []
         
         with open(catalog_path, 'r', encoding='utf-8') as f:
-            catalog = json.load(f)
-            
-        summary = ""
-        for item in catalog:
-            # Cria uma lista simples: Nome - Preço
-            summary += f"- {item.get('title', 'Pacote')}: {item.get('price', 'Sob consulta')}\n"
-            
-        return summary
+            return json.load(f)
     except Exception as e:
-        print(f"Erro ao carregar resumo do catálogo: {e}")
-        return "Erro ao carregar catálogo."
+        print(f"Erro ao carregar catálogo: {e}")
+        return []
+
+def apply_catalog(catalog: List[Dict[str, Any]]):
+    """
+    Troca o catálogo usado no prompt, no fast path e na memória. Cada parte é
+    montada à parte e atribuída de uma vez, então turnos em andamento não veem
+    meio catálogo.
+    """
+    global CATALOG, DESTINATIONS
+    prompt_assembler.set_catalog(catalog)
+    fast_path_router.set_catalog(catalog)
+    DESTINATIONS = build_destination_index(catalog)
+    CATALOG = catalog
+
 
-# Carrega o catálogo na inicialização
-CATALOG_SUMMARY = load_catalog_summary()
+# Carrega o catálogo na inicialização (o da mesma versão do índice, se houver).
+# O resumo enviado ao modelo é montado a cada turno pelo prompt_assembler, só
+# com os pacotes que cabem no orçamento.
+CATALOG: List[Dict[str, Any]] = []
+DESTINATIONS: List[Dict[str, Any]] = []
+apply_catalog(rag_service.snapshot.catalog if RAG_AVAILABLE and rag_service.snapshot.catalog else load_catalog())
+
+if RAG_AVAILABLE:
+    def _on_index_reload(snapshot):
+        # Versão nova do índice: catálogo da mesma versão e respostas em cache descartadas
+        apply_catalog(snapshot.catalog or load_catalog())
+        semantic_cache.clear()
+    index_reloader.add_listener(_on_index_reload)
 
 # --- PROMPT DO SISTEMA (CÉREBRO) ---
 
@@ -115,84 +168,285 @@ prompt = ChatPromptTemplate.from_template(system_template)
 
 # Cria a chain (Corrente de pensamento)
 chain = prompt | llm | StrOutputParser()
+fallback_chain = prompt | fallback_llm | StrOutputParser()
+
+if LLM_STUB:
+    print(f"🧪 LLM_STUB ativo ({LLM_STUB}): respostas simuladas, Gemini não será chamado.")
+    chain = StubChain(LLM_STUB, failure_rate=LLM_STUB_FAILURE_RATE, name=LLM_MODEL)
+    fallback_chain = StubChain(LLM_STUB_FALLBACK, name=LLM_FALLBACK_MODEL)
+
+# Prazo, hedge e fallback das chamadas da chain principal
+slo_guard = SLOGuard(LLM_MODEL, chain, LLM_FALLBACK_MODEL, fallback_chain)
+
+summary_template = """Você mantém o resumo de um atendimento da Marcinho Turismo.
+Atualize o resumo incorporando os novos trechos da conversa. Seja factual e curto
+(no máximo 5 frases): preserve nome do cliente, pacotes e datas de interesse,
+quantidade de pessoas, dúvidas em aberto e o que já foi enviado (preços, links).
+
+RESUMO ATUAL:
+{summary}
+
+NOVOS TRECHOS:
+{turns}
+
+RESUMO ATUALIZADO:"""
+
+summary_chain = ChatPromptTemplate.from_template(summary_template) | llm | StrOutputParser()
 
-# Memória volátil (Dicionário simples para teste/MVP)
-# Nota: Em produção, substituir por Redis ou Banco de Dados
-MEMORY = {}
+# Memória por usuário (user_id -> ConversationMemory), persistida no session store
+# e compartilhada entre workers/instâncias que usam o mesmo arquivo
+MEMORY = SessionMap(
+    session_store,
+    "memory",
+    encode=lambda memory: memory.to_dict(),
+    decode=ConversationMemory.from_dict
+)
+
+
+async def summarize_turns(summary: str, turns: str) -> str:
+    """Resumo contínuo dos turnos que saíram do buffer da memória (prioridade de background)."""
+    inputs = {"summary": summary or "(vazio)", "turns": turns}
+    tokens = estimate_tokens(summary_template) + estimate_tokens(summary + turns) + LLM_OUTPUT_TOKENS_ESTIMATE
+    return await llm_gateway.run(LLM_MODEL, "background", tokens, lambda: summary_chain.ainvoke(inputs))
+
+
+async def summarize_and_save(user_id: str, memory: ConversationMemory):
+    """Atualiza o resumo em background e grava a memória de novo no session store."""
+    await memory.summarize(summarize_turns)
+    MEMORY[user_id] = memory
 
 # --- FUNÇÃO PRINCIPAL ---
 
-async def process_user_intent(user_text: str, user_id: str, channel: str = 'whatsapp') -> Dict[str, Any]:
+ERROR_MESSAGE = "Desculpe, o sistema da agência está momentaneamente indisponível. Tente novamente em 1 minuto."
+MESSAGE_SEPARATOR = "|||"
+
+
+def split_messages(response_text: str) -> List[str]:
+    """O modelo usa "|||" para indicar que quer mandar balões separados no Zap."""
+    return [msg.strip() for msg in response_text.split(MESSAGE_SEPARATOR) if msg.strip()]
+
+
+def estimate_prompt_tokens(inputs: Dict[str, str]) -> int:
+    """Tokens estimados de uma chamada da chain principal (prompt + resposta)."""
+    return estimate_tokens(system_template) + sum(estimate_tokens(v) for v in inputs.values()) + LLM_OUTPUT_TOKENS_ESTIMATE
+
+
+async def prepare_turn(user_text: str, user_id: str, channel: str = 'whatsapp') -> Optional[Dict[str, Any]]:
     """
-    Processa a mensagem do usuário, consulta o RAG e gera resposta via Gemini.
+    Etapas anteriores à geração: pausa, memória, saudação, fast path, RAG e
+    cache semântico. Retorna None se o usuário estiver pausado (IA silenciada).
+    Se o fast path responder, 'fast_messages' vem preenchido e o resto é pulado.
     """
-    
     # 1. Verifica intervenção humana (Pause)
     try:
         from app.routes.admin import is_user_paused
         if is_user_paused(user_id):
             print(f"⏸️ USUÁRIO {user_id} PAUSADO. IA SILENCIADA.")
-            return {"messages": []}
+            return None
     except ImportError:
         pass # Ignora se não tiver o módulo de admin ainda
 
-    # 2. Recupera histórico
-    history = MEMORY.get(user_id, "")
+    # 2. Recupera a memória estruturada do cliente
+    memory = MEMORY.get(user_id) or ConversationMemory()
     
     # 3. Calcula saudação (Bom dia/tarde/noite)
     current_greeting = get_time_greeting()
-    
-    # 4. RAG: Busca no Banco Vetorial
-    context_str = "Nenhuma informação específica encontrada no banco de dados para esta pergunta."
+
+    # 4. Fast path: preço, horário de embarque e viagens do mês saem direto do catálogo
+    fast_answer = fast_path_router.route(user_text, memory.facts.get("destination"))
+    if fast_answer:
+        fast_messages = fast_answer["messages"]
+        if memory.is_empty():
+            fast_messages = [f"{current_greeting}! Aqui é o Márcio, da Marcinho Turismo."] + fast_messages
+        return {
+            "memory": memory,
+            "greeting": current_greeting,
+            "query_vector": None,
+            "rag_results": [],
+            "cache_key": None,
+            "cached_response": None,
+            "fast_messages": fast_messages,
+        }
+
+    # 5. RAG: Busca no Banco Vetorial
+    query_vector = None
+    rag_results = []
     
     if RAG_AVAILABLE:
         try:
-            rag_results = rag_service.search(user_text, k=3)
-            if rag_results:
-                context_str = "--- DADOS ENCONTRADOS NO SISTEMA ---\n"
-                for res in rag_results:
-                    item = res['item']
-                    context_str += f"""
-                    - PACOTE: {item.get('title')}
-                      PREÇO: {item.get('price')}
-                      DESCRIÇÃO: {item.get('description', '')[:500]}
-                      INCLUSO: {item.get('inclusoes', 'Consultar')}
-                      LINK PAGAMENTO/DETALHES: {item.get('url', 'N/A')}
-                    """
-                context_str += "\n--- FIM DOS DADOS ---"
+            # Embedding calculado uma vez e reaproveitado pela busca e pelo cache semântico.
+            # Tudo roda no executor do RAG, sem travar o event loop. Se o embedding
+            # estourar o prazo, a busca segue só com o índice lexical (BM25).
+            # Preço, mês e cidade de embarque citados viram filtros antes da busca
+            filters = parse_search_filters(user_text)
+            query_vector, rag_results = await rag_service.aretrieve(
+                user_text, k=3, timeout=RAG_TIMEOUT_SECONDS, channel=channel, filters=filters
+            )
         except Exception as e:
             print(f"Erro no RAG: {e}")
             # Não quebra o bot, apenas segue sem contexto específico
             pass
 
-    # 5. Gera a resposta com a IA
+    # 6. Cache semântico: só para perguntas que não dependem do histórico
+    cache_key = None
+    cached_response = None
+    if memory.is_empty() and query_vector is not None:
+        cache_key = (current_greeting, tuple(res['item'].get('url') for res in rag_results))
+        cached_response = semantic_cache.get(query_vector, cache_key)
+        if cached_response is not None:
+            print(f"⚡ Cache semântico: resposta reaproveitada para {user_id}.")
+
+    return {
+        "memory": memory,
+        "greeting": current_greeting,
+        "query_vector": query_vector,
+        "rag_results": rag_results,
+        "cache_key": cache_key,
+        "cached_response": cached_response,
+        "fast_messages": None,
+    }
+
+
+def build_prompt_inputs(turn: Dict[str, Any], user_text: str) -> Dict[str, str]:
+    """Variáveis do prompt, com as seções cortadas pelo orçamento de tokens."""
+    history = turn["memory"].render(prompt_assembler.history_budget)
+    sections = prompt_assembler.build(user_text, turn["rag_results"], history)
+    return {
+        "user_text": user_text,
+        "history": sections["history"],
+        "rag_context": sections["rag_context"],
+        "catalog_summary": sections["catalog_summary"],
+        "time_greeting": turn["greeting"]
+    }
+
+
+def canned_reply(turn: Dict[str, Any]) -> str:
+    """
+    Resposta de contingência quando nenhum modelo respondeu no prazo: os pacotes
+    que o RAG encontrou, direto do catálogo. Marca o turno para não ir ao cache.
+    """
+    turn["canned"] = True
+    # Viagens encerradas não entram (sem preço nem link para vender)
+    available = [res for res in turn["rag_results"] if not res.get('closed')]
+    if not available:
+        return ERROR_MESSAGE
+    lines = [
+        f"{res['item'].get('title')}: {res['item'].get('price')}\n{res['item'].get('url')}"
+        for res in available[:2]
+    ]
+    return MESSAGE_SEPARATOR.join(
+        ["Encontrei isto no nosso catálogo:"] + lines + ["Quer que eu te explique melhor algum deles?"]
+    )
+
+
+def finish_turn(turn: Dict[str, Any], user_text: str, user_id: str, response_text: str):
+    """Guarda a resposta no cache semântico e atualiza a memória do cliente."""
+    if turn.get("truncated"):
+        # Resposta cortada (stream travou): não vai para o cache nem para o histórico
+        print(f"⚠️ Resposta incompleta para {user_id}: fora do cache e da memória.")
+        return
+
+    if turn["cache_key"] is not None and turn["cached_response"] is None and not turn.get("canned"):
+        semantic_cache.put(turn["query_vector"], turn["cache_key"], response_text)
+
+    # Atualiza a memória (turnos inteiros + fatos extraídos)
+    # Removemos o separador interno "|||" do histórico para não confundir o modelo no futuro
+    memory = turn["memory"]
+    clean_response = response_text.replace(MESSAGE_SEPARATOR, " ")
+    memory.update_facts(user_text, DESTINATIONS)
+    memory.add_turn("user", user_text)
+    memory.add_turn("assistant", clean_response)
+    MEMORY[user_id] = memory
+    if memory.needs_summary():
+        # Resumo dos turnos antigos em background, sem atrasar a resposta
+        asyncio.create_task(summarize_and_save(user_id, memory))
+
+
+async def process_user_intent(user_text: str, user_id: str, channel: str = 'whatsapp') -> Dict[str, Any]:
+    """
+    Processa a mensagem do usuário, consulta o RAG e gera resposta via Gemini.
+    """
+    turn = await prepare_turn(user_text, user_id, channel)
+    if turn is None:
+        return {"messages": []}
+
+    if turn["fast_messages"]:
+        finish_turn(turn, user_text, user_id, MESSAGE_SEPARATOR.join(turn["fast_messages"]))
+        return {"messages": turn["fast_messages"], "action": "reply"}
+
+    # 7. Gera a resposta com a IA
     try:
-        response_text = await chain.ainvoke({
-            "user_text": user_text,
-            "history": history,
-            "rag_context": context_str,
-            "catalog_summary": CATALOG_SUMMARY,
-            "time_greeting": current_greeting
-        })
-        
-        # 6. Atualiza Histórico (Mantém os últimos 2000 caracteres para não estourar memória)
-        # Removemos o separador interno "|||" do histórico para não confundir o modelo no futuro
-        clean_response = response_text.replace("|||", " ")
-        new_history = f"Cliente: {user_text}\nMárcio: {clean_response}\n"
-        MEMORY[user_id] = (history + new_history)[-2000:]
+        if turn["cached_response"] is not None:
+            response_text = turn["cached_response"]
+        else:
+            inputs = build_prompt_inputs(turn, user_text)
+            response_text, _ = await slo_guard.invoke(
+                inputs, channel, estimate_prompt_tokens(inputs), lambda: canned_reply(turn)
+            )
         
-        # 7. Processamento da Saída (Split das mensagens)
-        # O modelo usa "|||" para indicar que quer mandar balões separados no Zap
-        raw_messages = [msg.strip() for msg in response_text.split("|||") if msg.strip()]
+        # 8. Atualiza cache e memória
+        finish_turn(turn, user_text, user_id, response_text)
         
+        # 9. Processamento da Saída (Split das mensagens)
         return {
-            "messages": raw_messages,
+            "messages": split_messages(response_text),
             "action": "reply"
         }
         
     except Exception as e:
         print(f"❌ Erro crítico na IA: {e}")
         return {
-            "messages": ["Desculpe, o sistema da agência está momentaneamente indisponível. Tente novamente em 1 minuto."],
+            "messages": [ERROR_MESSAGE],
             "action": "error"
         }
+
+
+async def stream_user_intent(user_text: str, user_id: str, channel: str = 'whatsapp') -> AsyncIterator[str]:
+    """
+    Versão em streaming de process_user_intent: usa o stream da chain e entrega cada
+    balão assim que o separador "|||" fecha o segmento, sem esperar a resposta inteira.
+    """
+    turn = await prepare_turn(user_text, user_id, channel)
+    if turn is None:
+        return
+
+    if turn["fast_messages"]:
+        for message in turn["fast_messages"]:
+            yield message
+        finish_turn(turn, user_text, user_id, MESSAGE_SEPARATOR.join(turn["fast_messages"]))
+        return
+
+    if turn["cached_response"] is not None:
+        for message in split_messages(turn["cached_response"]):
+            yield message
+        finish_turn(turn, user_text, user_id, turn["cached_response"])
+        return
+
+    response_text = ""
+    buffer = ""
+    emitted = 0
+    try:
+        inputs = build_prompt_inputs(turn, user_text)
+        chunks = slo_guard.stream(
+            inputs, channel, estimate_prompt_tokens(inputs), lambda: canned_reply(turn),
+            stalled=lambda: turn.update(truncated=True)
+        )
+        async for chunk in chunks:
+            response_text += chunk
+            buffer += chunk
+            # Um "|||" pode chegar quebrado entre chunks; por isso procuramos no buffer acumulado
+            while MESSAGE_SEPARATOR in buffer:
+                segment, buffer = buffer.split(MESSAGE_SEPARATOR, 1)
+                if segment.strip():
+                    emitted += 1
+                    yield segment.strip()
+        if buffer.strip():
+            emitted += 1
+            yield buffer.strip()
+
+        finish_turn(turn, user_text, user_id, response_text)
+
+    except Exception as e:
+        print(f"❌ Erro crítico na IA (streaming): {e}")
+        if not emitted:
+            yield ERROR_MESSAGE
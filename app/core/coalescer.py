@@ -0,0 +1,147 @@
+import os
+import asyncio
+from typing import Dict, Any, List, Callable, Awaitable, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Janela de silêncio (s) que esperamos antes de responder uma rajada de mensagens.
+# 0 desliga a espera (cada mensagem vira um turno, salvo cancelamento).
+COALESCE_WINDOW_SECONDS = float(os.getenv("COALESCE_WINDOW_SECONDS", "1.5"))
+
+
+class _Burst:
+    """Estado de rajada de um usuário: mensagens pendentes e o turno em andamento."""
+    def __init__(self):
+        self.texts: List[str] = []
+        self.waiters: List[asyncio.Future] = []
+        self.changed = asyncio.Event()
+        self.runner: Optional[asyncio.Task] = None
+        self.generation: Optional[asyncio.Task] = None
+        self.superseded = False
+        self.generate: Optional[Callable[[str], Awaitable[Dict[str, Any]]]] = None
+        self.deliver: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
+
+
+class BurstCoalescer:
+    """
+    Junta mensagens rápidas e consecutivas do mesmo usuário ("oi", "quero saber
+    do pacote", "de porto seguro") em um único turno: uma busca no RAG e uma
+    chamada ao Gemini.
+
+    - Espera COALESCE_WINDOW_SECONDS sem mensagens novas antes de gerar.
+    - Se chegar mensagem nova durante a geração, a geração é cancelada e o
+      turno recomeça com todas as mensagens juntas.
+    - Depois que o envio começou, mensagens novas ficam para o próximo turno
+      (nunca intercalamos respostas).
+    """
+    def __init__(self, window: float = COALESCE_WINDOW_SECONDS):
+        self.window = window
+        self._bursts: Dict[str, _Burst] = {}
+        self.messages_in = 0
+        self.turns = 0
+        self.cancelled_generations = 0
+
+    def add(
+        self,
+        user_key: str,
+        text: str,
+        generate: Callable[[str], Awaitable[Dict[str, Any]]],
+        deliver: Callable[[Dict[str, Any]], Awaitable[None]]
+    ) -> asyncio.Future:
+        """
+        Adiciona uma mensagem à rajada do usuário.
+        Retorna um Future resolvido quando o turno que contém a mensagem for entregue.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.messages_in += 1
+
+        burst = self._bursts.get(user_key)
+        if burst is None:
+            burst = _Burst()
+            self._bursts[user_key] = burst
+
+        burst.texts.append(text)
+        burst.waiters.append(future)
+        burst.generate = generate
+        burst.deliver = deliver
+        burst.changed.set()
+
+        if burst.generation is not None and not burst.generation.done():
+            # Resposta ficou desatualizada: cancela e recomeça com a rajada completa
+            burst.superseded = True
+            burst.generation.cancel()
+
+        if burst.runner is None:
+            burst.runner = asyncio.create_task(self._run(user_key, burst))
+        return future
+
+    async def _run(self, user_key: str, burst: _Burst):
+        try:
+            while burst.texts:
+                # Debounce: só segue quando a janela passar sem mensagens novas
+                while True:
+                    burst.changed.clear()
+                    try:
+                        await asyncio.wait_for(burst.changed.wait(), timeout=self.window)
+                    except asyncio.TimeoutError:
+                        break
+
+                texts, waiters = burst.texts, burst.waiters
+                burst.texts, burst.waiters = [], []
+                merged_text = "\n".join(texts)
+                if len(texts) > 1:
+                    print(f"🧩 {len(texts)} mensagens de {user_key} agrupadas em um único turno.")
+
+                burst.superseded = False
+                burst.generation = asyncio.create_task(burst.generate(merged_text))
+                try:
+                    result = await burst.generation
+                except asyncio.CancelledError:
+                    if not burst.superseded:
+                        raise
+                    # Devolve as mensagens para a frente da fila e recomeça a janela
+                    print(f"✂️ Geração cancelada para {user_key}: chegou mensagem nova.")
+                    self.cancelled_generations += 1
+                    burst.texts = texts + burst.texts
+                    burst.waiters = waiters + burst.waiters
+                    continue
+                except Exception as e:
+                    for waiter in waiters:
+                        if not waiter.done():
+                            waiter.set_exception(e)
+                    continue
+                finally:
+                    burst.generation = None
+
+                self.turns += 1
+                try:
+                    await burst.deliver(result)
+                    for waiter in waiters:
+                        if not waiter.done():
+                            waiter.set_result(result)
+                except Exception as e:
+                    for waiter in waiters:
+                        if not waiter.done():
+                            waiter.set_exception(e)
+        finally:
+            for waiter in burst.waiters:
+                if not waiter.done():
+                    waiter.cancel()
+            if self._bursts.get(user_key) is burst:
+                del self._bursts[user_key]
+
+    def stats(self) -> Dict[str, Any]:
+        """Mensagens recebidas vs turnos gerados (quanto economizamos de chamadas ao LLM)."""
+        return {
+            "window_seconds": self.window,
+            "messages_in": self.messages_in,
+            "turns": self.turns,
+            "cancelled_generations": self.cancelled_generations,
+            "active_bursts": len(self._bursts),
+        }
+
+
+# Instância global
+coalescer = BurstCoalescer()
@@ -0,0 +1,195 @@
+import os
+import re
+import time
+from datetime import date
+from typing import Dict, Any, List, Optional
+from dotenv import load_dotenv
+
+from app.core.text_utils import normalize_text, tokenize
+from app.services.catalog_index import (
+    CatalogIndex, MONTH_NAMES, BOARDING_LABELS, extract_month, match_boarding_city, strip_boarding_aliases
+)
+
+load_dotenv()
+
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() not in ("0", "false", "no")
+# Mais opções que isso e a pergunta fica ambígua: deixa o LLM conversar com o cliente
+FAST_PATH_MAX_OPTIONS = int(os.getenv("FAST_PATH_MAX_OPTIONS", "4"))
+# Mensagens longas costumam ter mais de uma pergunta; essas vão direto para o LLM
+FAST_PATH_MAX_WORDS = int(os.getenv("FAST_PATH_MAX_WORDS", "18"))
+
+_PRICE_RE = re.compile(r"\b(quanto (custa|fica|sai|e|ta|esta)|valor|valores|preco|precos)\b")
+_BOARDING_RE = re.compile(r"\b(que horas|horario|horarios|embarque|embarca|embarcar|saida|sai de|sai da|sai do)\b")
+_LISTING_RE = re.compile(r"\b(quais|que|qual|tem|teria|temos|opcoes|opcao)\b.*\b(viagens?|passeios?|pacotes?|excursao|excursoes|saidas)\b")
+# Assuntos que a resposta determinística não cobre
+_OUT_OF_SCOPE_RE = re.compile(r"\b(parcel\w*|pix|cartao|crianca\w*|desconto|roteiro|inclui\w*|incluso|hotel|quarto|reserv\w*)\b")
+
+
+_FAR_FUTURE = date.max
+
+
+def format_brl(value: float) -> str:
+    """2950.0 -> 'R$ 2.950,00'"""
+    raw = f"{value:,.2f}".replace(",", "_").replace(".", ",").replace("_", ".")
+    return f"R$ {raw}"
+
+
+def format_day(departure) -> str:
+    return departure.strftime("%d/%m/%Y") if departure else "data a confirmar"
+
+
+class FastPathRouter:
+    """
+    Roteador de intenções por regras para perguntas comuns que o catálogo
+    responde sozinho (preço, horário de embarque, viagens em um mês).
+
+    Extrai os slots (destino, mês, cidade de embarque) do texto em português
+    e só responde quando a intenção e os slots não são ambíguos; no resto,
+    devolve None e o fluxo normal (RAG + Gemini) segue. Tudo é local e
+    determinístico, então a resposta sai em menos de 1 ms.
+    """
+    def __init__(self, enabled: bool = FAST_PATH_ENABLED):
+        self.enabled = enabled
+        self.index = CatalogIndex([])
+        self.total = 0
+        self.served = 0
+        self.by_intent: Dict[str, int] = {}
+        self.total_ms = 0.0
+
+    def set_catalog(self, catalog: List[Dict[str, Any]]):
+        self.index = CatalogIndex(catalog)
+
+    def route(self, user_text: str, context_destination: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Retorna {"intent", "messages"} se a pergunta pode ser respondida pelo
+        catálogo, ou None para seguir pelo LLM. context_destination é o destino
+        já falado na conversa (usado quando a mensagem não cita nenhum).
+        """
+        if not self.enabled:
+            return None
+        started = time.perf_counter()
+        self.total += 1
+        result = None
+        try:
+            result = self._route(user_text, context_destination)
+        except Exception as e:
+            print(f"FAST PATH: Erro ao rotear ({e}). Seguindo pelo LLM.")
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.total_ms += elapsed_ms
+        if result:
+            self.served += 1
+            self.by_intent[result["intent"]] = self.by_intent.get(result["intent"], 0) + 1
+            print(f"⚡ Fast path ({result['intent']}): respondido em {elapsed_ms:.2f} ms, sem LLM.")
+        return result
+
+    def _route(self, user_text: str, context_destination: Optional[str]) -> Optional[Dict[str, Any]]:
+        normalized = normalize_text(user_text)
+        if len(tokenize(normalized)) > FAST_PATH_MAX_WORDS or _OUT_OF_SCOPE_RE.search(normalized):
+            return None
+
+        month = extract_month(normalized)
+        city = match_boarding_city(normalized)
+        entries = self.index.match_destinations(strip_boarding_aliases(normalized))
+        if not entries and context_destination:
+            entries = self.index.match_destinations(context_destination)
+        if entries:
+            # Só saídas que ainda não aconteceram; se o destino só tinha saídas passadas, o LLM responde
+            today = date.today()
+            entries = [e for e in entries if e["departure"] is None or e["departure"] >= today]
+            if not entries:
+                return None
+        if month and entries:
+            entries = [e for e in entries if e["departure"] and e["departure"].month == month]
+
+        if _BOARDING_RE.search(normalized) and entries:
+            messages = self._answer_boarding(entries, city)
+            return {"intent": "boarding_time", "messages": messages} if messages else None
+        if _PRICE_RE.search(normalized) and entries:
+            messages = self._answer_price(entries)
+            return {"intent": "price", "messages": messages} if messages else None
+        if month and not entries and _LISTING_RE.search(normalized):
+            messages = self._answer_month(month)
+            return {"intent": "trips_in_month", "messages": messages} if messages else None
+        return None
+
+    def _answer_price(self, entries: List[Dict[str, Any]]) -> Optional[List[str]]:
+        if len(entries) <= FAST_PATH_MAX_OPTIONS:
+            if len(entries) == 1:
+                entry = entries[0]
+                item = entry["item"]
+                return [
+                    f"O {item.get('title')} com saída em {format_day(entry['departure'])} está {item.get('price')}.",
+                    f"{item.get('url')}",
+                    "Quer ver o roteiro dia a dia?",
+                ]
+            lines = [
+                f"- {e['item'].get('title')} ({format_day(e['departure'])}): {e['item'].get('price')}"
+                for e in sorted(entries, key=lambda e: e["departure"] or _FAR_FUTURE)
+            ]
+            return ["Temos estas saídas:\n" + "\n".join(lines), "Qual data te interessa mais?"]
+
+        # Muitas datas: agrupa por pacote e informa o menor preço
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for entry in entries:
+            groups.setdefault(entry["item"].get("title", ""), []).append(entry)
+        if len(groups) > FAST_PATH_MAX_OPTIONS or any(e["price"] is None for e in entries):
+            return None
+        lines = []
+        for title, group in groups.items():
+            dates = ", ".join(format_day(e["departure"]) for e in sorted(group, key=lambda e: e["departure"] or _FAR_FUTURE) if e["departure"])
+            lowest = min(e["price"] for e in group)
+            lines.append(f"- {title}: a partir de {format_brl(lowest)} por pessoa (saídas {dates})")
+        return ["Temos estas opções:\n" + "\n".join(lines), "Qual data te interessa mais?"]
+
+    def _answer_boarding(self, entries: List[Dict[str, Any]], city: Optional[str]) -> Optional[List[str]]:
+        if len(entries) > FAST_PATH_MAX_OPTIONS:
+            return None
+        lines = []
+        for entry in sorted(entries, key=lambda e: e["departure"] or _FAR_FUTURE):
+            title = entry["item"].get("title")
+            day = format_day(entry["departure"])
+            if city:
+                point = next((p for p in entry["boarding"] if p["city"] == city), None)
+                if point is None:
+                    available = ", ".join(BOARDING_LABELS[p["city"]] for p in entry["boarding"])
+                    if not available:
+                        return None
+                    lines.append(f"- {title} ({day}): não tem embarque em {BOARDING_LABELS[city]}. Embarques: {available}.")
+                elif point["time"] is None:
+                    return None
+                else:
+                    lines.append(f"- {title} ({day}): embarque em {BOARDING_LABELS[city]} às {point['time']}.")
+            else:
+                # Sem cidade, só respondemos se houver uma única saída
+                if len(entries) > 1 or not entry["boarding"] or any(p["time"] is None for p in entry["boarding"]):
+                    return None
+                points = "\n".join(f"- {BOARDING_LABELS[p['city']]}: {p['time']}" for p in entry["boarding"])
+                return [f"Horários de embarque do {title} ({day}):\n{points}", "De onde você vai embarcar?"]
+        return ["\n".join(lines)] if lines else None
+
+    def _answer_month(self, month: int) -> Optional[List[str]]:
+        entries = self.index.departing_in(month)
+        if not entries:
+            return [f"No momento não temos saídas em {MONTH_NAMES[month]}.", "Quer que eu te mostre as datas mais próximas?"]
+        if len(entries) > FAST_PATH_MAX_OPTIONS:
+            return None
+        lines = [
+            f"- {e['item'].get('title')} ({format_day(e['departure'])}): {format_brl(e['price']) if e['price'] is not None else e['item'].get('price')}"
+            for e in entries
+        ]
+        year = entries[0]["departure"].year
+        return [f"Saídas em {MONTH_NAMES[month]} de {year}:\n" + "\n".join(lines), "Alguma te interessou?"]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "total": self.total,
+            "served": self.served,
+            "fraction_served": round(self.served / self.total, 3) if self.total else 0.0,
+            "by_intent": dict(self.by_intent),
+            "avg_route_ms": round(self.total_ms / self.total, 3) if self.total else 0.0,
+        }
+
+
+# Instância global
+fast_path_router = FastPathRouter()
@@ -0,0 +1,228 @@
+import os
+import time
+import heapq
+import asyncio
+import itertools
+from collections import deque
+from contextlib import asynccontextmanager
+from concurrent.futures import Executor
+from functools import partial
+from typing import Dict, Any, Callable, Awaitable, Optional, List, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Limites dos modelos de chat (Gemini Flash)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "600"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "1000000"))
+# Limites do modelo de embeddings
+EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", "16"))
+EMBED_REQUESTS_PER_MINUTE = int(os.getenv("EMBED_REQUESTS_PER_MINUTE", "1500"))
+EMBED_TOKENS_PER_MINUTE = int(os.getenv("EMBED_TOKENS_PER_MINUTE", "1000000"))
+# Tempo máximo esperando vaga antes de desistir (o chamador cai no fallback)
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+
+# Menor número = atendido primeiro. DMs do WhatsApp passam na frente de comentários.
+PRIORITIES = {
+    "whatsapp": 0,
+    "instagram": 1,
+    "instagram_dm": 1,
+    "instagram_comment": 2,
+    "background": 3,
+}
+DEFAULT_PRIORITY = 1
+
+
+class TokenBucket:
+    """Balde de fichas: 'capacity' fichas no máximo, repostas a 'rate' por segundo."""
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Segundos até haver 'amount' fichas (0 se já houver)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def take(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+class _Waiter:
+    def __init__(self, priority: int, tokens: int, future: asyncio.Future):
+        self.priority = priority
+        self.tokens = tokens
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class _ModelLane:
+    """Estado de um modelo: chamadas em andamento, baldes e fila de espera por prioridade."""
+    def __init__(self, name: str, max_concurrency: int, requests_per_minute: int, tokens_per_minute: int):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.in_flight = 0
+        self.queue: List[Tuple[int, int, _Waiter]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.granted = 0
+        self.timeouts = 0
+        self.throttled = 0
+        # Esperas recentes (ms) por classe de prioridade
+        self.waits: Dict[str, deque] = {}
+
+
+class LLMGateway:
+    """
+    Ponto único de passagem para chamadas ao Gemini (chat, embeddings, áudio).
+
+    Cada modelo tem um limite de chamadas simultâneas e dois baldes de fichas
+    (requisições por minuto e tokens estimados por minuto). Quem não consegue
+    vaga espera numa fila de prioridade: WhatsApp antes de Instagram DM, que
+    vem antes de comentário e de tarefas de background. Dentro da mesma
+    prioridade, a ordem é de chegada. Em vez de estourar a cota num pico e
+    devolver erro para todo mundo, as chamadas esperam a vez.
+    """
+    def __init__(self, queue_timeout: float = LLM_QUEUE_TIMEOUT):
+        self.queue_timeout = queue_timeout
+        self._lanes: Dict[str, _ModelLane] = {}
+        self._seq = itertools.count()
+
+    def configure(self, model: str, max_concurrency: int, requests_per_minute: int, tokens_per_minute: int):
+        self._lanes[model] = _ModelLane(model, max_concurrency, requests_per_minute, tokens_per_minute)
+
+    def _lane(self, model: str) -> _ModelLane:
+        lane = self._lanes.get(model)
+        if lane is None:
+            if "embedding" in model:
+                self.configure(model, EMBED_MAX_CONCURRENCY, EMBED_REQUESTS_PER_MINUTE, EMBED_TOKENS_PER_MINUTE)
+            else:
+                self.configure(model, LLM_MAX_CONCURRENCY, LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE)
+            lane = self._lanes[model]
+        return lane
+
+    def _dispatch(self, lane: _ModelLane):
+        """Libera quem está na frente da fila enquanto houver vaga e fichas."""
+        lane.timer = None
+        while lane.queue and lane.in_flight < lane.max_concurrency:
+            _, _, waiter = lane.queue[0]
+            if waiter.future.done():
+                # Desistiu (timeout/cancelamento) enquanto esperava
+                heapq.heappop(lane.queue)
+                continue
+            delay = max(lane.requests.wait_time(1), lane.tokens.wait_time(waiter.tokens))
+            if delay > 0:
+                # Fila parada pelo rate limit: tenta de novo quando as fichas voltarem
+                lane.throttled += 1
+                lane.timer = asyncio.get_running_loop().call_later(delay, self._dispatch, lane)
+                return
+            heapq.heappop(lane.queue)
+            lane.requests.take(1)
+            lane.tokens.take(waiter.tokens)
+            lane.in_flight += 1
+            waiter.future.set_result(None)
+
+    def _record_wait(self, lane: _ModelLane, priority_name: str, waited_ms: float):
+        waits = lane.waits.setdefault(priority_name, deque(maxlen=500))
+        waits.append(waited_ms)
+
+    @asynccontextmanager
+    async def slot(self, model: str, priority: str = "instagram", tokens: int = 0):
+        """
+        Reserva uma vaga no modelo: async with llm_gateway.slot("gemini-2.0-flash", "whatsapp", 1200): ...
+        Levanta asyncio.TimeoutError se esperar mais que LLM_QUEUE_TIMEOUT.
+        """
+        lane = self._lane(model)
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(PRIORITIES.get(priority, DEFAULT_PRIORITY), max(0, int(tokens)), loop.create_future())
+        heapq.heappush(lane.queue, (waiter.priority, next(self._seq), waiter))
+        if lane.timer is None:
+            self._dispatch(lane)
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=self.queue_timeout)
+        except BaseException as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # A vaga foi concedida no mesmo instante do timeout/cancelamento: devolve
+                lane.in_flight -= 1
+            else:
+                waiter.future.cancel()
+            if lane.timer is None:
+                self._dispatch(lane)
+            if isinstance(e, asyncio.TimeoutError):
+                lane.timeouts += 1
+                print(f"LLM GATEWAY: Sem vaga em {model} após {self.queue_timeout}s (prioridade {priority}).")
+            raise
+
+        self._record_wait(lane, priority, (time.monotonic() - waiter.enqueued_at) * 1000)
+        lane.granted += 1
+        try:
+            yield
+        finally:
+            lane.in_flight -= 1
+            if lane.timer is None:
+                self._dispatch(lane)
+
+    async def run(self, model: str, priority: str, tokens: int, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Executa uma chamada assíncrona (ex: chain.ainvoke) dentro de uma vaga."""
+        async with self.slot(model, priority, tokens):
+            return await call()
+
+    async def run_sync(
+        self,
+        model: str,
+        priority: str,
+        tokens: int,
+        fn: Callable[..., Any],
+        *args,
+        executor: Optional[Executor] = None
+    ) -> Any:
+        """
+        Executa uma chamada bloqueante (SDK síncrono) numa thread, dentro de uma vaga.
+        Sem executor, usa o pool padrão do loop.
+        """
+        async with self.slot(model, priority, tokens):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, partial(fn, *args))
+
+    def stats(self) -> Dict[str, Any]:
+        models = {}
+        for name, lane in self._lanes.items():
+            waits = {}
+            for priority_name, samples in lane.waits.items():
+                ordered = sorted(samples)
+                waits[priority_name] = {
+                    "samples": len(ordered),
+                    "avg_ms": round(sum(ordered) / len(ordered), 1),
+                    "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+                    "max_ms": round(ordered[-1], 1),
+                }
+            models[name] = {
+                "in_flight": lane.in_flight,
+                "max_concurrency": lane.max_concurrency,
+                "queued": sum(1 for _, _, w in lane.queue if not w.future.done()),
+                "granted": lane.granted,
+                "timeouts": lane.timeouts,
+                "throttled": lane.throttled,
+                "request_tokens_left": round(lane.requests.tokens, 1),
+                "estimated_tokens_left": round(lane.tokens.tokens),
+                "queue_wait": waits,
+            }
+        return {"queue_timeout": self.queue_timeout, "models": models}
+
+
+# Instância global
+llm_gateway = LLMGateway()
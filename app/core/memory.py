@@ -0,0 +1,205 @@
+import os
+import re
+import time
+import unicodedata
+from collections import deque
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Iterable
+from dotenv import load_dotenv
+
+from app.core.text_utils import tokenize, normalize_text, fold_accents, estimate_tokens, truncate_to_tokens
+
+load_dotenv()
+
+# Quantos turnos recentes ficam literais no buffer circular
+MEMORY_MAX_TURNS = int(os.getenv("MEMORY_MAX_TURNS", "12"))
+# Quantos turnos antigos acumulamos antes de chamar o resumidor (amortiza o custo do LLM)
+MEMORY_SUMMARY_BATCH = int(os.getenv("MEMORY_SUMMARY_BATCH", "4"))
+MEMORY_SUMMARY_TOKENS = int(os.getenv("MEMORY_SUMMARY_TOKENS", "200"))
+
+ROLE_LABELS = {"user": "Cliente", "assistant": "Márcio"}
+
+_NUMBER_WORDS = {
+    "uma": 1, "um": 1, "duas": 2, "dois": 2, "tres": 3, "quatro": 4, "cinco": 5,
+    "seis": 6, "sete": 7, "oito": 8, "nove": 9, "dez": 10,
+}
+_NAME_RE = re.compile(
+    r"\b(?:meu nome e|me chamo|aqui e o|aqui e a|aqui quem fala e o|aqui quem fala e a)\s+([a-z]+(?: [a-z]+)?)"
+)
+_GROUP_RE = re.compile(
+    r"\b(?:somos(?:\s+em)?|para|pra)\s+(\d{1,2}|" + "|".join(_NUMBER_WORDS) + r")\s*(?:pessoas|adultos|passageiros|pessoa)?\b"
+)
+# Palavras que podem aparecer depois de "me chamo"/"meu nome é" mas não são nomes
+_NOT_NAMES = {"e", "sim", "nao", "oi", "ola", "bom", "boa", "que", "quero", "gostaria", "tudo"}
+# Palavras de título que não identificam destino
+_TITLE_STOPWORDS = {"pacote", "com", "dos", "das", "para", "por", "data", "hotel", "beira", "reveillon", "natal"}
+
+
+class Turn:
+    """Um turno da conversa (quem falou, o quê e quando)."""
+    def __init__(self, role: str, text: str, ts: Optional[float] = None):
+        self.role = role
+        self.text = text
+        self.ts = ts if ts is not None else time.time()
+
+    def render(self) -> str:
+        return f"{ROLE_LABELS.get(self.role, self.role)}: {self.text}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"role": self.role, "text": self.text, "ts": self.ts}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Turn":
+        return cls(data["role"], data["text"], data.get("ts"))
+
+
+def extract_facts(text: str, destinations: Iterable[Dict[str, Any]] = ()) -> Dict[str, Any]:
+    """
+    Extrai fatos simples de uma mensagem do cliente: nome, tamanho do grupo e
+    destino de interesse (comparando com os títulos do catálogo).
+    """
+    facts: Dict[str, Any] = {}
+    text = unicodedata.normalize("NFC", text or "")
+    # Sem colapsar espaços: com texto NFC, cada caractere continua na mesma posição
+    # depois de tirar os acentos, então o trecho do nome pode ser lido do original
+    folded = fold_accents(text).lower()
+    normalized = normalize_text(text)
+
+    name_match = _NAME_RE.search(folded)
+    if name_match:
+        words = []
+        for word in name_match.group(1).split(" "):
+            if word in _NOT_NAMES:
+                break
+            words.append(word)
+        if words:
+            start = name_match.start(1)
+            end = start + len(" ".join(words))
+            name = text[start:end] if len(folded) == len(text) else " ".join(words)
+            facts["name"] = name.title()
+
+    group_match = _GROUP_RE.search(normalized)
+    if group_match and re.search(r"pessoa|adulto|passageiro|somos", group_match.group(0)):
+        raw = group_match.group(1)
+        size = int(raw) if raw.isdigit() else _NUMBER_WORDS.get(raw)
+        if size and 0 < size <= 60:
+            facts["group_size"] = size
+
+    words = set(tokenize(text))
+    best_title, best_overlap = None, 0
+    for destination in destinations:
+        overlap = len(destination["tokens"] & words)
+        if overlap > best_overlap:
+            best_title, best_overlap = destination["title"], overlap
+    if best_title:
+        facts["destination"] = best_title
+
+    return facts
+
+
+def build_destination_index(catalog: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Pré-calcula os tokens significativos dos títulos do catálogo para extract_facts."""
+    index = []
+    for item in catalog:
+        title = item.get("title", "")
+        tokens = {t for t in tokenize(title) if len(t) > 3 and t not in _TITLE_STOPWORDS}
+        if tokens:
+            index.append({"title": title, "tokens": tokens})
+    return index
+
+
+class ConversationMemory:
+    """
+    Memória estruturada de um cliente:
+      - buffer circular com os últimos MEMORY_MAX_TURNS turnos literais;
+      - resumo contínuo dos turnos mais antigos (gerado em background);
+      - fatos extraídos (nome, destino de interesse, tamanho do grupo).
+
+    render() monta o histórico dentro de um orçamento de tokens, sempre com
+    turnos inteiros, em vez de cortar a string no meio de uma frase.
+    """
+    def __init__(self, max_turns: int = MEMORY_MAX_TURNS):
+        self.turns: deque = deque(maxlen=max_turns)
+        self.overflow: List[Turn] = []
+        self.summary = ""
+        self.facts: Dict[str, Any] = {}
+        self._summarizing = False
+
+    def is_empty(self) -> bool:
+        return not self.turns and not self.overflow and not self.summary
+
+    def add_turn(self, role: str, text: str):
+        if len(self.turns) == self.turns.maxlen:
+            # O turno mais antigo sai do buffer e aguarda o próximo resumo
+            self.overflow.append(self.turns[0])
+        self.turns.append(Turn(role, text))
+
+    def update_facts(self, user_text: str, destinations: Iterable[Dict[str, Any]] = ()):
+        self.facts.update(extract_facts(user_text, destinations))
+
+    def needs_summary(self) -> bool:
+        return len(self.overflow) >= MEMORY_SUMMARY_BATCH and not self._summarizing
+
+    async def summarize(self, summarizer: Callable[[str, str], Awaitable[str]]):
+        """
+        Incorpora os turnos antigos ao resumo usando o LLM. Em caso de erro,
+        cai para um resumo extrativo (texto cortado) para não perder o contexto.
+        """
+        if self._summarizing or not self.overflow:
+            return
+        self._summarizing = True
+        batch = list(self.overflow)
+        old_turns = "\n".join(turn.render() for turn in batch)
+        try:
+            new_summary = await summarizer(self.summary, old_turns)
+        except Exception as e:
+            print(f"MEMÓRIA: Falha no resumo via LLM ({e}). Usando resumo extrativo.")
+            new_summary = f"{self.summary}\n{old_turns}".strip()
+        finally:
+            self._summarizing = False
+
+        self.summary = truncate_to_tokens(new_summary.strip(), MEMORY_SUMMARY_TOKENS)
+        # Turnos que chegaram durante o resumo continuam no overflow
+        self.overflow = self.overflow[len(batch):]
+
+    def render(self, token_budget: int) -> str:
+        """Histórico para o prompt: fatos + resumo + turnos recentes que couberem."""
+        header = ""
+        if self.facts:
+            labels = {"name": "Nome", "destination": "Destino de interesse", "group_size": "Pessoas"}
+            parts = [f"{labels[key]}: {value}" for key, value in self.facts.items() if key in labels]
+            header += "FATOS DO CLIENTE: " + " | ".join(parts) + "\n"
+        if self.summary:
+            header += f"RESUMO DA CONVERSA ANTERIOR: {self.summary}\n"
+
+        remaining = token_budget - estimate_tokens(header)
+        lines: List[str] = []
+        for turn in reversed(self.overflow + list(self.turns)):
+            line = turn.render()
+            cost = estimate_tokens(line + "\n")
+            if cost > remaining:
+                if not lines and remaining > 0:
+                    # Nem o turno mais recente cabe inteiro: fica com o começo dele
+                    lines.append(truncate_to_tokens(line, remaining))
+                break
+            lines.append(line)
+            remaining -= cost
+
+        body = "\n".join(reversed(lines))
+        return f"{header}{body}\n" if body else header
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "turns": [turn.to_dict() for turn in self.turns],
+            "overflow": [turn.to_dict() for turn in self.overflow],
+            "summary": self.summary,
+            "facts": self.facts,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], max_turns: int = MEMORY_MAX_TURNS) -> "ConversationMemory":
+        memory = cls(max_turns)
+        memory.turns.extend(Turn.from_dict(t) for t in data.get("turns", []))
+        memory.overflow = [Turn.from_dict(t) for t in data.get("overflow", [])]
+        memory.summary = data.get("summary", "")
+        memory.facts = data.get("facts", {})
+        return memory
@@ -0,0 +1,213 @@
+import os
+from typing import Dict, Any, List
+from dotenv import load_dotenv
+
+from app.core.text_utils import tokenize, estimate_tokens, truncate_to_tokens
+from app.services.catalog_index import PASSAGE_LABELS
+
+load_dotenv()
+
+# Orçamento (em tokens estimados) de cada seção variável do prompt
+PROMPT_BUDGET_CATALOG = int(os.getenv("PROMPT_BUDGET_CATALOG", "250"))
+PROMPT_BUDGET_RAG = int(os.getenv("PROMPT_BUDGET_RAG", "600"))
+PROMPT_BUDGET_HISTORY = int(os.getenv("PROMPT_BUDGET_HISTORY", "500"))
+
+NO_RAG_CONTEXT = "Nenhuma informação específica encontrada no banco de dados para esta pergunta."
+
+
+class PromptAssembler:
+    """
+    Monta as seções variáveis do prompt (resumo do catálogo, contexto do RAG e
+    histórico) respeitando um orçamento de tokens por seção.
+
+    - Catálogo: linhas "- PACOTE: preço" ranqueadas pela sobreposição com a
+      pergunta; pacotes já presentes no RAG não se repetem.
+    - RAG: título, preço, link e as outras datas da mesma viagem sempre
+      entram; depois, os trechos que a busca achou (dia do roteiro,
+      inclusões, embarques...) ou, sem trechos, descrição e inclusões,
+      cortados para caber na fatia de cada item.
+    - Histórico: mantém as linhas mais recentes inteiras.
+
+    Também contabiliza quantos tokens economizamos em relação ao prompt antigo
+    (catálogo inteiro + RAG sem corte + histórico inteiro).
+    """
+    def __init__(
+        self,
+        catalog_budget: int = PROMPT_BUDGET_CATALOG,
+        rag_budget: int = PROMPT_BUDGET_RAG,
+        history_budget: int = PROMPT_BUDGET_HISTORY
+    ):
+        self.catalog_budget = catalog_budget
+        self.rag_budget = rag_budget
+        self.history_budget = history_budget
+        self._catalog_lines: List[Dict[str, Any]] = []
+        self._full_catalog_tokens = 0
+        self.prompts_built = 0
+        self.tokens_used = 0
+        self.tokens_saved = 0
+
+    def set_catalog(self, catalog: List[Dict[str, Any]]):
+        """Pré-calcula as linhas do resumo do catálogo (uma por título/preço distinto)."""
+        lines = []
+        seen = set()
+        full_summary = ""
+        for item in catalog:
+            line = f"- {item.get('title', 'Pacote')}: {item.get('price', 'Sob consulta')}"
+            full_summary += line + "\n"
+            if line in seen:
+                continue
+            seen.add(line)
+            lines.append({
+                "line": line,
+                "url": item.get('url'),
+                "tokens": set(tokenize(item.get('title', ''))),
+                "cost": estimate_tokens(line + "\n")
+            })
+        self._catalog_lines = lines
+        self._full_catalog_tokens = estimate_tokens(full_summary)
+
+    def build_catalog_digest(self, user_text: str, history: str, exclude_urls: set) -> str:
+        query_tokens = {t for t in tokenize(f"{user_text} {history[-300:]}") if len(t) > 2}
+        ranked = sorted(
+            enumerate(self._catalog_lines),
+            key=lambda pair: (-len(pair[1]["tokens"] & query_tokens), pair[0])
+        )
+
+        used = 0
+        chosen = []
+        for position, entry in ranked:
+            if entry["url"] in exclude_urls:
+                continue
+            if used + entry["cost"] > self.catalog_budget:
+                continue
+            chosen.append((position, entry["line"]))
+            used += entry["cost"]
+
+        if not chosen:
+            return "Resumo do catálogo indisponível no momento."
+
+        # Mantém a ordem original do catálogo para o modelo
+        digest = "\n".join(line for _, line in sorted(chosen))
+        omitted = len(self._catalog_lines) - len(chosen)
+        if omitted > 0:
+            digest += f"\n(+{omitted} outros pacotes; consulte o RAG antes de afirmar que não temos algo)"
+        return digest
+
+    def build_rag_context(self, rag_results: List[Dict[str, Any]]) -> str:
+        if not rag_results:
+            return NO_RAG_CONTEXT
+
+        per_item = self.rag_budget // len(rag_results)
+        context_str = "--- DADOS ENCONTRADOS NO SISTEMA ---\n"
+        for res in rag_results:
+            item = res['item']
+            if res.get('closed'):
+                # Viagem que já saiu: sem preço e sem link, para o modelo não vender
+                header = (
+                    f"- PACOTE: {item.get('title')}\n"
+                    f"  SITUAÇÃO: ENCERRADA (todas as saídas já passaram; não ofereça, sugira outra viagem)\n"
+                )
+            else:
+                header = (
+                    f"- PACOTE: {item.get('title')}\n"
+                    f"  PREÇO: {item.get('price')}\n"
+                    f"  LINK PAGAMENTO/DETALHES: {item.get('url', 'N/A')}\n"
+                )
+            if res.get('dates'):
+                header += f"  SAÍDAS DISPONÍVEIS: {self._format_dates(res['dates'])}\n"
+            remaining = max(0, per_item - estimate_tokens(header))
+            context_str += header
+            passages = res.get('passages')
+            if passages:
+                # Só os trechos relevantes, dividindo a sobra da fatia entre eles
+                share = remaining // len(passages)
+                for passage in passages:
+                    label = PASSAGE_LABELS.get(passage['kind'], passage['kind']).upper()
+                    text = truncate_to_tokens(passage['text'], share).replace("\n", "\n    ")
+                    if text:
+                        context_str += f"  {label}: {text}\n"
+                continue
+            # Sobra da fatia do item é dividida entre descrição (60%) e inclusões (40%)
+            description = truncate_to_tokens(item.get('description', ''), int(remaining * 0.6))
+            inclusions = truncate_to_tokens(item.get('inclusoes', 'Consultar'), remaining - estimate_tokens(description))
+            if description:
+                context_str += f"  DESCRIÇÃO: {description}\n"
+            if inclusions:
+                context_str += f"  INCLUSO: {inclusions}\n"
+        context_str += "--- FIM DOS DADOS ---"
+        return context_str
+
+    @staticmethod
+    def _format_dates(dates: List[Dict[str, Any]]) -> str:
+        """Saídas da mesma viagem numa linha; o preço só aparece se mudar entre as datas."""
+        same_price = len({d.get('price') for d in dates}) == 1
+        return ", ".join(
+            (d.get('date') or "data a confirmar") + ("" if same_price else f" ({d.get('price')})")
+            for d in dates
+        )
+
+    def build_history(self, history: str) -> str:
+        if estimate_tokens(history) <= self.history_budget:
+            return history
+
+        kept = []
+        used = 0
+        for line in reversed(history.splitlines()):
+            cost = estimate_tokens(line + "\n")
+            if used + cost > self.history_budget:
+                if not kept:
+                    # A última linha sozinha já estoura: fica com o final dela
+                    kept.append("..." + line[-self.history_budget * 4:])
+                break
+            kept.append(line)
+            used += cost
+        return "\n".join(reversed(kept)) + "\n"
+
+    def build(self, user_text: str, rag_results: List[Dict[str, Any]], history: str) -> Dict[str, str]:
+        """Retorna as seções 'catalog_summary', 'rag_context' e 'history' dentro do orçamento."""
+        rag_urls = {res['item'].get('url') for res in rag_results}
+        sections = {
+            "catalog_summary": self.build_catalog_digest(user_text, history, rag_urls),
+            "rag_context": self.build_rag_context(rag_results),
+            "history": self.build_history(history),
+        }
+
+        used = sum(estimate_tokens(text) for text in sections.values())
+        baseline = self._full_catalog_tokens + self._legacy_rag_tokens(rag_results) + estimate_tokens(history)
+        saved = max(0, baseline - used)
+        self.prompts_built += 1
+        self.tokens_used += used
+        self.tokens_saved += saved
+        print(f"🧮 Prompt: ~{used} tokens nas seções variáveis (economia de ~{saved}).")
+        return sections
+
+    @staticmethod
+    def _legacy_rag_tokens(rag_results: List[Dict[str, Any]]) -> int:
+        # Tamanho que o contexto do RAG teria no formato antigo (500 chars de descrição +
+        # inclusões inteiras). Os +40 por item cobrem rótulos e a indentação do bloco antigo.
+        if not rag_results:
+            return estimate_tokens(NO_RAG_CONTEXT)
+        total = 0
+        for res in rag_results:
+            item = res['item']
+            total += estimate_tokens(
+                f"{item.get('title')}{item.get('price')}{item.get('description', '')[:500]}"
+                f"{item.get('inclusoes', 'Consultar')}{item.get('url', 'N/A')}"
+            ) + 40
+        return total
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "prompts_built": self.prompts_built,
+            "avg_section_tokens": round(self.tokens_used / self.prompts_built, 1) if self.prompts_built else 0.0,
+            "tokens_saved": self.tokens_saved,
+            "budgets": {
+                "catalog": self.catalog_budget,
+                "rag": self.rag_budget,
+                "history": self.history_budget,
+            },
+        }
+
+
+# Instância global
+prompt_assembler = PromptAssembler()
@@ -0,0 +1,87 @@
+import os
+import asyncio
+from typing import Dict, Any, Callable, Awaitable, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Tempo (s) que uma caixa de mensagens ociosa fica viva antes de ser descartada
+MAILBOX_IDLE_SECONDS = float(os.getenv("MAILBOX_IDLE_SECONDS", "60"))
+
+
+class _Mailbox:
+    """Fila FIFO de jobs de um único usuário, drenada por uma única task."""
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.task: Optional[asyncio.Task] = None
+        self.processed = 0
+
+
+class UserMailboxScheduler:
+    """
+    Escalonador no modelo de atores: cada usuário ativo ganha uma caixa de
+    mensagens processada estritamente em ordem (FIFO), enquanto usuários
+    diferentes rodam totalmente em paralelo. Caixas ociosas são removidas
+    depois de MAILBOX_IDLE_SECONDS, então a memória acompanha só quem está
+    conversando agora.
+    """
+    def __init__(self, idle_timeout: float = MAILBOX_IDLE_SECONDS):
+        self.idle_timeout = idle_timeout
+        self._mailboxes: Dict[str, _Mailbox] = {}
+
+    def submit(self, user_key: str, job: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        """
+        Enfileira um job na caixa do usuário e retorna um Future com o resultado.
+        A ordem de chamada de submit() é a ordem de execução para o mesmo usuário.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        mailbox = self._mailboxes.get(user_key)
+        if mailbox is None:
+            mailbox = _Mailbox()
+            self._mailboxes[user_key] = mailbox
+            mailbox.task = asyncio.create_task(self._drain(user_key, mailbox))
+
+        mailbox.queue.put_nowait((job, future))
+        return future
+
+    async def _drain(self, user_key: str, mailbox: _Mailbox):
+        while True:
+            try:
+                job, future = await asyncio.wait_for(mailbox.queue.get(), timeout=self.idle_timeout)
+            except asyncio.TimeoutError:
+                # Não há await entre a checagem e a remoção, então nenhum submit
+                # pode entrar nessa caixa depois de decidirmos descartá-la.
+                if mailbox.queue.empty():
+                    if self._mailboxes.get(user_key) is mailbox:
+                        del self._mailboxes[user_key]
+                    return
+                continue
+
+            if future.cancelled():
+                continue
+            try:
+                result = await job()
+                if not future.done():
+                    future.set_result(result)
+            except asyncio.CancelledError:
+                if not future.done():
+                    future.cancel()
+                raise
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                mailbox.processed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Caixas ativas e quantidade de jobs pendentes em cada uma."""
+        return {
+            "active_mailboxes": len(self._mailboxes),
+            "pending": {key: mb.queue.qsize() for key, mb in self._mailboxes.items() if mb.queue.qsize()},
+        }
+
+
+# Instância global
+scheduler = UserMailboxScheduler()
@@ -0,0 +1,262 @@
+import os
+import time
+import asyncio
+from collections import deque
+from typing import Dict, Any, Callable, Optional, Tuple, AsyncIterator
+from dotenv import load_dotenv
+
+from app.core.llm_gateway import llm_gateway, LLMGateway
+
+load_dotenv()
+
+# Prazo total (s) da chamada ao modelo principal, contando a espera no gateway
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "12"))
+# Prazo do modelo secundário depois que o principal estourou/falhou
+LLM_FALLBACK_DEADLINE_SECONDS = float(os.getenv("LLM_FALLBACK_DEADLINE_SECONDS", "6"))
+LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL", "gemini-1.5-flash")
+# Hedging: repete a chamada se ela passar do p95 observado; vale a que chegar primeiro
+LLM_HEDGING = os.getenv("LLM_HEDGING", "true").lower() not in ("0", "false", "no")
+# Amostras mínimas antes de confiar no p95, e atraso mínimo do hedge (s)
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1.0"))
+
+# "stalled": streaming que travou no meio (resposta cortada)
+OUTCOMES = ("primary", "hedge", "fallback_model", "canned", "stalled")
+
+
+def percentile(samples, fraction: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class SLOGuard:
+    """
+    Protege o tempo de resposta das chamadas ao LLM:
+
+    1. Chama o modelo principal com prazo (LLM_DEADLINE_SECONDS).
+    2. Se a chamada passar do p95 recente sem responder, dispara uma cópia
+       (hedge); a primeira que responder vence e a outra é cancelada.
+    3. Se o prazo estourar ou as chamadas falharem, tenta o modelo secundário
+       com um prazo próprio.
+    4. Se ele também não responder, usa a resposta pronta (montada a partir do
+       catálogo pelo chamador).
+
+    Cada desfecho é registrado com a latência, para ajustar prazos e hedge.
+    """
+    def __init__(
+        self,
+        primary_model: str,
+        primary_chain: Any,
+        fallback_model: Optional[str] = LLM_FALLBACK_MODEL,
+        fallback_chain: Any = None,
+        deadline: float = LLM_DEADLINE_SECONDS,
+        fallback_deadline: float = LLM_FALLBACK_DEADLINE_SECONDS,
+        hedging: bool = LLM_HEDGING,
+        gateway: LLMGateway = llm_gateway
+    ):
+        self.primary_model = primary_model
+        self.primary_chain = primary_chain
+        self.fallback_model = fallback_model
+        self.fallback_chain = fallback_chain
+        self.deadline = deadline
+        self.fallback_deadline = fallback_deadline
+        self.hedging = hedging
+        self.gateway = gateway
+        # Latências recentes do modelo principal (s); estouros entram como o próprio prazo
+        self.primary_latencies: deque = deque(maxlen=500)
+        # Tempo até o primeiro pedaço no modo streaming (separado: não é latência total)
+        self.first_chunk_latencies: deque = deque(maxlen=500)
+        self.outcomes: Dict[str, int] = {name: 0 for name in OUTCOMES}
+        self.outcome_latencies: Dict[str, deque] = {name: deque(maxlen=500) for name in OUTCOMES}
+        self.hedges_sent = 0
+        self.deadline_misses = 0
+        self.primary_errors = 0
+        self.fallback_errors = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """Quando disparar a cópia: p95 das chamadas recentes (None = sem hedge)."""
+        if not self.hedging or len(self.primary_latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return max(LLM_HEDGE_MIN_DELAY, percentile(self.primary_latencies, 0.95))
+
+    async def _call(self, model: str, chain: Any, inputs: Dict[str, Any], channel: str, tokens: int) -> str:
+        return await self.gateway.run(model, channel, tokens, lambda: chain.ainvoke(inputs))
+
+    def _record(self, outcome: str, started: float):
+        self.outcomes[outcome] += 1
+        self.outcome_latencies[outcome].append(time.monotonic() - started)
+
+    async def _call_primary(self, inputs: Dict[str, Any], channel: str, tokens: int) -> Tuple[Optional[str], str]:
+        """Principal + hedge dentro do prazo. Retorna (texto, desfecho) ou (None, '')."""
+        started = time.monotonic()
+        deadline_at = started + self.deadline
+        hedge_delay = self.hedge_delay()
+        first = asyncio.create_task(self._call(self.primary_model, self.primary_chain, inputs, channel, tokens))
+        labels = {first: "primary"}
+        pending = {first}
+        try:
+            while pending:
+                now = time.monotonic()
+                wake_at = deadline_at
+                if hedge_delay is not None and len(labels) == 1:
+                    wake_at = min(wake_at, started + hedge_delay)
+                done, pending = await asyncio.wait(pending, timeout=max(0.0, wake_at - now), return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    if task.exception() is None:
+                        self.primary_latencies.append(time.monotonic() - started)
+                        return task.result(), labels[task]
+                    self.primary_errors += 1
+                    print(f"SLO: Falha no {self.primary_model} ({labels[task]}): {task.exception()}")
+
+                if done:
+                    continue
+                if time.monotonic() >= deadline_at:
+                    break
+                # Passou do p95 sem resposta: manda a cópia
+                hedge = asyncio.create_task(self._call(self.primary_model, self.primary_chain, inputs, channel, tokens))
+                labels[hedge] = "hedge"
+                pending.add(hedge)
+                self.hedges_sent += 1
+                print(f"SLO: {self.primary_model} passou de {hedge_delay:.1f}s. Hedge disparado.")
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if time.monotonic() >= deadline_at:
+            self.deadline_misses += 1
+            self.primary_latencies.append(self.deadline)
+            print(f"SLO: {self.primary_model} estourou o prazo de {self.deadline:.1f}s.")
+        return None, ""
+
+    async def invoke(
+        self,
+        inputs: Dict[str, Any],
+        channel: str,
+        tokens: int,
+        canned: Callable[[], str]
+    ) -> Tuple[str, str]:
+        """
+        Gera a resposta respeitando o prazo. Retorna (texto, desfecho), onde
+        desfecho é 'primary', 'hedge', 'fallback_model' ou 'canned'.
+        """
+        started = time.monotonic()
+        text, outcome = await self._call_primary(inputs, channel, tokens)
+        if text is not None:
+            self._record(outcome, started)
+            return text, outcome
+        return await self._fallback(inputs, channel, tokens, canned, started)
+
+    async def _fallback(
+        self,
+        inputs: Dict[str, Any],
+        channel: str,
+        tokens: int,
+        canned: Callable[[], str],
+        started: float
+    ) -> Tuple[str, str]:
+        """Modelo secundário com prazo próprio; se falhar, a resposta pronta."""
+        if self.fallback_chain is not None:
+            try:
+                text = await asyncio.wait_for(
+                    self._call(self.fallback_model, self.fallback_chain, inputs, channel, tokens),
+                    timeout=self.fallback_deadline
+                )
+                print(f"SLO: Resposta veio do modelo secundário ({self.fallback_model}).")
+                self._record("fallback_model", started)
+                return text, "fallback_model"
+            except Exception as e:
+                self.fallback_errors += 1
+                print(f"SLO: Modelo secundário também falhou ({e or type(e).__name__}).")
+
+        self._record("canned", started)
+        return canned(), "canned"
+
+    async def _stream_primary(self, inputs: Dict[str, Any], channel: str, tokens: int) -> AsyncIterator[str]:
+        # A vaga do gateway fica ocupada enquanto o stream estiver aberto
+        async with self.gateway.slot(self.primary_model, channel, tokens):
+            async for chunk in self.primary_chain.astream(inputs):
+                yield chunk
+
+    async def stream(
+        self,
+        inputs: Dict[str, Any],
+        channel: str,
+        tokens: int,
+        canned: Callable[[], str],
+        stalled: Optional[Callable[[], None]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Versão em streaming. O prazo vale até o primeiro pedaço e, depois, como
+        limite de travamento entre pedaços. Não há hedge (o cliente já estaria
+        recebendo a primeira resposta); se nada chegar no prazo, a resposta do
+        fallback vem inteira num único pedaço. Se travar depois do primeiro
+        pedaço, o stream termina cortado, o desfecho é 'stalled' e stalled() é
+        chamado para quem usa a resposta saber que ela está incompleta.
+        """
+        started = time.monotonic()
+        chunks = self._stream_primary(inputs, channel, tokens)
+        try:
+            try:
+                first = await asyncio.wait_for(chunks.__anext__(), timeout=self.deadline)
+            except asyncio.TimeoutError:
+                self.deadline_misses += 1
+                print(f"SLO: {self.primary_model} não começou a responder em {self.deadline:.1f}s.")
+                first = None
+            except StopAsyncIteration:
+                first = None
+            except Exception as e:
+                self.primary_errors += 1
+                print(f"SLO: Falha no stream do {self.primary_model}: {e}")
+                first = None
+
+            if first is None:
+                text, _ = await self._fallback(inputs, channel, tokens, canned, started)
+                yield text
+                return
+
+            self.first_chunk_latencies.append(time.monotonic() - started)
+            yield first
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=self.deadline)
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    self.deadline_misses += 1
+                    print(f"SLO: Stream do {self.primary_model} travou por {self.deadline:.1f}s. Encerrando.")
+                    self._record("stalled", started)
+                    if stalled is not None:
+                        stalled()
+                    return
+                yield chunk
+            self._record("primary", started)
+        finally:
+            await chunks.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        total = sum(self.outcomes.values())
+        latencies = {}
+        for name, samples in self.outcome_latencies.items():
+            if samples:
+                latencies[name] = {
+                    "p50_s": round(percentile(samples, 0.5), 3),
+                    "p95_s": round(percentile(samples, 0.95), 3),
+                }
+        primary_p95 = percentile(self.primary_latencies, 0.95)
+        return {
+            "total": total,
+            "outcomes": dict(self.outcomes),
+            "outcome_latency": latencies,
+            "primary_p95_s": round(primary_p95, 3) if primary_p95 is not None else None,
+            "first_chunk_p95_s": round(percentile(self.first_chunk_latencies, 0.95), 3) if self.first_chunk_latencies else None,
+            "hedge_delay_s": self.hedge_delay(),
+            "hedges_sent": self.hedges_sent,
+            "deadline_misses": self.deadline_misses,
+            "primary_errors": self.primary_errors,
+            "fallback_errors": self.fallback_errors,
+            "deadline_s": self.deadline,
+            "fallback_deadline_s": self.fallback_deadline,
+        }
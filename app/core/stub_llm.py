@@ -0,0 +1,63 @@
+import math
+import random
+import asyncio
+from typing import Dict, Any, AsyncIterator, Optional
+
+
+class LatencyDistribution:
+    """
+    Distribuição de latência (s) descrita em texto, para simular o Gemini offline:
+      - "fixed:0.8"
+      - "uniform:0.5,2.0"
+      - "lognormal:1.2,0.5"   (mediana, sigma: cauda longa realista)
+      - "bimodal:0.8,15,0.05" (rápida, lenta, probabilidade da lenta)
+    """
+    def __init__(self, spec: str, rng: Optional[random.Random] = None):
+        self.spec = spec
+        self.rng = rng or random.Random()
+        kind, _, raw = spec.partition(":")
+        self.kind = kind.strip().lower()
+        self.params = [float(p) for p in raw.split(",") if p.strip()]
+        expected = {"fixed": 1, "uniform": 2, "lognormal": 2, "bimodal": 3}
+        if self.kind not in expected or len(self.params) != expected[self.kind]:
+            raise ValueError(f"Distribuição de latência inválida: '{spec}'")
+
+    def sample(self) -> float:
+        p = self.params
+        if self.kind == "fixed":
+            return p[0]
+        if self.kind == "uniform":
+            return self.rng.uniform(p[0], p[1])
+        if self.kind == "lognormal":
+            return self.rng.lognormvariate(math.log(p[0]), p[1])
+        return p[1] if self.rng.random() < p[2] else p[0]
+
+
+class StubChain:
+    """
+    Substituto da chain do LangChain (ainvoke/astream) com latência e taxa de
+    erro configuráveis. Responde com um texto fixo que cita a pergunta.
+    """
+    def __init__(self, latency: str = "fixed:0.5", failure_rate: float = 0.0, seed: Optional[int] = None, name: str = "stub"):
+        self.rng = random.Random(seed)
+        self.latency = LatencyDistribution(latency, self.rng)
+        self.failure_rate = failure_rate
+        self.name = name
+        self.calls = 0
+
+    def _reply(self, inputs: Dict[str, Any]) -> str:
+        question = str(inputs.get("user_text", "")).strip()[:80]
+        return f"[{self.name}] Resposta simulada para: {question}|||Posso ajudar em mais alguma coisa?"
+
+    async def ainvoke(self, inputs: Dict[str, Any]) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.latency.sample())
+        if self.rng.random() < self.failure_rate:
+            raise RuntimeError(f"{self.name}: falha simulada")
+        return self._reply(inputs)
+
+    async def astream(self, inputs: Dict[str, Any]) -> AsyncIterator[str]:
+        text = await self.ainvoke(inputs)
+        for start in range(0, len(text), 12):
+            yield text[start:start + 12]
+            await asyncio.sleep(0)
@@ -0,0 +1,45 @@
+import re
+import unicodedata
+from typing import List
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def fold_accents(text: str) -> str:
+    """Remove acentos e cedilha ("Réveillon" -> "Reveillon")."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def normalize_text(text: str) -> str:
+    """Minúsculas, sem acentos e com espaços colapsados."""
+    return " ".join(fold_accents(text or "").lower().split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Quebra o texto normalizado em palavras alfanuméricas."""
+    return _WORD_RE.findall(normalize_text(text))
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimativa barata de tokens do Gemini (~4 caracteres por token em português).
+    Boa o suficiente para orçamento de prompt sem chamar o tokenizer remoto.
+    """
+    if not text:
+        return 0
+    return max(1, len(text) // 4)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Corta o texto no limite de tokens, preferindo terminar em fim de palavra."""
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    if max_chars <= 0:
+        return ""
+    cut = text[:max_chars]
+    last_space = cut.rfind(" ")
+    if last_space > max_chars // 2:
+        cut = cut[:last_space]
+    return cut.rstrip(" ,.;:-") + "..."
@@ -1,13 +1,25 @@
 from fastapi import APIRouter, HTTPException, Depends, Request
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
-from app.core.brain import MEMORY
+from app.core.brain import MEMORY, slo_guard
+from app.routes.webhook import ingress_pool
+from app.core.scheduler import scheduler
+from app.core.coalescer import coalescer
+from app.services.dedup_store import dedup_store
+from app.services.semantic_cache import semantic_cache
+from app.services.embedding_cache import all_embedding_cache_stats
+from app.services.index_reloader import index_reloader
+from app.services.rag_service import rag_service
+from app.core.prompt_builder import prompt_assembler
+from app.core.fast_path import fast_path_router
+from app.core.llm_gateway import llm_gateway
+from app.services.session_store import session_store, SessionMap
 import os
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
-# Simple in-memory pause state (in production, use Redis/Database)
-PAUSED_USERS = set()
+# Pausas compartilhadas entre os workers pelo session store (gravadas no disco na hora)
+PAUSED_USERS = SessionMap(session_store, "paused", durable=True)
 
 # Setup templates (we'll create a simple HTML string for now to avoid complexity)
 def get_admin_html():
@@ -87,13 +99,41 @@ async def list_users():
             })
     return users_list
 
+@router.get("/api/queue")
+async def queue_stats():
+    return {
+        **ingress_pool.stats(),
+        "mailboxes": scheduler.stats(),
+        "coalescer": coalescer.stats(),
+        "dedup": dedup_store.stats(),
+        "llm_gateway": llm_gateway.stats(),
+    }
+
+@router.get("/api/metrics")
+async def metrics():
+    return {
+        "semantic_cache": semantic_cache.stats(),
+        "embedding_cache": all_embedding_cache_stats(),
+        "prompt": prompt_assembler.stats(),
+        "fast_path": fast_path_router.stats(),
+        "llm_slo": slo_guard.stats(),
+        "session_store": session_store.stats(),
+        "index": index_reloader.stats(),
+        "rag": rag_service.stats(),
+    }
+
+@router.post("/api/reload")
+async def reload_index():
+    """Carrega a versão ativa do índice e do catálogo sem reiniciar."""
+    return await index_reloader.reload("admin")
+
 @router.post("/api/pause")
 async def toggle_pause(user_id: str, pause: bool):
     if pause:
-        PAUSED_USERS.add(user_id)
+        PAUSED_USERS[user_id] = True
     else:
         if user_id in PAUSED_USERS:
-            PAUSED_USERS.remove(user_id)
+            del PAUSED_USERS[user_id]
     return {"status": "ok", "user_id": user_id, "paused": pause}
 
 def is_user_paused(user_id: str) -> bool:
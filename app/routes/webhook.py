@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Request, HTTPException, Query, BackgroundTasks
+from fastapi import APIRouter, Request, HTTPException, Query
 from fastapi.responses import PlainTextResponse
 import os
+import json
 from dotenv import load_dotenv
 from app.services.meta_handler import handle_whatsapp_event, handle_instagram_event
+from app.services.ingress_queue import ingress_queue, IngressWorkerPool
 
 load_dotenv()
 
@@ -10,6 +12,15 @@ router = APIRouter()
 
 VERIFY_TOKEN = os.getenv("WEBHOOK_VERIFY_TOKEN")
 
+# Tipos de objeto da Meta -> handler que processa o payload
+EVENT_HANDLERS = {
+    "whatsapp_business_account": handle_whatsapp_event,
+    "instagram": handle_instagram_event,
+}
+
+# Pool que drena a fila persistente (iniciado no lifespan do app em main.py)
+ingress_pool = IngressWorkerPool(ingress_queue, EVENT_HANDLERS)
+
 @router.get("/webhook")
 async def verify_webhook(
     mode: str = Query(..., alias="hub.mode"),
@@ -27,20 +38,19 @@ async def verify_webhook(
 
 
 @router.post("/webhook")
-async def webhook_handler(request: Request, background_tasks: BackgroundTasks):
+async def webhook_handler(request: Request):
     """
-    Recebe eventos da Meta e despacha para o handler correto em background.
+    Recebe eventos da Meta, grava na fila persistente e responde imediatamente.
+    O processamento acontece nos workers do ingress_pool.
     """
-    payload = await request.json()
+    body = await request.body()
+    payload = json.loads(body)
     
     object_type = payload.get("object")
 
-    if object_type == "whatsapp_business_account":
-        background_tasks.add_task(handle_whatsapp_event, payload)
-        return {"status": "EVENT_RECEIVED"}
-    
-    elif object_type == "instagram":
-        background_tasks.add_task(handle_instagram_event, payload)
+    if object_type in EVENT_HANDLERS:
+        ingress_queue.enqueue(object_type, body.decode("utf-8"))
+        ingress_pool.notify()
         return {"status": "EVENT_RECEIVED"}
     
     else:
@@ -0,0 +1,129 @@
+import os
+import re
+import math
+from typing import Optional
+import numpy as np
+import faiss
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Tipo do índice gerado no build, na sintaxe do index_factory do FAISS:
+#   Flat (busca exata), HNSW32, IVF,Flat, IVF,SQ8, IVF,PQ64, SQ8, HNSW32,SQ8...
+# "IVF" sem número usa um nlist calculado pelo tamanho do corpus.
+FAISS_INDEX_FACTORY = os.getenv("FAISS_INDEX_FACTORY", "Flat")
+# Listas visitadas por consulta nos índices IVF (mais = mais recall, mais lento)
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "8"))
+# Tamanho da fila de candidatos do HNSW na busca (mais = mais recall, mais lento)
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+# Vetores usados no treino do IVF/PQ (amostra; treinar com tudo não melhora muito)
+FAISS_TRAIN_SIZE = int(os.getenv("FAISS_TRAIN_SIZE", "100000"))
+
+_AUTO_IVF_RE = re.compile(r"^IVF(?=,|$)")
+# O k-means do FAISS pede ~39 pontos por centroide
+_POINTS_PER_CENTROID = 39
+
+
+def suggest_nlist(n: int) -> int:
+    """nlist ~ 4*sqrt(n), sem passar do que dá para treinar com n vetores."""
+    return max(1, min(int(4 * math.sqrt(n)), n // _POINTS_PER_CENTROID))
+
+
+def resolve_factory(factory: str, n: int) -> str:
+    """Troca o "IVF" sem número pelo nlist sugerido para n vetores."""
+    factory = factory.strip() or "Flat"
+    return _AUTO_IVF_RE.sub(f"IVF{suggest_nlist(n)}", factory)
+
+
+def build_index(vectors: np.ndarray, factory: str = FAISS_INDEX_FACTORY, train_size: int = FAISS_TRAIN_SIZE):
+    """
+    Monta um índice do tipo 'factory' com os vetores (treinando antes, se o
+    tipo pede). Se o corpus for pequeno demais para treinar (ex.: PQ com
+    poucas centenas de vetores), cai para o Flat.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    n, dim = vectors.shape
+    spec = resolve_factory(factory, n)
+    index = faiss.index_factory(dim, spec, faiss.METRIC_L2)
+    if not index.is_trained:
+        sample = vectors
+        if n > train_size:
+            rng = np.random.default_rng(0)
+            sample = vectors[np.sort(rng.choice(n, train_size, replace=False))]
+        try:
+            index.train(sample)
+        except RuntimeError as e:
+            print(f"ANN: Não deu para treinar '{spec}' com {len(sample)} vetores ({str(e).split('Error: ')[-1]}). Usando Flat.")
+            index = faiss.IndexFlatL2(dim)
+    index.add(vectors)
+    configure_search(index)
+    return index
+
+
+def describe(index) -> str:
+    """Nome curto do tipo do índice (IndexIVFFlat nlist=26, IndexHNSWFlat...)."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return f"{type(index).__name__} nlist={ivf.nlist} nprobe={ivf.nprobe}"
+    hnsw = _hnsw(index)
+    if hnsw is not None:
+        return f"{type(index).__name__} efSearch={hnsw.hnsw.efSearch}"
+    return type(index).__name__
+
+
+def _hnsw(index):
+    if isinstance(index, faiss.IndexPreTransform):
+        index = faiss.downcast_index(index.index)
+    return index if isinstance(index, faiss.IndexHNSW) else None
+
+
+def configure_search(index, nprobe: int = FAISS_NPROBE, ef_search: int = FAISS_EF_SEARCH):
+    """Ajusta nprobe/efSearch conforme o tipo (no Flat não há o que ajustar)."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+    hnsw = _hnsw(index)
+    if hnsw is not None:
+        hnsw.hnsw.efSearch = ef_search
+    return index
+
+
+def search_parameters(index, ids: np.ndarray) -> Optional[faiss.SearchParameters]:
+    """
+    Parâmetros para restringir a busca às posições 'ids'. Cada família de
+    índice tem a sua classe (e a do IVF/HNSW precisa repetir nprobe/efSearch,
+    senão volta ao padrão). None se o índice não aceita seletor (ex.: PQ puro).
+    """
+    selector = faiss.IDSelectorBatch(np.asarray(ids, dtype='int64'))
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    hnsw = _hnsw(index)
+    if hnsw is not None:
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=hnsw.hnsw.efSearch)
+    if isinstance(index, faiss.IndexPQ):
+        return None
+    return faiss.SearchParameters(sel=selector)
+
+
+def search_subset(index, query: np.ndarray, k: int, ids: np.ndarray):
+    """
+    Busca só entre as posições 'ids'. Índices sem suporte a seletor buscam
+    mais vizinhos e filtram depois.
+    """
+    k = min(k, len(ids))
+    params = search_parameters(index, ids)
+    if params is not None:
+        return index.search(query, k, params=params)
+
+    wanted = np.zeros(index.ntotal, dtype=bool)
+    wanted[ids] = True
+    fetch = min(index.ntotal, max(k, int(k * index.ntotal / len(ids)) * 2))
+    distances, indices = index.search(query, fetch)
+    out_d = np.full((len(query), k), np.inf, dtype='float32')
+    out_i = np.full((len(query), k), -1, dtype='int64')
+    for row in range(len(query)):
+        keep = [c for c, idx in enumerate(indices[row]) if idx != -1 and wanted[idx]][:k]
+        out_d[row, :len(keep)] = distances[row][keep]
+        out_i[row, :len(keep)] = indices[row][keep]
+    return out_d, out_i
@@ -8,13 +8,16 @@ from pathlib import Path
 load_dotenv()
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+AUDIO_MODEL = "gemini-1.5-flash"
+# Estimativa de tokens de uma transcrição (~30s de áudio + texto), usada no rate limit do gateway
+AUDIO_TOKENS_ESTIMATE = 1000
 
 if GOOGLE_API_KEY:
     genai.configure(api_key=GOOGLE_API_KEY)
 
 class AudioService:
     def __init__(self):
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
+        self.model = genai.GenerativeModel(AUDIO_MODEL)
 
     def download_audio(self, audio_url: str) -> str:
         """
@@ -0,0 +1,462 @@
+import re
+from datetime import date
+from typing import Dict, Any, List, Optional, Set, Tuple
+import numpy as np
+
+from app.core.text_utils import tokenize, normalize_text
+
+MONTHS = {
+    "janeiro": 1, "fevereiro": 2, "marco": 3, "abril": 4, "maio": 5, "junho": 6,
+    "julho": 7, "agosto": 8, "setembro": 9, "outubro": 10, "novembro": 11, "dezembro": 12,
+}
+MONTH_NAMES = {number: name for name, number in MONTHS.items()}
+MONTH_NAMES[3] = "março"
+
+# Pontos de embarque -> cidade/bairro canônico (como o cliente costuma perguntar)
+BOARDING_ALIASES = {
+    "diadema": ["diadema", "piraporinha", "agencia marcinho"],
+    "tatuape": ["tatuape"],
+    "barra funda": ["barra funda", "memorial da america"],
+    "carapicuiba": ["carapicuiba"],
+    "guarulhos": ["guarulhos", "sakamoto"],
+    "congonhas": ["congonhas"],
+    "caieiras": ["caieiras"],
+}
+BOARDING_LABELS = {
+    "diadema": "Diadema", "tatuape": "Tatuapé", "barra funda": "Barra Funda",
+    "carapicuiba": "Carapicuíba", "guarulhos": "Guarulhos", "congonhas": "Congonhas",
+    "caieiras": "Caieiras",
+}
+
+# Palavras de título/slug que não identificam o destino
+DESTINATION_STOPWORDS = {
+    "pacote", "com", "dos", "das", "de", "do", "da", "e", "para", "por", "data",
+    "hotel", "beira", "mar", "reveillon", "natal", "luz", "edicao", "2025", "2026",
+    "ba", "rj", "sp", "sc", "rio", "litoral", "norte", "sul",
+}
+
+_PRICE_RE = re.compile(r"R\$\s*(\d[\d.,]*)")
+# "1,999" / "12,500,00": vírgula separando milhar (o site mistura os formatos)
+_COMMA_THOUSANDS_RE = re.compile(r"\d{1,3}(?:,\d{3})+(?:,\d{2})?")
+# Nomes de lugar com palavra de mês (texto normalizado): não são o mês da viagem
+_MONTH_PLACES_RE = re.compile(r"\b(?:rio de janeiro|marco zero)\b")
+_URL_DATE_RE = re.compile(r"data_(\d{2})-(\d{2})-(\d{4})")
+_TEXT_DATE_RE = re.compile(r"\b(\d{2})/(\d{2})/(\d{4})\b")
+_TIME_RE = re.compile(r"\b([01]?\d|2[0-3])\s*(?:h|:)\s*([0-5]\d)?\b")
+# Faixa de preço na pergunta (texto já normalizado): "ate 500 reais", "acima de r$ 1.000"
+_MAX_PRICE_RE = re.compile(r"\b(?:ate|menos de|abaixo de|no maximo|max|maximo de)\s*(r\$)?\s*(\d[\d.]*(?:,\d{1,2})?)\s*(mil\b)?\s*(reais|conto)?")
+_MIN_PRICE_RE = re.compile(r"\b(?:acima de|mais de|a partir de|no minimo)\s*(r\$)?\s*(\d[\d.]*(?:,\d{1,2})?)\s*(mil\b)?\s*(reais|conto)?")
+# Sem "R$"/"reais", só aceita valores que parecem preço
+_MIN_BARE_PRICE = 100.0
+
+
+def parse_price(price: str) -> Optional[float]:
+    """Primeiro valor em reais do texto ("R$2.950,00 /por pessoa" -> 2950.0)."""
+    match = _PRICE_RE.search(price or "")
+    if not match:
+        return None
+    raw = match.group(1).rstrip(".,")
+    if _COMMA_THOUSANDS_RE.fullmatch(raw):
+        head, _, tail = raw.rpartition(",")
+        number = f"{head.replace(',', '')}.{tail}" if len(tail) == 2 else raw.replace(",", "")
+    else:
+        number = raw.replace(".", "").replace(",", ".")
+    try:
+        return float(number)
+    except ValueError:
+        return None
+
+
+def parse_departure(item: Dict[str, Any]) -> Optional[date]:
+    """Data de saída: vem na URL ("data_20-03-2026") ou, na falta dela, nos embarques."""
+    candidates = [_URL_DATE_RE.search(item.get("url", ""))]
+    candidates += [_TEXT_DATE_RE.search(e) for e in item.get("embarques", [])]
+    for match in candidates:
+        if match:
+            day, month, year = (int(g) for g in match.groups())
+            try:
+                return date(year, month, day)
+            except ValueError:
+                continue
+    return None
+
+
+def extract_month(normalized: str) -> Optional[int]:
+    """Primeiro mês citado no texto ("em dezembro" -> 12), fora de nomes de lugar ("rio de janeiro")."""
+    for word in tokenize(_MONTH_PLACES_RE.sub(" ", normalized)):
+        if word in MONTHS:
+            return MONTHS[word]
+    return None
+
+
+def _price_from_match(match) -> Optional[float]:
+    if not match:
+        return None
+    currency, raw, thousand, unit = match.groups()
+    value = parse_price(f"R${raw}")
+    if value is None:
+        return None
+    if thousand:
+        value *= 1000
+    if not (currency or unit or thousand):
+        # "até 5 dias", "até 2026" não são preço
+        if value < _MIN_BARE_PRICE or (raw.isdigit() and 1900 <= value <= 2100):
+            return None
+    return value
+
+
+def parse_search_filters(text: str) -> Dict[str, Any]:
+    """
+    Filtros estruturados citados na pergunta: max_price, min_price, month e
+    boarding_city ("viagens até 500 reais em dezembro saindo de Diadema").
+    Só devolve as chaves encontradas.
+    """
+    normalized = normalize_text(text)
+    filters: Dict[str, Any] = {}
+    max_price = _price_from_match(_MAX_PRICE_RE.search(normalized))
+    if max_price is not None:
+        filters["max_price"] = max_price
+    min_price = _price_from_match(_MIN_PRICE_RE.search(normalized))
+    if min_price is not None:
+        filters["min_price"] = min_price
+    month = extract_month(normalized)
+    if month:
+        filters["month"] = month
+    city = match_boarding_city(normalized)
+    if city:
+        filters["boarding_city"] = city
+    return filters
+
+
+def match_boarding_city(text: str) -> Optional[str]:
+    """Cidade de embarque canônica mencionada no texto, se houver."""
+    normalized = normalize_text(text)
+    for city, aliases in BOARDING_ALIASES.items():
+        if any(alias in normalized for alias in aliases):
+            return city
+    return None
+
+
+def strip_boarding_aliases(normalized: str) -> str:
+    """Remove nomes de pontos de embarque ("barra funda" não é o destino Barra Sul)."""
+    for aliases in BOARDING_ALIASES.values():
+        for alias in aliases:
+            normalized = normalized.replace(alias, " ")
+    return normalized
+
+
+def _format_time(match) -> str:
+    return f"{int(match.group(1)):02d}h{match.group(2) or '00'}"
+
+
+def parse_boarding(item: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Pontos de embarque com horário. Usa a lista 'embarques'; se ela não tiver
+    horário, procura linhas do roteiro no formato "19h00 Diadema".
+    """
+    points = []
+    seen = set()
+    for raw in item.get("embarques", []):
+        city = match_boarding_city(raw)
+        if not city or city in seen:
+            continue
+        time_match = _TIME_RE.search(raw.split("saída")[-1]) or _TIME_RE.search(raw)
+        points.append({"city": city, "time": _format_time(time_match) if time_match else None, "raw": raw})
+        seen.add(city)
+
+    for line in (item.get("roteiro") or "").splitlines():
+        city = match_boarding_city(line)
+        time_match = _TIME_RE.search(line)
+        if not city or not time_match:
+            continue
+        existing = next((p for p in points if p["city"] == city), None)
+        if existing is None:
+            points.append({"city": city, "time": _format_time(time_match), "raw": line.strip()})
+            seen.add(city)
+        elif existing["time"] is None:
+            existing["time"] = _format_time(time_match)
+    return points
+
+
+def document_text(item: Dict[str, Any]) -> str:
+    """Texto rico de um pacote usado para gerar o embedding no índice."""
+    embarques_str = ", ".join(item.get('embarques', []))
+    return (
+        f"Pacote: {item['title']}\n"
+        f"Preço: {item['price']}\n"
+        f"Descrição: {item['description']}\n"
+        f"Roteiro: {item.get('roteiro', '')}\n"
+        f"Inclusões: {item.get('inclusoes', '')}\n"
+        f"Embarques: {embarques_str}"
+    )
+
+
+# --- Trechos (passages) de um pacote ---
+# O índice denso guarda um vetor por trecho (resumo, dias do roteiro, inclusões,
+# embarques, condições de pagamento), com o pacote pai. Assim a busca acha o
+# pedaço que responde a pergunta e o prompt leva só ele.
+
+PASSAGE_MAX_CHARS = 600
+PASSAGE_LABELS = {
+    "resumo": "Resumo",
+    "roteiro": "Roteiro",
+    "inclusoes": "Inclusões",
+    "embarques": "Embarques",
+    "pagamento": "Condições de pagamento",
+}
+# Início de um dia no roteiro: "Dia 1", "1º dia", "Dias 2-5", "SEXTA", "⬇️ (08/11)"...
+_DAY_START_RE = re.compile(
+    r"^(?:\W*\(?\d{1,2}/\d{1,2}\)|dias?\s*\d|\d{1,2}\s*[o°º]?\s*dia|"
+    r"(?:segunda|terca|quarta|quinta|sexta|sabado|domingo)\b)"
+)
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?;])\s+")
+
+
+def _split_long(text: str, max_chars: int) -> List[str]:
+    """Quebra um bloco grande em frases, juntando-as até max_chars."""
+    if len(text) <= max_chars:
+        return [text]
+    return _merge_blocks(_SENTENCE_END_RE.split(text), max_chars, separator=" ")
+
+
+def _merge_blocks(blocks: List[str], max_chars: int, separator: str = "\n") -> List[str]:
+    chunks: List[str] = []
+    current = ""
+    for block in blocks:
+        block = block.strip()
+        if not block:
+            continue
+        if current and len(current) + len(separator) + len(block) > max_chars:
+            chunks.append(current)
+            current = ""
+        if len(block) > max_chars:
+            if separator == "\n":
+                pieces = _split_long(block, max_chars)
+            else:
+                # Frase sem pontuação maior que o limite: corta em pedaços fixos
+                pieces = [block[i:i + max_chars] for i in range(0, len(block), max_chars)]
+            chunks.extend(pieces[:-1])
+            block = pieces[-1]
+        current = f"{current}{separator}{block}" if current else block
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _itinerary_days(roteiro: str) -> List[str]:
+    """Roteiro -> um bloco por dia (linhas até o próximo marcador de dia)."""
+    days: List[str] = []
+    for line in roteiro.splitlines():
+        if not line.strip():
+            continue
+        if not days or _DAY_START_RE.match(normalize_text(line)):
+            days.append(line.strip())
+        else:
+            days[-1] += "\n" + line.strip()
+    return days
+
+
+def item_passages(item: Dict[str, Any], max_chars: int = PASSAGE_MAX_CHARS) -> List[Dict[str, str]]:
+    """Trechos tipados de um pacote: [{"kind", "text"}], na ordem do pacote."""
+    passages = [{
+        "kind": "resumo",
+        "text": f"{item.get('title', '')} - {item.get('price', '')}\n{item.get('description', '')}".strip(),
+    }]
+    sources = [
+        ("roteiro", _itinerary_days(item.get("roteiro") or "")),
+        ("inclusoes", re.split(r"\n\s*\n", item.get("inclusoes") or "")),
+        ("embarques", list(item.get("embarques") or [])),
+        ("pagamento", (item.get("payment_conditions") or "").splitlines()),
+    ]
+    for kind, blocks in sources:
+        for text in _merge_blocks(blocks, max_chars):
+            passages.append({"kind": kind, "text": text})
+    return passages
+
+
+def passage_document(item: Dict[str, Any], passage: Dict[str, str]) -> str:
+    """Texto embedado de um trecho (leva o nome do pacote para não perder o contexto)."""
+    return f"Pacote: {item.get('title', '')}\n{PASSAGE_LABELS.get(passage['kind'], passage['kind'])}: {passage['text']}"
+
+
+def catalog_passages(catalog: List[Dict[str, Any]], chunks: bool = True) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Trechos do catálogo inteiro com o pacote pai ({"parent", "kind", "text"})
+    e o texto embedado de cada um. Sem 'chunks', um trecho por pacote (texto inteiro).
+    """
+    passages: List[Dict[str, Any]] = []
+    texts: List[str] = []
+    for parent, item in enumerate(catalog):
+        if chunks:
+            for passage in item_passages(item):
+                passages.append({"parent": parent, **passage})
+                texts.append(passage_document(item, passage))
+        else:
+            passages.append({"parent": parent, "kind": "pacote", "text": item.get("description", "")})
+            texts.append(document_text(item))
+    return passages, texts
+
+
+def destination_key(item: Dict[str, Any]) -> str:
+    """Chave do destino sem a data (mesma viagem em datas diferentes -> mesma chave)."""
+    slug = item.get("url", "").split("/pacote/")[-1].split("-data_")[0]
+    return slug or normalize_text(item.get("title", ""))
+
+
+_KEY_CONNECTORS = {"com", "e", "de", "do", "da", "dos", "das", "para"}
+
+
+def package_key(item: Dict[str, Any]) -> str:
+    """
+    Viagem canônica: a chave do destino sem conectivos, para juntar as saídas
+    da mesma viagem ("arraial-do-cabo-macae" e "arraial-do-cabo-com-macae").
+    """
+    words = tokenize(destination_key(item).replace("-", " "))
+    return "-".join(w for w in words if w not in _KEY_CONNECTORS)
+
+
+def destination_tokens(item: Dict[str, Any]) -> Set[str]:
+    words = tokenize(item.get("title", "")) + tokenize(destination_key(item).replace("-", " "))
+    return {w for w in words if len(w) > 2 and w not in DESTINATION_STOPWORDS and w not in MONTHS}
+
+
+class CatalogIndex:
+    """
+    Índice em memória do catálogo com os campos já tipados (preço numérico,
+    data de saída, pontos de embarque) para consultas determinísticas.
+    """
+    def __init__(self, catalog: List[Dict[str, Any]]):
+        self.entries: List[Dict[str, Any]] = []
+        self._by_token: Dict[str, Set[int]] = {}
+        for position, item in enumerate(catalog):
+            entry = {
+                "item": item,
+                "key": destination_key(item),
+                "tokens": destination_tokens(item),
+                "price": parse_price(item.get("price", "")),
+                "departure": parse_departure(item),
+                "boarding": parse_boarding(item),
+            }
+            self.entries.append(entry)
+            for token in entry["tokens"]:
+                self._by_token.setdefault(token, set()).add(position)
+
+    def match_destinations(self, text: str) -> List[Dict[str, Any]]:
+        """
+        Pacotes cujo destino tem a maior sobreposição de palavras com o texto.
+        Retorna lista vazia se nada bater.
+        """
+        words = set(tokenize(text))
+        scores: Dict[int, int] = {}
+        for word in words:
+            for position in self._by_token.get(word, ()):
+                scores[position] = scores.get(position, 0) + 1
+        if not scores:
+            return []
+        best = max(scores.values())
+        return [self.entries[pos] for pos in sorted(scores) if scores[pos] == best]
+
+    def departing_in(self, month: int, today: Optional[date] = None) -> List[Dict[str, Any]]:
+        """
+        Pacotes com saída na próxima ocorrência do mês que ainda tem viagens
+        (saídas passadas ficam de fora), em ordem de data.
+        """
+        today = today or date.today()
+        found = [e for e in self.entries if e["departure"] and e["departure"] >= today and e["departure"].month == month]
+        if not found:
+            return []
+        year = min(e["departure"].year for e in found)
+        return sorted((e for e in found if e["departure"].year == year), key=lambda e: e["departure"])
+
+
+class CatalogColumns:
+    """
+    Colunas tipadas do índice (uma linha por vetor do FAISS) e índices
+    secundários para filtrar antes da busca:
+
+      - price: float32 (NaN = sem preço), com a ordem por preço pré-calculada
+      - departure: data de saída como ordinal (0 = sem data), month e year (0 = sem data)
+      - boarding: bitmask das cidades de embarque (bits na ordem de BOARDING_ALIASES)
+
+    select() devolve as posições que passam em todos os filtros.
+    """
+    BOARDING_CITIES = list(BOARDING_ALIASES)
+
+    def __init__(self, price: np.ndarray, departure: np.ndarray, boarding: np.ndarray):
+        self.price = np.asarray(price, dtype=np.float32)
+        self.departure = np.asarray(departure, dtype=np.int32)
+        self.boarding = np.asarray(boarding, dtype=np.uint32)
+        self.month = np.array(
+            [date.fromordinal(int(d)).month if d else 0 for d in self.departure], dtype=np.int8
+        )
+        self.year = np.array(
+            [date.fromordinal(int(d)).year if d else 0 for d in self.departure], dtype=np.int16
+        )
+        # Índices secundários
+        known = np.flatnonzero(~np.isnan(self.price))
+        self._by_price = known[np.argsort(self.price[known], kind="stable")]
+        self._sorted_prices = self.price[self._by_price]
+        self._by_month = {int(m): np.flatnonzero(self.month == m) for m in np.unique(self.month) if m}
+        self._by_boarding = {
+            city: np.flatnonzero(self.boarding & (1 << bit))
+            for bit, city in enumerate(self.BOARDING_CITIES)
+        }
+
+    def __len__(self) -> int:
+        return len(self.price)
+
+    @classmethod
+    def from_items(cls, items: List[Dict[str, Any]]) -> "CatalogColumns":
+        prices, departures, boardings = [], [], []
+        for item in items:
+            price = parse_price(item.get("price", ""))
+            departure = parse_departure(item)
+            mask = 0
+            for point in parse_boarding(item):
+                mask |= 1 << cls.BOARDING_CITIES.index(point["city"])
+            prices.append(np.nan if price is None else price)
+            departures.append(departure.toordinal() if departure else 0)
+            boardings.append(mask)
+        return cls(np.array(prices, dtype=np.float32), np.array(departures), np.array(boardings))
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            np.savez(f, price=self.price, departure=self.departure, boarding=self.boarding)
+
+    @classmethod
+    def load(cls, path: str) -> "CatalogColumns":
+        with np.load(path) as data:
+            return cls(data["price"], data["departure"], data["boarding"])
+
+    def select(
+        self,
+        max_price: Optional[float] = None,
+        min_price: Optional[float] = None,
+        month: Optional[int] = None,
+        boarding_city: Optional[str] = None,
+        today: Optional[date] = None
+    ) -> Optional[np.ndarray]:
+        """
+        Posições (int64, ordenadas) que passam nos filtros; None se não há filtro.
+        O mês vale para a próxima ocorrência dele com saídas (as já passadas ficam de fora).
+        """
+        selected: Optional[np.ndarray] = None
+
+        def narrow(ids: np.ndarray):
+            nonlocal selected
+            ids = np.sort(ids)
+            selected = ids if selected is None else np.intersect1d(selected, ids, assume_unique=True)
+
+        if max_price is not None or min_price is not None:
+            lo = 0 if min_price is None else np.searchsorted(self._sorted_prices, min_price, side="left")
+            hi = len(self._sorted_prices) if max_price is None else np.searchsorted(self._sorted_prices, max_price, side="right")
+            narrow(self._by_price[lo:hi])
+        if month:
+            ids = self._by_month.get(int(month), np.empty(0, dtype=np.int64))
+            ids = ids[self.departure[ids] >= (today or date.today()).toordinal()]
+            if len(ids):
+                ids = ids[self.year[ids] == self.year[ids].min()]
+            narrow(ids)
+        if boarding_city:
+            narrow(self._by_boarding.get(boarding_city, np.empty(0, dtype=np.int64)))
+        return None if selected is None else selected.astype(np.int64)
@@ -0,0 +1,179 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Set
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "data")
+# A Meta reenvia webhooks não confirmados por bastante tempo, então guardamos IDs por 24h
+DEDUP_TTL_SECONDS = float(os.getenv("DEDUP_TTL_SECONDS", "86400"))
+DEDUP_MAX_ENTRIES = int(os.getenv("DEDUP_MAX_ENTRIES", "200000"))
+# Deixe vazio para desligar a persistência em disco
+DEDUP_DB_FILE = os.getenv("DEDUP_DB_PATH", os.path.join(DATA_DIR, "dedup.db"))
+
+
+class DedupStore:
+    """
+    Conjunto de IDs de mensagens já processadas com expiração por tempo (TTL)
+    e limite de tamanho (LRU). Operações O(1) amortizadas via OrderedDict.
+
+    Com persistência ligada, o SQLite é a fonte da verdade: a memória é só o
+    cache quente. Assim a deduplicação sobrevive a reinícios e continua correta
+    mesmo quando o volume diário passa do limite em memória.
+
+    Um ID visto fica pendente até confirm() (resposta entregue). Se o processo
+    morrer antes, a nova entrega do evento pela fila (reclaim=True) processa a
+    mensagem de novo em vez de tratá-la como duplicada.
+    """
+    def __init__(self, ttl: float = DEDUP_TTL_SECONDS, max_entries: int = DEDUP_MAX_ENTRIES, path: Optional[str] = DEDUP_DB_FILE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, float]" = OrderedDict()
+        # IDs vistos cuja resposta ainda não foi confirmada
+        self._pending: Set[str] = set()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+
+        if path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+                self._conn.execute("CREATE TABLE IF NOT EXISTS seen (id TEXT PRIMARY KEY, ts REAL NOT NULL, done INTEGER NOT NULL DEFAULT 1)")
+                # Bancos criados antes da coluna done (linhas antigas contam como confirmadas)
+                columns = {row[1] for row in self._conn.execute("PRAGMA table_info(seen)")}
+                if "done" not in columns:
+                    self._conn.execute("ALTER TABLE seen ADD COLUMN done INTEGER NOT NULL DEFAULT 1")
+                self._conn.execute("CREATE INDEX IF NOT EXISTS idx_seen_ts ON seen (ts)")
+                self._warm_up()
+            except Exception as e:
+                print(f"DEDUP: Persistência desativada ({e}). Usando apenas memória.")
+                self._conn = None
+
+    def _warm_up(self):
+        """Carrega os IDs mais recentes (dentro do TTL) para o cache em memória."""
+        cutoff = time.time() - self.ttl
+        rows = self._conn.execute(
+            "SELECT id, ts, done FROM (SELECT id, ts, done FROM seen WHERE ts > ? ORDER BY ts DESC LIMIT ?) ORDER BY ts",
+            (cutoff, self.max_entries)
+        ).fetchall()
+        for message_id, ts, done in rows:
+            self._entries[message_id] = ts
+            if not done:
+                self._pending.add(message_id)
+        print(f"DEDUP: {len(rows)} IDs recentes carregados do disco.")
+
+    def seen(self, message_id: str, reclaim: bool = False) -> bool:
+        """
+        Retorna True se o ID já foi visto dentro do TTL.
+        Caso contrário, registra o ID como pendente e retorna False (checagem +
+        marcação atômicas). Com reclaim=True (nova entrega do mesmo evento da
+        fila), um ID ainda pendente conta como não visto.
+        """
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+
+            ts = self._entries.get(message_id)
+            if ts is None and self._conn is not None:
+                # Pode ter saído da memória pelo LRU, mas ainda estar no disco
+                row = self._conn.execute(
+                    "SELECT ts, done FROM seen WHERE id = ? AND ts > ?", (message_id, now - self.ttl)
+                ).fetchone()
+                ts = row[0] if row else None
+                if row and not row[1]:
+                    self._pending.add(message_id)
+
+            if ts is not None and reclaim and message_id in self._pending:
+                # A tentativa anterior não entregou a resposta: processa de novo
+                self.misses += 1
+                self._entries[message_id] = now
+                self._entries.move_to_end(message_id)
+                self._persist(message_id, now)
+                return False
+
+            if ts is not None:
+                # Retentativas renovam o prazo (TTL deslizante), o que mantém
+                # o OrderedDict ordenado por tempo para a expiração pelo início
+                self.hits += 1
+                self._entries[message_id] = now
+                self._entries.move_to_end(message_id)
+                self._persist(message_id, now)
+                return True
+
+            self.misses += 1
+            self._entries[message_id] = now
+            self._pending.add(message_id)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._pending.discard(evicted)
+            self._persist(message_id, now)
+            return False
+
+    def confirm(self, message_id: str):
+        """A mensagem foi atendida: o ID deixa de ser pendente."""
+        with self._lock:
+            self._pending.discard(message_id)
+            if self._conn is not None:
+                try:
+                    self._conn.execute("UPDATE seen SET done = 1 WHERE id = ?", (message_id,))
+                except Exception as e:
+                    print(f"DEDUP: Erro ao confirmar ID {message_id}: {e}")
+
+    def forget(self, message_id: str):
+        """Remove o ID (a mensagem falhou e deve ser processada de novo na retentativa)."""
+        with self._lock:
+            self._entries.pop(message_id, None)
+            self._pending.discard(message_id)
+            if self._conn is not None:
+                try:
+                    self._conn.execute("DELETE FROM seen WHERE id = ?", (message_id,))
+                except Exception as e:
+                    print(f"DEDUP: Erro ao remover ID {message_id}: {e}")
+
+    def _expire(self, now: float):
+        # Entradas mais antigas ficam no início do OrderedDict
+        cutoff = now - self.ttl
+        while self._entries:
+            message_id, ts = next(iter(self._entries.items()))
+            if ts > cutoff:
+                break
+            self._entries.popitem(last=False)
+            self._pending.discard(message_id)
+
+    def _persist(self, message_id: str, ts: float):
+        if self._conn is None:
+            return
+        try:
+            # Renovar o prazo não muda o estado (pendente/confirmado)
+            self._conn.execute(
+                "INSERT INTO seen (id, ts, done) VALUES (?, ?, 0) ON CONFLICT(id) DO UPDATE SET ts = excluded.ts",
+                (message_id, ts)
+            )
+            self._writes += 1
+            # Limpeza periódica das linhas vencidas no disco
+            if self._writes % 1000 == 0:
+                self._conn.execute("DELETE FROM seen WHERE ts <= ?", (ts - self.ttl,))
+        except Exception as e:
+            print(f"DEDUP: Erro ao persistir ID {message_id}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries_in_memory": len(self._entries),
+            "pending": len(self._pending),
+            "hits": self.hits,
+            "misses": self.misses,
+            "persistent": self._conn is not None,
+        }
+
+
+# Instância global
+dedup_store = DedupStore()
@@ -0,0 +1,70 @@
+import os
+from datetime import date
+from typing import Any, Dict, List, Optional
+import numpy as np
+from dotenv import load_dotenv
+
+from app.services.catalog_index import parse_departure
+
+load_dotenv()
+
+# Junta saídas da mesma viagem e diversifica o top-k (MMR) antes do prompt
+RAG_DIVERSITY = os.getenv("RAG_DIVERSITY", "true").lower() not in ("0", "false", "no")
+# Peso da relevância no MMR (1 = só relevância, 0 = só diversidade)
+RAG_MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.7"))
+
+
+def mmr(relevance: List[float], vectors: List[Optional[np.ndarray]], k: int, lambda_: float = RAG_MMR_LAMBDA) -> List[int]:
+    """
+    Maximal Marginal Relevance: escolhe k posições equilibrando relevância e
+    distância das já escolhidas (similaridade de cosseno). Sem vetor, o
+    candidato não penaliza nem é penalizado.
+    """
+    normalized = []
+    for vector in vectors:
+        norm = float(np.linalg.norm(vector)) if vector is not None else 0.0
+        normalized.append(vector / norm if norm else None)
+
+    chosen: List[int] = []
+    remaining = list(range(len(relevance)))
+    while remaining and len(chosen) < k:
+        def score(candidate: int) -> float:
+            similarity = 0.0
+            if normalized[candidate] is not None:
+                similarity = max(
+                    (float(normalized[candidate] @ normalized[c]) for c in chosen if normalized[c] is not None),
+                    default=0.0
+                )
+            return lambda_ * relevance[candidate] - (1 - lambda_) * similarity
+
+        best = max(remaining, key=score)
+        chosen.append(best)
+        remaining.remove(best)
+    return chosen
+
+
+def departure_entry(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Uma saída da viagem: data (dd/mm/aaaa), preço e link."""
+    departure = parse_departure(item)
+    return {
+        "date": departure.strftime("%d/%m/%Y") if departure else None,
+        "price": item.get("price"),
+        "url": item.get("url"),
+    }
+
+
+def departure_order(item: Dict[str, Any]) -> date:
+    """Chave de ordenação por data de saída (sem data vai para o fim)."""
+    return parse_departure(item) or date.max
+
+
+def is_upcoming(item: Dict[str, Any], today: Optional[date] = None) -> bool:
+    """A saída ainda não aconteceu (sem data conta como disponível)."""
+    return departure_order(item) >= (today or date.today())
+
+
+def collapse_departures(items: List[Dict[str, Any]], today: Optional[date] = None) -> List[Dict[str, Any]]:
+    """Saídas futuras de uma viagem, em ordem de data (sem data vão para o fim)."""
+    upcoming = [item for item in items if is_upcoming(item, today)]
+    ordered = sorted(upcoming, key=departure_order)
+    return [departure_entry(item) for item in ordered]
@@ -0,0 +1,237 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List
+import numpy as np
+from dotenv import load_dotenv
+
+from app.core.text_utils import normalize_text
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+load_dotenv()
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "data")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "20000"))
+# float16 ocupa metade da memória; a perda de precisão não muda o ranking do FAISS na prática
+EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float16")
+# Prefixo dos arquivos mapeados em memória (vazio desliga a persistência)
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(DATA_DIR, "embedding_cache"))
+
+_KEY_BYTES = 20  # sha1
+
+
+def cache_key(text: str, model: str) -> bytes:
+    """Chave do texto normalizado + modelo (e tipo de tarefa, ex: 'embedding-001:query')."""
+    return hashlib.sha1(f"{model}\x00{normalize_text(text)}".encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """
+    Cache LRU de embeddings de um modelo, com memória limitada.
+
+    Os vetores ficam numa matriz fixa (max_entries x dim) em float16/float32;
+    o dicionário só guarda chave -> linha. Com persistência, a matriz, as
+    chaves e o relógio de uso são arquivos np.memmap: o cache aquecido
+    sobrevive a reinícios e o SO carrega só as páginas usadas.
+
+    O arquivo é travado (flock) pelo primeiro processo que o abre; os outros
+    workers usam cache só em memória, para ninguém sobrescrever linhas alheias.
+    """
+    def __init__(
+        self,
+        model: str,
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+        dtype: str = EMBEDDING_CACHE_DTYPE,
+        path: Optional[str] = None
+    ):
+        self.model = model
+        self.max_entries = max_entries
+        self.dtype = np.dtype(dtype)
+        self.path = path
+        self.dim: Optional[int] = None
+        self._lock = threading.Lock()
+        self._slots: "OrderedDict[bytes, int]" = OrderedDict()
+        self._vectors: Optional[np.ndarray] = None
+        self._keys: Optional[np.ndarray] = None
+        self._ticks: Optional[np.ndarray] = None
+        self._tick = 0
+        self._lock_file = None
+        self.persistent = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if path:
+            self._open_existing()
+
+    # --- Persistência ---
+
+    def _meta_path(self) -> str:
+        return f"{self.path}.meta.json"
+
+    def _acquire_file_lock(self) -> bool:
+        if fcntl is None or self._lock_file is not None:
+            return True
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._lock_file = open(f"{self.path}.lock", "w")
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            print(f"EMBEDDING CACHE: {self.path} em uso por outro processo. Usando só memória.")
+            if self._lock_file:
+                self._lock_file.close()
+                self._lock_file = None
+            return False
+
+    def _open_existing(self):
+        """Carrega o cache do disco, se o formato bater com a configuração atual."""
+        if not os.path.exists(self._meta_path()):
+            return
+        try:
+            with open(self._meta_path(), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            expected = {"model": self.model, "dtype": self.dtype.name, "max_entries": self.max_entries}
+            if any(meta.get(field) != value for field, value in expected.items()):
+                print(f"EMBEDDING CACHE: Configuração mudou ({meta}). Recomeçando o cache de {self.model}.")
+                return
+            if not self._acquire_file_lock():
+                return
+            self._map_files(meta["dim"], mode="r+")
+            order = np.argsort(self._ticks, kind="stable")
+            for slot in order:
+                if self._ticks[slot] == 0:
+                    continue
+                self._slots[bytes(self._keys[slot])] = int(slot)
+            self._tick = int(self._ticks.max()) if len(self._ticks) else 0
+            print(f"EMBEDDING CACHE: {len(self._slots)} embeddings de {self.model} carregados do disco.")
+        except Exception as e:
+            print(f"EMBEDDING CACHE: Erro ao abrir cache em disco ({e}). Usando só memória.")
+            self._slots.clear()
+            self._vectors = self._keys = self._ticks = None
+            self.persistent = False
+
+    def _map_files(self, dim: int, mode: str):
+        self.dim = dim
+        shape = (self.max_entries, dim)
+        self._vectors = np.memmap(f"{self.path}.vectors", dtype=self.dtype, mode=mode, shape=shape)
+        self._keys = np.memmap(f"{self.path}.keys", dtype=np.uint8, mode=mode, shape=(self.max_entries, _KEY_BYTES))
+        self._ticks = np.memmap(f"{self.path}.ticks", dtype=np.int64, mode=mode, shape=(self.max_entries,))
+        self.persistent = True
+
+    def _allocate(self, dim: int):
+        """Cria a matriz no primeiro put (só então sabemos a dimensão)."""
+        if self.path and self._acquire_file_lock():
+            try:
+                self._map_files(dim, mode="w+")
+                with open(self._meta_path(), "w", encoding="utf-8") as f:
+                    json.dump({"model": self.model, "dim": dim, "dtype": self.dtype.name, "max_entries": self.max_entries}, f)
+                return
+            except Exception as e:
+                print(f"EMBEDDING CACHE: Erro ao criar cache em disco ({e}). Usando só memória.")
+        self.dim = dim
+        self._vectors = np.zeros((self.max_entries, dim), dtype=self.dtype)
+        self._keys = np.zeros((self.max_entries, _KEY_BYTES), dtype=np.uint8)
+        self._ticks = np.zeros(self.max_entries, dtype=np.int64)
+        self.persistent = False
+
+    def flush(self):
+        with self._lock:
+            if self.persistent:
+                for array in (self._vectors, self._keys, self._ticks):
+                    array.flush()
+
+    # --- API ---
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        """Embedding (float32) do texto, ou None se não estiver no cache."""
+        key = cache_key(text, self.model)
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                self.misses += 1
+                return None
+            self._slots.move_to_end(key)
+            self._tick += 1
+            self._ticks[slot] = self._tick
+            self.hits += 1
+            return np.array(self._vectors[slot], dtype="float32")
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        return [self.get(text) for text in texts]
+
+    def put(self, text: str, vector):
+        vec = np.asarray(vector, dtype="float32").reshape(-1)
+        key = cache_key(text, self.model)
+        with self._lock:
+            if self._vectors is None:
+                self._allocate(vec.shape[0])
+            if vec.shape[0] != self.dim:
+                print(f"EMBEDDING CACHE: Dimensão {vec.shape[0]} diferente da do cache ({self.dim}). Ignorado.")
+                return
+            slot = self._slots.get(key)
+            if slot is None:
+                if len(self._slots) < self.max_entries:
+                    slot = len(self._slots)
+                else:
+                    # LRU: reaproveita a linha do menos usado
+                    _, slot = self._slots.popitem(last=False)
+                    self.evictions += 1
+                self._slots[key] = slot
+            else:
+                self._slots.move_to_end(key)
+            self._vectors[slot] = vec
+            self._keys[slot] = np.frombuffer(key, dtype=np.uint8)
+            self._tick += 1
+            self._ticks[slot] = self._tick
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "model": self.model,
+            "entries": len(self._slots),
+            "max_entries": self.max_entries,
+            "dtype": self.dtype.name,
+            "dim": self.dim,
+            "persistent": self.persistent,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "evictions": self.evictions,
+            "memory_bytes": int(self.max_entries * (self.dim or 0) * self.dtype.itemsize),
+        }
+
+
+_caches: Dict[str, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(model: str) -> EmbeddingCache:
+    """
+    Cache compartilhado de um modelo/tarefa (ex: 'models/embedding-001:query').
+    Cada um tem seus arquivos, pois a dimensão pode mudar entre modelos.
+    """
+    with _caches_lock:
+        cache = _caches.get(model)
+        if cache is None:
+            path = None
+            if EMBEDDING_CACHE_PATH:
+                slug = "".join(ch if ch.isalnum() else "_" for ch in model).strip("_")
+                path = f"{EMBEDDING_CACHE_PATH}-{slug}"
+            cache = EmbeddingCache(model, path=path)
+            _caches[model] = cache
+        return cache
+
+
+def all_embedding_cache_stats() -> List[Dict[str, Any]]:
+    return [cache.stats() for cache in _caches.values()]
+
+
+def flush_embedding_caches():
+    for cache in list(_caches.values()):
+        cache.flush()
@@ -0,0 +1,146 @@
+import os
+import hashlib
+from typing import List, Dict, Optional
+import numpy as np
+from dotenv import load_dotenv
+
+from app.services.lexical_index import analyze
+
+load_dotenv()
+
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "data")
+# 'google' (Gemini, remoto), 'fastembed' (ONNX local, sem rede por mensagem) ou 'hashing' (determinístico, offline)
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "google")
+GOOGLE_EMBEDDING_MODEL = "models/embedding-001"
+# Modelo multilíngue (português incluso), 384 dimensões, ~120 MB
+FASTEMBED_MODEL = os.getenv("FASTEMBED_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+FASTEMBED_THREADS = int(os.getenv("FASTEMBED_THREADS", "0")) or None
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+# Dimensão do embedder determinístico por hashing (testes/avaliação offline)
+HASHING_EMBEDDING_DIM = int(os.getenv("HASHING_EMBEDDING_DIM", "512"))
+
+
+class EmbeddingProvider:
+    """
+    Interface dos backends de embedding. 'name' identifica o modelo (usado no
+    cache e no gateway); 'remote' diz se cada chamada vai para a rede e,
+    portanto, precisa passar pelo gateway do Gemini.
+    """
+    name = ""
+    remote = False
+
+    def embed_query(self, text: str) -> np.ndarray:
+        raise NotImplementedError
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        """Matriz (n, dim) float32."""
+        raise NotImplementedError
+
+    def embed_queries(self, texts: List[str]) -> np.ndarray:
+        """Várias consultas numa chamada só (mesmos vetores do embed_query). Matriz (n, dim)."""
+        return np.vstack([self.embed_query(text) for text in texts])
+
+
+class GoogleEmbeddingProvider(EmbeddingProvider):
+    remote = True
+
+    def __init__(self, model: str = GOOGLE_EMBEDDING_MODEL):
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        self.name = model
+        self.client = GoogleGenerativeAIEmbeddings(model=model, google_api_key=GOOGLE_API_KEY)
+
+    def embed_query(self, text):
+        return np.array(self.client.embed_query(text), dtype="float32")
+
+    def embed_documents(self, texts):
+        return np.array(self.client.embed_documents(texts), dtype="float32").reshape(len(texts), -1)
+
+    def embed_queries(self, texts):
+        # Um round trip para o lote, com o mesmo tipo de tarefa do embed_query
+        vectors = self.client.embed_documents(texts, task_type="RETRIEVAL_QUERY")
+        return np.array(vectors, dtype="float32").reshape(len(texts), -1)
+
+
+class FastEmbedProvider(EmbeddingProvider):
+    """
+    Embeddings locais via fastembed (ONNX Runtime na CPU). O modelo é baixado
+    uma vez para o cache do fastembed e depois roda sem rede; documentos são
+    processados em lotes de EMBEDDING_BATCH_SIZE.
+    """
+    remote = False
+
+    def __init__(self, model: str = FASTEMBED_MODEL, threads: Optional[int] = FASTEMBED_THREADS, batch_size: int = EMBEDDING_BATCH_SIZE):
+        from fastembed import TextEmbedding
+        self.name = model
+        self.batch_size = batch_size
+        self.client = TextEmbedding(model_name=model, threads=threads)
+
+    def embed_query(self, text):
+        return np.asarray(next(iter(self.client.query_embed(text))), dtype="float32")
+
+    def embed_documents(self, texts):
+        vectors = list(self.client.passage_embed(texts, batch_size=self.batch_size))
+        return np.asarray(vectors, dtype="float32").reshape(len(texts), -1)
+
+    def embed_queries(self, texts):
+        vectors = list(self.client.query_embed(texts, batch_size=self.batch_size))
+        return np.asarray(vectors, dtype="float32").reshape(len(texts), -1)
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """
+    Embeddings determinísticos, sem modelo e sem rede: cada termo (mesma
+    análise do BM25: sem acento, sem palavras vazias, com stem) e cada
+    trigrama dele cai num balde escolhido por hash (blake2b, estável entre
+    processos e máquinas), com sinal +/-1. Serve para CI e para comparar
+    configurações do índice offline; não entende sinônimos como um modelo.
+    """
+    remote = False
+
+    def __init__(self, dim: int = HASHING_EMBEDDING_DIM):
+        self.name = f"hashing-{dim}"
+        self.dim = dim
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype="float32")
+        for term in analyze(text):
+            features = [(term, 1.0)] + [(f"#{term[i:i + 3]}", 0.5) for i in range(len(term) - 2)]
+            for feature, weight in features:
+                value = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+                vector[value % self.dim] += weight if (value >> 63) else -weight
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+    def embed_documents(self, texts):
+        return np.vstack([self._embed(text) for text in texts]) if texts else np.zeros((0, self.dim), dtype="float32")
+
+
+PROVIDERS = {
+    "google": GoogleEmbeddingProvider,
+    "fastembed": FastEmbedProvider,
+    "hashing": HashingEmbeddingProvider,
+}
+
+
+def get_embedding_provider(provider: str = EMBEDDING_PROVIDER) -> EmbeddingProvider:
+    if provider not in PROVIDERS:
+        raise ValueError(f"EMBEDDING_PROVIDER inválido: '{provider}' (opções: {', '.join(PROVIDERS)})")
+    return PROVIDERS[provider]()
+
+
+def index_files(provider: str = EMBEDDING_PROVIDER) -> Dict[str, str]:
+    """
+    Arquivos do índice de cada backend (a dimensão muda de um para o outro).
+    O Google mantém os nomes antigos (index.faiss / index.meta).
+    """
+    suffix = "" if provider == "google" else f"-{provider}"
+    return {
+        "index": os.path.join(DATA_DIR, f"index{suffix}.faiss"),
+        "metadata": os.path.join(DATA_DIR, f"index{suffix}.meta"),
+        "columns": os.path.join(DATA_DIR, f"index{suffix}.columns.npz"),
+        "passages": os.path.join(DATA_DIR, f"index{suffix}.passages"),
+    }
@@ -0,0 +1,135 @@
+import os
+import time
+import asyncio
+from typing import Dict, Any, Callable, List, Optional, Tuple
+from dotenv import load_dotenv
+
+from app.services.rag_service import rag_service, RAGService, IndexSnapshot
+from app.services.index_store import resolve_index_files
+
+load_dotenv()
+
+# De quanto em quanto tempo (s) olhamos se há versão nova do índice (0 desliga)
+INDEX_WATCH_INTERVAL = float(os.getenv("INDEX_WATCH_INTERVAL", "10"))
+
+
+class IndexReloader:
+    """
+    Recarrega o índice e o catálogo sem reiniciar o processo.
+
+    A versão nova é carregada numa thread (fora do event loop) enquanto a
+    antiga segue atendendo; quando fica pronta, a troca é uma atribuição
+    atômica em rag_service. Buscas já em andamento terminam na versão em que
+    começaram. Depois da troca, os ouvintes (catálogo do prompt, fast path,
+    destinos da memória, cache semântico) recebem a versão nova.
+
+    Dispara por chamada do admin ou pelo watcher, que compara a versão ativa
+    (CURRENT) e o mtime dos arquivos a cada INDEX_WATCH_INTERVAL.
+    """
+    def __init__(self, rag: RAGService = rag_service, interval: float = INDEX_WATCH_INTERVAL):
+        self.rag = rag
+        self.interval = interval
+        self._listeners: List[Callable[[IndexSnapshot], None]] = []
+        # Criado no event loop em uso (na primeira recarga)
+        self._lock: Optional[asyncio.Lock] = None
+        self._watcher: Optional[asyncio.Task] = None
+        self._fingerprint = self._read_fingerprint()
+        self.reloads = 0
+        self.failures = 0
+        self.last_reload_ms: Optional[float] = None
+        self.last_reason: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self.last_reload_at: Optional[float] = None
+
+    def add_listener(self, listener: Callable[[IndexSnapshot], None]):
+        """Chamado (numa thread) com cada versão nova, logo depois da troca."""
+        self._listeners.append(listener)
+
+    def _read_fingerprint(self) -> Tuple:
+        version, files = resolve_index_files(self.rag.provider_name)
+        mtimes = []
+        for name in ("index", "metadata", "catalog"):
+            try:
+                mtimes.append(os.path.getmtime(files[name]))
+            except OSError:
+                mtimes.append(0.0)
+        return (version, *mtimes)
+
+    def _load_and_swap(self) -> IndexSnapshot:
+        snapshot = IndexSnapshot.load(self.rag.provider_name)
+        self.rag.swap(snapshot)
+        for listener in self._listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                print(f"INDEX RELOAD: Erro ao atualizar ouvinte {getattr(listener, '__name__', listener)}: {e}")
+        return snapshot
+
+    async def reload(self, reason: str = "admin") -> Dict[str, Any]:
+        """Carrega a versão ativa em background e troca. Recargas simultâneas esperam a vez."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            started = time.perf_counter()
+            fingerprint = self._read_fingerprint()
+            try:
+                loop = asyncio.get_running_loop()
+                snapshot = await loop.run_in_executor(None, self._load_and_swap)
+            except Exception as e:
+                # Não tenta de novo a mesma versão a cada ciclo do watcher
+                self._fingerprint = fingerprint
+                self.failures += 1
+                self.last_error = str(e)
+                print(f"INDEX RELOAD: Falha ao recarregar ({reason}): {e}. Mantendo a versão {self.rag.snapshot.version}.")
+                return self.stats()
+
+            self._fingerprint = fingerprint
+            self.reloads += 1
+            self.last_reload_ms = round((time.perf_counter() - started) * 1000, 1)
+            self.last_reason = reason
+            self.last_error = None
+            self.last_reload_at = time.time()
+            print(f"INDEX RELOAD: Versão {snapshot.version} ativa em {self.last_reload_ms} ms ({reason}).")
+            return self.stats()
+
+    async def _watch_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if self._read_fingerprint() != self._fingerprint:
+                    await self.reload("watch")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"INDEX RELOAD: Erro no watcher: {e}")
+
+    async def start(self):
+        if self._watcher is None and self.interval > 0:
+            self._watcher = asyncio.create_task(self._watch_loop())
+
+    async def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            await asyncio.gather(self._watcher, return_exceptions=True)
+            self._watcher = None
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self.rag.snapshot
+        return {
+            "active_version": snapshot.version,
+            "items": len(snapshot.metadata),
+            "catalog_items": len(snapshot.catalog),
+            "loaded_at": snapshot.loaded_at,
+            "load_ms": round(snapshot.load_ms, 1),
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "last_reload_ms": self.last_reload_ms,
+            "last_reason": self.last_reason,
+            "last_reload_at": self.last_reload_at,
+            "last_error": self.last_error,
+            "watching": self._watcher is not None,
+        }
+
+
+# Instância global
+index_reloader = IndexReloader()
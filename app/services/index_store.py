@@ -0,0 +1,256 @@
+import os
+import mmap
+import json
+import time
+import shutil
+import struct
+from typing import Dict, Any, List, Iterator, Optional, Tuple
+import numpy as np
+import faiss
+from dotenv import load_dotenv
+
+from app.services.embedding_provider import index_files
+
+load_dotenv()
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "data")
+# Versões do índice: <dir>/<backend>/<versão>/ e o ponteiro <dir>/<backend>/CURRENT
+INDEX_ARTIFACTS_DIR = os.getenv("INDEX_ARTIFACTS_DIR", os.path.join(DATA_DIR, "artifacts"))
+# Versões antigas mantidas no disco (para voltar atrás trocando o CURRENT)
+INDEX_KEEP_VERSIONS = int(os.getenv("INDEX_KEEP_VERSIONS", "3"))
+LEGACY_VERSION = "legacy"
+
+# Formato do arquivo de metadados (colunar, lido via mmap):
+#   MAGIC (8 bytes) | tamanho do cabeçalho (uint64 LE) | cabeçalho JSON | seções (alinhadas em 8)
+# Cada campo tem uma seção de offsets (uint64, n+1 valores) e um blob UTF-8.
+# O valor do registro i é blob[offsets[i]:offsets[i+1]]. Campos "str" guardam o
+# texto puro; campos "json" guardam JSON (listas etc.) e um trecho vazio = campo ausente.
+MAGIC = b"MTMETA01"
+_ALIGN = 8
+
+
+def _pad(size: int) -> int:
+    return (-size) % _ALIGN
+
+
+def write_metadata_store(path: str, items: List[Dict[str, Any]]):
+    """Grava os metadados no formato colunar (atômico: escreve em .tmp e renomeia)."""
+    fields: List[str] = []
+    for item in items:
+        for name in item:
+            if name not in fields:
+                fields.append(name)
+
+    sections = []
+    header_fields = []
+    for name in fields:
+        is_str = all(isinstance(item.get(name), str) for item in items)
+        chunks = []
+        for item in items:
+            if is_str:
+                chunks.append(item[name].encode("utf-8"))
+            elif name in item:
+                chunks.append(json.dumps(item[name], ensure_ascii=False).encode("utf-8"))
+            else:
+                chunks.append(b"")
+        offsets = np.zeros(len(items) + 1, dtype="<u8")
+        offsets[1:] = np.cumsum([len(chunk) for chunk in chunks]) if chunks else []
+        sections.append((offsets.tobytes(), b"".join(chunks)))
+        header_fields.append({"name": name, "kind": "str" if is_str else "json"})
+
+    # Posições relativas ao início das seções (logo após o cabeçalho alinhado)
+    position = 0
+    for entry, (offsets, blob) in zip(header_fields, sections):
+        entry["offsets"] = position
+        position += len(offsets)
+        entry["blob"] = position
+        position += len(blob) + _pad(len(blob))
+    header = json.dumps({"count": len(items), "fields": header_fields}).encode("utf-8")
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        f.write(b"\0" * _pad(f.tell()))
+        for offsets, blob in sections:
+            f.write(offsets)
+            f.write(blob)
+            f.write(b"\0" * _pad(len(blob)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class MetadataStore:
+    """
+    Metadados do índice mapeados em memória (somente leitura).
+
+    Abrir custa só ler o cabeçalho; cada registro é decodificado quando
+    acessado. Como as páginas vêm do page cache do SO, todos os workers
+    compartilham a mesma cópia. Funciona como uma lista de dicts
+    (len, índice, iteração).
+    """
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            self._mm.close()
+            raise ValueError(f"{path} não é um arquivo de metadados válido")
+        (header_len,) = struct.unpack_from("<Q", self._mm, len(MAGIC))
+        start = len(MAGIC) + 8
+        header = json.loads(bytes(self._mm[start:start + header_len]).decode("utf-8"))
+        self._base = start + header_len + _pad(start + header_len)
+        self.count: int = header["count"]
+        self.fields: List[Dict[str, Any]] = header["fields"]
+        self._offsets = {
+            entry["name"]: np.frombuffer(self._mm, dtype="<u8", count=self.count + 1, offset=self._base + entry["offsets"])
+            for entry in self.fields
+        }
+
+    def __len__(self) -> int:
+        return self.count
+
+    def field(self, position: int, name: str) -> Optional[Any]:
+        """Um campo de um registro, sem decodificar o resto."""
+        entry = next((e for e in self.fields if e["name"] == name), None)
+        if entry is None:
+            return None
+        return self._decode(entry, position)
+
+    def _decode(self, entry: Dict[str, Any], position: int) -> Optional[Any]:
+        offsets = self._offsets[entry["name"]]
+        start, end = int(offsets[position]), int(offsets[position + 1])
+        blob = self._base + entry["blob"]
+        raw = self._mm[blob + start:blob + end]
+        if entry["kind"] == "str":
+            return raw.decode("utf-8")
+        return json.loads(raw.decode("utf-8")) if raw else None
+
+    def __getitem__(self, position: int) -> Dict[str, Any]:
+        if position < 0:
+            position += self.count
+        if not 0 <= position < self.count:
+            raise IndexError(position)
+        record = {}
+        for entry in self.fields:
+            value = self._decode(entry, position)
+            if value is not None or entry["kind"] == "str":
+                record[entry["name"]] = value
+        return record
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for position in range(self.count):
+            yield self[position]
+
+    def close(self):
+        self._offsets = {}
+        self._mm.close()
+
+
+def read_faiss_index(path: str):
+    """
+    Abre o índice FAISS mapeado em memória, para os workers dividirem as
+    páginas. Índices de vetores (Flat, SQ, PQ, HNSW) usam IO_FLAG_MMAP_IFC;
+    os IVF mapeiam as listas invertidas com IO_FLAG_MMAP. Se o mmap não for
+    suportado, lê o arquivo inteiro para a memória.
+    """
+    with open(path, "rb") as f:
+        fourcc = f.read(4)
+    flag = faiss.IO_FLAG_MMAP if fourcc.startswith(b"Iw") else faiss.IO_FLAG_MMAP_IFC
+    try:
+        return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError as e:
+        print(f"RAG: mmap do índice indisponível ({e}). Carregando na memória.")
+        return faiss.read_index(path)
+
+
+# --- Versões do índice ---
+# O build grava tudo numa pasta de staging e publica renomeando a pasta e
+# trocando o CURRENT (os dois são atômicos). Quem está lendo a versão antiga
+# continua lendo: os arquivos só somem quando a pasta é podada, e arquivos
+# apagados continuam acessíveis por quem já os mapeou.
+
+
+def artifact_root(provider: str) -> str:
+    return os.path.join(INDEX_ARTIFACTS_DIR, provider)
+
+
+def version_files(directory: str) -> Dict[str, str]:
+    return {
+        "index": os.path.join(directory, "index.faiss"),
+        "metadata": os.path.join(directory, "index.meta"),
+        "columns": os.path.join(directory, "index.columns.npz"),
+        "passages": os.path.join(directory, "index.passages"),
+        "catalog": os.path.join(directory, "catalog.json"),
+        "manifest": os.path.join(directory, "manifest.json"),
+    }
+
+
+def staging_dir(provider: str) -> str:
+    return os.path.join(artifact_root(provider), "_building")
+
+
+def current_version(provider: str) -> Optional[str]:
+    try:
+        with open(os.path.join(artifact_root(provider), "CURRENT"), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def resolve_index_files(provider: str) -> Tuple[str, Dict[str, str]]:
+    """
+    (versão, arquivos) do índice ativo. Sem versão publicada, usa os arquivos
+    soltos em data/ (layout antigo) como a versão 'legacy'.
+    """
+    version = current_version(provider)
+    if version:
+        return version, version_files(os.path.join(artifact_root(provider), version))
+    files = dict(index_files(provider))
+    files["catalog"] = os.path.join(DATA_DIR, "catalog.json")
+    return LEGACY_VERSION, files
+
+
+def publish_version(provider: str, staging: str, manifest: Dict[str, Any]) -> str:
+    """Transforma a pasta de staging numa versão nova e aponta o CURRENT para ela."""
+    root = artifact_root(provider)
+    version = time.strftime("%Y%m%d-%H%M%S")
+    target = os.path.join(root, version)
+    suffix = 1
+    while os.path.exists(target):
+        target = os.path.join(root, f"{version}-{suffix}")
+        suffix += 1
+    version = os.path.basename(target)
+
+    with open(version_files(staging)["manifest"], "w", encoding="utf-8") as f:
+        json.dump({**manifest, "version": version, "created_at": time.time()}, f, ensure_ascii=False, indent=2)
+    os.rename(staging, target)
+
+    pointer = os.path.join(root, "CURRENT")
+    with open(f"{pointer}.tmp", "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{pointer}.tmp", pointer)
+    prune_versions(provider)
+    return version
+
+
+def list_versions(provider: str) -> List[str]:
+    root = artifact_root(provider)
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        name for name in os.listdir(root)
+        if not name.startswith("_") and os.path.isdir(os.path.join(root, name))
+    )
+
+
+def prune_versions(provider: str, keep: int = INDEX_KEEP_VERSIONS):
+    """Apaga as versões mais antigas, mantendo 'keep' (a ativa nunca é apagada)."""
+    active = current_version(provider)
+    versions = [v for v in list_versions(provider) if v != active]
+    for version in versions[:max(0, len(versions) - max(0, keep - 1))]:
+        shutil.rmtree(os.path.join(artifact_root(provider), version), ignore_errors=True)
@@ -0,0 +1,294 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import threading
+from functools import partial
+from typing import Dict, Any, Optional, List, Callable, Awaitable
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "data")
+INGRESS_DB_FILE = os.getenv("INGRESS_DB_PATH", os.path.join(DATA_DIR, "ingress_queue.db"))
+INGRESS_WORKERS = int(os.getenv("INGRESS_WORKERS", "4"))
+INGRESS_MAX_ATTEMPTS = int(os.getenv("INGRESS_MAX_ATTEMPTS", "3"))
+# Tempo máximo que um item pode ficar "em voo" antes de ser considerado abandonado
+INGRESS_LEASE_SECONDS = float(os.getenv("INGRESS_LEASE_SECONDS", "300"))
+# Intervalo de polling quando a fila está vazia (pega itens gravados por outros processos)
+INGRESS_POLL_INTERVAL = float(os.getenv("INGRESS_POLL_INTERVAL", "1.0"))
+
+
+class IngressQueue:
+    """
+    Fila de entrada persistente em SQLite (modo WAL).
+    O webhook apenas grava o payload bruto e responde à Meta; os workers
+    consomem os itens depois. Itens confirmados (ack) são removidos, itens que
+    falharam voltam para a fila até INGRESS_MAX_ATTEMPTS e depois ficam como 'dead'.
+
+    Nota: no Cloud Run o disco local é efêmero. Para sobreviver à reciclagem da
+    instância, aponte INGRESS_DB_PATH para um volume montado.
+    """
+    def __init__(self, path: str, max_attempts: int = INGRESS_MAX_ATTEMPTS, lease_seconds: float = INGRESS_LEASE_SECONDS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # isolation_level=None: controlamos as transações manualmente
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                enqueued_at REAL NOT NULL,
+                started_at REAL,
+                last_error TEXT,
+                owner INTEGER
+            )
+        """)
+        # Filas criadas antes da coluna owner (PID do processo que reservou o item)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(events)")}
+        if "owner" not in columns:
+            self._conn.execute("ALTER TABLE events ADD COLUMN owner INTEGER")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_events_status ON events (status, id)")
+
+    def enqueue(self, kind: str, payload: str) -> int:
+        """Grava um evento (payload JSON já serializado) no fim da fila."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO events (kind, payload, enqueued_at) VALUES (?, ?, ?)",
+                (kind, payload, time.time())
+            )
+            return cursor.lastrowid
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """
+        Reserva o item mais antigo disponível (pendente ou com lease vencido).
+        Retorna None se a fila estiver vazia.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    """
+                    SELECT id, kind, payload, attempts, enqueued_at FROM events
+                    WHERE status = 'pending' OR (status = 'in_flight' AND started_at < ?)
+                    ORDER BY id LIMIT 1
+                    """,
+                    (now - self.lease_seconds,)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE events SET status = 'in_flight', started_at = ?, attempts = attempts + 1, owner = ? WHERE id = ?",
+                    (now, os.getpid(), row[0])
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        return {
+            "id": row[0],
+            "kind": row[1],
+            "payload": row[2],
+            "attempts": row[3] + 1,
+            "enqueued_at": row[4],
+            "started_at": now
+        }
+
+    def ack(self, item_id: int):
+        """Confirma o processamento e remove o item da fila."""
+        with self._lock:
+            self._conn.execute("DELETE FROM events WHERE id = ?", (item_id,))
+
+    def fail(self, item_id: int, error: str):
+        """Devolve o item para a fila ou o marca como 'dead' se excedeu as tentativas."""
+        with self._lock:
+            self._conn.execute(
+                """
+                UPDATE events
+                SET status = CASE WHEN attempts >= ? THEN 'dead' ELSE 'pending' END,
+                    started_at = NULL, owner = NULL, last_error = ?
+                WHERE id = ?
+                """,
+                (self.max_attempts, error[:500], item_id)
+            )
+
+    def recover(self) -> int:
+        """
+        Recuperação pós-crash: itens que ficaram 'em voo' com um processo que
+        não existe mais (ou com este mesmo PID, de uma execução anterior)
+        voltam a ser pendentes. Itens de workers vivos que compartilham o
+        arquivo continuam com eles; se travarem, o lease devolve o item.
+        """
+        with self._lock:
+            owners = [row[0] for row in self._conn.execute(
+                "SELECT DISTINCT owner FROM events WHERE status = 'in_flight'"
+            )]
+            orphaned = [owner for owner in owners if owner is None or owner == os.getpid() or not _process_alive(owner)]
+            recovered = 0
+            for owner in orphaned:
+                cursor = self._conn.execute(
+                    "UPDATE events SET status = 'pending', started_at = NULL, owner = NULL WHERE status = 'in_flight' AND owner IS ?",
+                    (owner,)
+                )
+                recovered += cursor.rowcount
+            return recovered
+
+    def stats(self) -> Dict[str, Any]:
+        """Profundidade da fila, itens em voo, itens mortos e idade do item mais antigo."""
+        now = time.time()
+        with self._lock:
+            counts = dict(self._conn.execute(
+                "SELECT status, COUNT(*) FROM events GROUP BY status"
+            ).fetchall())
+            oldest = self._conn.execute(
+                "SELECT MIN(enqueued_at) FROM events WHERE status = 'pending'"
+            ).fetchone()[0]
+        return {
+            "depth": counts.get("pending", 0),
+            "in_flight": counts.get("in_flight", 0),
+            "dead": counts.get("dead", 0),
+            "oldest_pending_age": round(now - oldest, 3) if oldest else 0.0
+        }
+
+
+def _process_alive(pid: int) -> bool:
+    """True se existe um processo com este PID na máquina."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class IngressWorkerPool:
+    """
+    Pool de workers asyncio que drena a IngressQueue.
+    Cada tipo de evento ('kind') é despachado para o handler registrado.
+
+    O handler recebe (payload, redelivery) e pode devolver um Future com o
+    restante do trabalho (ex: turnos do coalescer ainda sendo gerados). Nesse
+    caso o worker já pega o próximo evento e o item só recebe ack/fail quando
+    o Future terminar; até lá ele segue 'em voo' na fila.
+    """
+    def __init__(self, queue: IngressQueue, handlers: Dict[str, Callable[[Dict[str, Any], bool], Awaitable[Optional[asyncio.Future]]]], workers: int = INGRESS_WORKERS):
+        self.queue = queue
+        self.handlers = handlers
+        self.workers = max(1, workers)
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._in_flight: Dict[int, Dict[str, Any]] = {}
+        self.processed = 0
+        self.failed = 0
+
+    async def start(self):
+        """Recupera itens órfãos de um crash anterior e sobe os workers."""
+        recovered = self.queue.recover()
+        if recovered:
+            print(f"♻️ INGRESS: {recovered} evento(s) recuperado(s) após reinício.")
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+        print(f"INGRESS: {self.workers} worker(s) iniciados. Fila: {self.queue.stats()}")
+
+    async def stop(self):
+        """Cancela os workers. Itens em voo continuam na fila e serão recuperados no próximo start."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """Acorda os workers ociosos (chamado logo após um enqueue)."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _worker(self, worker_id: int):
+        while True:
+            item = self.queue.claim()
+            if item is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=INGRESS_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._in_flight[item["id"]] = {"worker": worker_id, **item}
+            pending = None
+            try:
+                handler = self.handlers.get(item["kind"])
+                if handler is None:
+                    raise ValueError(f"Nenhum handler para o evento '{item['kind']}'")
+                pending = await handler(json.loads(item["payload"]), item["attempts"] > 1)
+                if pending is None:
+                    self._settle(item, None)
+            except asyncio.CancelledError:
+                # Shutdown: o item fica 'em voo' e será recuperado no próximo start
+                self._in_flight.pop(item["id"], None)
+                raise
+            except Exception as e:
+                self._settle(item, e)
+            if pending is not None:
+                # Entrega em andamento: ack/fail quando ela terminar, sem prender este worker
+                self._in_flight[item["id"]]["worker"] = None
+                pending.add_done_callback(partial(self._settle_pending, item))
+
+    def _settle_pending(self, item: Dict[str, Any], pending: asyncio.Future):
+        if pending.cancelled():
+            # Shutdown: o item fica 'em voo' e será recuperado no próximo start
+            self._in_flight.pop(item["id"], None)
+            return
+        self._settle(item, pending.exception())
+
+    def _settle(self, item: Dict[str, Any], error: Optional[BaseException]):
+        """ack se deu certo; senão fail (volta para a fila ou vira 'dead')."""
+        self._in_flight.pop(item["id"], None)
+        if error is None:
+            self.queue.ack(item["id"])
+            self.processed += 1
+            return
+        print(f"❌ INGRESS: Falha no evento {item['id']} (tentativa {item['attempts']}): {error}")
+        self.queue.fail(item["id"], str(error))
+        self.failed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas da fila + itens em processamento com suas idades."""
+        now = time.time()
+        return {
+            **self.queue.stats(),
+            "workers": self.workers,
+            "processed": self.processed,
+            "failed": self.failed,
+            # Já liberados pelo worker, esperando a entrega da resposta para o ack
+            "awaiting_delivery": sum(1 for info in list(self._in_flight.values()) if info["worker"] is None),
+            "in_flight_items": [
+                {
+                    "id": item_id,
+                    "kind": info["kind"],
+                    "worker": info["worker"],
+                    "attempts": info["attempts"],
+                    "age": round(now - info["enqueued_at"], 3),
+                    "running_for": round(now - info["started_at"], 3)
+                }
+                for item_id, info in list(self._in_flight.items())
+            ]
+        }
+
+
+# Instância global
+ingress_queue = IngressQueue(INGRESS_DB_FILE)
@@ -0,0 +1,135 @@
+import re
+import math
+from collections import Counter
+from typing import List, Dict, Any, Tuple, Iterable, Optional
+
+from app.core.text_utils import normalize_text, tokenize
+
+# Palavras vazias do português (já sem acento, como sai do normalize_text)
+PT_STOPWORDS = {
+    "a", "ao", "aos", "as", "com", "como", "da", "das", "de", "do", "dos", "e", "em", "na", "nas",
+    "no", "nos", "o", "os", "ou", "para", "pra", "pro", "pelo", "pela", "por", "que", "se", "sem",
+    "um", "uma", "uns", "umas", "eu", "voce", "voces", "me", "meu", "minha", "nosso", "nossa",
+    "ele", "ela", "eles", "elas", "isso", "esse", "essa", "este", "esta", "ai", "la", "tem",
+    "ter", "quero", "queria", "gostaria", "saber", "sobre", "qual", "quais", "quanto", "quando",
+    "onde", "ola", "oi", "bom", "boa", "dia", "tarde", "noite", "tudo", "bem", "vcs", "vc", "q",
+    "h", "ate", "mais", "muito", "ja", "so", "nao", "sim", "ha", "sao", "foi", "ser", "vai",
+}
+
+# Campos do pacote e seus pesos (o título conta mais que a descrição)
+FIELD_WEIGHTS = {
+    "title": 3,
+    "embarques": 2,
+    "description": 1,
+    "roteiro": 1,
+    "inclusoes": 1,
+}
+
+# "28/11", "28/11/2025", "28-11" -> termo "28/11"
+_DATE_RE = re.compile(r"\b(\d{1,2})\s*[/-]\s*(\d{1,2})(?:\s*[/-]\s*\d{2,4})?\b")
+
+# Sufixos removidos pelo stemmer leve (do mais longo para o mais curto)
+_SUFFIXES = (
+    ("oes", "ao"), ("aes", "ao"), ("ais", "al"), ("eis", "el"), ("ois", "ol"),
+    ("inhas", "a"), ("inhos", "o"), ("inha", "a"), ("inho", "o"),
+    ("ns", "m"), ("res", "r"), ("zes", "z"), ("s", ""),
+)
+
+
+def light_stem(token: str) -> str:
+    """
+    Stemmer leve para português: plural e diminutivo ("passeios" -> "passeio",
+    "pousadinha" -> "pousada", "excursões" -> "excursao"). Palavras curtas
+    (como siglas e nomes de cidades) ficam intactas.
+    """
+    if len(token) <= 3 or token.isdigit():
+        return token
+    for suffix, replacement in _SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)] + replacement
+    return token
+
+
+def analyze(text: str) -> List[str]:
+    """Texto -> termos do índice: sem acento, sem palavras vazias, com stem e datas dd/mm."""
+    normalized = normalize_text(text)
+    terms = [f"{int(day):02d}/{int(month):02d}" for day, month in _DATE_RE.findall(normalized)]
+    for token in tokenize(_DATE_RE.sub(" ", normalized)):
+        if token in PT_STOPWORDS:
+            continue
+        terms.append(light_stem(token))
+    return terms
+
+
+def _field_text(value: Any) -> str:
+    if isinstance(value, (list, tuple)):
+        return " ".join(str(v) for v in value)
+    return str(value or "")
+
+
+def item_terms(item: Dict[str, Any]) -> List[str]:
+    """Termos de um pacote do catálogo, repetidos conforme o peso do campo."""
+    terms = []
+    for field, weight in FIELD_WEIGHTS.items():
+        terms.extend(analyze(_field_text(item.get(field))) * weight)
+    return terms
+
+
+class BM25Index:
+    """
+    Índice invertido em memória com ranking BM25 sobre o catálogo.
+
+    Acerta na hora o que a busca densa costuma perder: nomes exatos de
+    destino, cidades de embarque e datas ("28/11"). Não depende de rede,
+    então continua funcionando com o backend de embeddings fora do ar.
+    """
+    def __init__(self, documents: Iterable[List[str]], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.doc_lengths: List[int] = []
+        for doc_id, terms in enumerate(documents):
+            self.doc_lengths.append(len(terms))
+            for term, freq in Counter(terms).items():
+                self.postings.setdefault(term, []).append((doc_id, freq))
+        self.size = len(self.doc_lengths)
+        self.avg_length = (sum(self.doc_lengths) / self.size) if self.size else 0.0
+        self.idf = {
+            term: math.log(1 + (self.size - len(posts) + 0.5) / (len(posts) + 0.5))
+            for term, posts in self.postings.items()
+        }
+
+    @classmethod
+    def from_items(cls, items: List[Dict[str, Any]]) -> "BM25Index":
+        return cls(item_terms(item) for item in items)
+
+    def search(self, query: str, k: int = 10, allowed: Optional[Iterable[int]] = None) -> List[Tuple[int, float]]:
+        """
+        Os k documentos com maior pontuação BM25: [(doc_id, score)].
+        'allowed' restringe a busca a um subconjunto (pré-filtro de metadados).
+        """
+        allowed_set = None if allowed is None else {int(doc_id) for doc_id in allowed}
+        scores: Dict[int, float] = {}
+        for term in set(analyze(query)):
+            posts = self.postings.get(term)
+            if not posts:
+                continue
+            idf = self.idf[term]
+            for doc_id, freq in posts:
+                if allowed_set is not None and doc_id not in allowed_set:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / self.avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * freq * (self.k1 + 1) / (freq + norm)
+        return sorted(scores.items(), key=lambda pair: pair[1], reverse=True)[:k]
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """
+    Junta rankings diferentes (denso e lexical) pela posição, sem precisar
+    calibrar distâncias do FAISS contra pontuações BM25: score = soma de 1/(k + posição).
+    """
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for position, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + position)
+    return sorted(scores.items(), key=lambda pair: pair[1], reverse=True)
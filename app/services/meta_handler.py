@@ -1,12 +1,47 @@
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple, Callable, Awaitable, AsyncIterator
+from functools import partial
 import asyncio
 import os
 import tempfile
 from app.services.meta_client import MetaClient
-from app.core.brain import process_user_intent
+from app.core.brain import process_user_intent, stream_user_intent
+from app.core.scheduler import scheduler
+from app.core.coalescer import coalescer
+from app.core.llm_gateway import llm_gateway
+from app.services.dedup_store import dedup_store
 
 meta_client = MetaClient()
 
+# Envia cada balão assim que o Gemini fecha o segmento "|||" (false = espera a resposta inteira)
+STREAMING_REPLIES = os.getenv("STREAMING_REPLIES", "true").lower() == "true"
+
+
+def initial_typing_delay(first_message: str) -> float:
+    """Delay de "pensando" antes da primeira mensagem."""
+    # Cálculo dinâmico mais realista: 50ms a 100ms por caractere da primeira mensagem
+    initial_delay = min(4.0, len(first_message) * 0.08) # Teto de 4s para começar
+    return max(1.5, initial_delay) # Mínimo de 1.5s de "pensando"
+
+
+def typing_delay(message: str) -> float:
+    """Delay de digitação entre mensagens, baseado no tamanho da mensagem atual."""
+    # Velocidade média de digitação: ~5 a 8 caracteres por segundo
+    # 50 chars = ~6 a 10 segundos.
+    # Vamos usar um fator de 0.15s por char + base de 1.0s
+    delay = 1.0 + (len(message) * 0.12)
+    
+    # Cap (limites) para não ficar eterno
+    return max(2.0, min(delay, 6.0))
+
+
+async def send_text(message: str, user_id: str, channel: str):
+    """Envia um balão de texto pelo canal correto."""
+    if channel == 'whatsapp':
+        await meta_client.send_whatsapp_message(user_id, message)
+    elif channel.startswith('instagram'):
+        await meta_client.send_instagram_message(user_id, message)
+    
+    print(f"[{channel.upper()}] Enviado para {user_id}: {message}")
 
 
 async def send_messages_with_delay(messages: List[str], user_id: str, channel: str):
@@ -17,183 +52,353 @@ async def send_messages_with_delay(messages: List[str], user_id: str, channel: s
     if channel == 'whatsapp':
         await meta_client.send_whatsapp_typing_action(user_id)
     
-    # Cálculo dinâmico mais realista: 50ms a 100ms por caractere da primeira mensagem
-    initial_delay = 0.0
-    if messages:
-        initial_delay = min(4.0, len(messages[0]) * 0.08) # Teto de 4s para começar
-    
-    initial_delay = max(1.5, initial_delay) # Mínimo de 1.5s de "pensando"
+    initial_delay = initial_typing_delay(messages[0]) if messages else 1.5
     
     print(f"Plan de Envio ({len(messages)} msgs). Delay Inicial: {initial_delay:.2f}s")
     await asyncio.sleep(initial_delay)
 
     for idx, message in enumerate(messages):
-        # Simula delay de digitação entre mensagens (baseado no tamanho da PRÓXIMA mensagem ou da atual)
         # Se houver mensagem anterior, esperamos o tempo que levaria para digitar a ATUAL
         if idx > 0:
-            # Velocidade média de digitação: ~5 a 8 caracteres por segundo
-            # 50 chars = ~6 a 10 segundos.
-            # Vamos usar um fator de 0.15s por char + base de 1.0s
-            delay = 1.0 + (len(message) * 0.12)
-            
-            # Cap (limites) para não ficar eterno
-            delay = max(2.0, min(delay, 6.0)) 
-            
+            delay = typing_delay(message)
             print(f"Digitando mensagem {idx+1}/{len(messages)}... (Delay: {delay:.2f}s)")
             await asyncio.sleep(delay)
         
-        # Envia via MetaClient
-        if channel == 'whatsapp':
-            await meta_client.send_whatsapp_message(user_id, message)
-        elif channel.startswith('instagram'):
-            await meta_client.send_instagram_message(user_id, message)
-        
-        print(f"[{channel.upper()}] Enviado para {user_id}: {message}")
+        await send_text(message, user_id, channel)
+
+
+async def send_stream_with_delay(first: str, segments: asyncio.Queue, user_id: str, channel: str, started_at: float):
+    """
+    Envia balões vindos do streaming conforme ficam prontos.
+    O tempo de "digitação" é contado a partir do início do turno (e do último
+    envio), então ele corre em paralelo com a geração em vez de somar depois dela.
+    """
+    loop = asyncio.get_running_loop()
+    if channel == 'whatsapp':
+        await meta_client.send_whatsapp_typing_action(user_id)
+
+    wait = started_at + initial_typing_delay(first) - loop.time()
+    print(f"Streaming: primeiro balão pronto em {loop.time() - started_at:.2f}s. Espera restante: {max(0.0, wait):.2f}s")
+    if wait > 0:
+        await asyncio.sleep(wait)
+    await send_text(first, user_id, channel)
+    last_sent = loop.time()
+
+    while True:
+        message = await segments.get()
+        if message is None:
+            break
+        wait = last_sent + typing_delay(message) - loop.time()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        await send_text(message, user_id, channel)
+        last_sent = loop.time()
+
+
+async def _pump_segments(stream: AsyncIterator[str], segments: asyncio.Queue):
+    """Consome o streaming do Gemini em paralelo ao envio; None marca o fim."""
+    try:
+        async for segment in stream:
+            segments.put_nowait(segment)
+    finally:
+        segments.put_nowait(None)
+
+
+async def generate_streamed_reply(user_text: str, user_id: str, channel: str) -> Dict[str, Any]:
+    """
+    Fase de geração no modo streaming: inicia o streaming e espera só o primeiro
+    balão. Até aqui o turno ainda pode ser cancelado pelo coalescer; o restante
+    continua sendo gerado enquanto deliver_reply envia.
+    """
+    loop = asyncio.get_running_loop()
+    started_at = loop.time()
+    segments: asyncio.Queue = asyncio.Queue()
+    producer = asyncio.create_task(_pump_segments(stream_user_intent(user_text, user_id, channel), segments))
+    try:
+        first = await segments.get()
+    except asyncio.CancelledError:
+        producer.cancel()
+        raise
 
-# Cache simples em memória para deduplicação (Message ID -> Timestamp)
-PROCESSED_MESSAGES = {}
+    if first is None:
+        # Usuário pausado ou resposta vazia
+        return {"messages": []}
+    return {"first": first, "segments": segments, "producer": producer, "started_at": started_at}
 
-async def handle_whatsapp_event(payload: Dict[str, Any]):
+
+async def generate_reply(user_text: str, user_id: str, channel: str) -> Dict[str, Any]:
+    """Fase de geração usada pelo coalescer (streaming ou resposta inteira)."""
+    if STREAMING_REPLIES:
+        return await generate_streamed_reply(user_text, user_id, channel)
+    return await process_user_intent(user_text, user_id, channel)
+
+
+async def deliver_reply(result: Dict[str, Any], user_id: str, channel: str):
+    """
+    Entrega o resultado da geração: textos com delay (ou em streaming) e depois imagens.
+    """
+    messages = result.get('messages', [])
+    images = result.get('images', [])
+
+    if 'segments' in result:
+        # Modo streaming: balões saem conforme o Gemini termina cada segmento
+        try:
+            await send_stream_with_delay(result['first'], result['segments'], user_id, channel, result['started_at'])
+        finally:
+            result['producer'].cancel()
+    else:
+        # Envia as mensagens com delay
+        await send_messages_with_delay(messages, user_id, channel)
+
+    # Envia imagens (se houver) APÓS as mensagens de texto
+    # Isso garante que o contexto textual chegue antes da foto
+    if images and channel == 'whatsapp':
+        for img_url in images:
+            print(f"Enviando imagem para {user_id}: {img_url}")
+            await meta_client.send_whatsapp_image(user_id, img_url)
+            # Pequeno delay entre imagem e próxima ação (se houvesse)
+            await asyncio.sleep(1)
+
+async def dispatch_by_user(jobs: List[Tuple[str, Callable[[], Awaitable[Any]]]]) -> Optional[asyncio.Future]:
+    """
+    Fan-out de um payload: cada job vai para a caixa de mensagens do seu usuário
+    no scheduler. Usuários diferentes rodam em paralelo e o mesmo usuário é
+    atendido em ordem, inclusive entre payloads diferentes.
+
+    Retorna assim que cada mensagem foi entregue ao coalescer, sem prender o
+    worker da fila enquanto o usuário digita ou o Gemini responde. Se houver
+    turnos em andamento, devolve um Future que termina quando todos forem
+    entregues (ou falha se algum job ou turno falhou): o worker só confirma o
+    evento na fila nesse momento. Sem turnos, falhas são levantadas na hora.
+    """
+    futures = [scheduler.submit(user_key, job) for user_key, job in jobs]
+    results = await asyncio.gather(*futures, return_exceptions=True)
+
+    failures = []
+    turns = []
+    for (user_key, _), result in zip(jobs, results):
+        if isinstance(result, Exception):
+            # Um erro em uma mensagem não pode derrubar as demais do lote
+            print(f"❌ Erro ao processar mensagem de {user_key}: {result}")
+            failures.append(f"{user_key}: {result}")
+        elif isinstance(result, asyncio.Future):
+            # Jobs de texto devolvem o Future do turno no coalescer
+            turns.append((user_key, result))
+
+    if turns:
+        return asyncio.ensure_future(_await_turns(turns, failures, len(jobs)))
+    if failures:
+        # Só depois do fan-out: o worker da fila marca o evento como falho e ele é
+        # tentado de novo (as mensagens já atendidas são puladas pela deduplicação)
+        raise RuntimeError(f"{len(failures)} de {len(jobs)} mensagem(ns) falharam: {'; '.join(failures)}")
+    return None
+
+
+async def _await_turns(turns: List[Tuple[str, asyncio.Future]], failures: List[str], total: int):
+    """Espera a entrega dos turnos do payload; qualquer falha (ou cancelamento) vira erro do evento."""
+    results = await asyncio.gather(*(turn for _, turn in turns), return_exceptions=True)
+    for (user_key, _), result in zip(turns, results):
+        if isinstance(result, BaseException):
+            error = result if not isinstance(result, asyncio.CancelledError) else "turno cancelado"
+            print(f"❌ Erro ao entregar resposta para {user_key}: {error}")
+            failures.append(f"{user_key}: {error}")
+    if failures:
+        raise RuntimeError(f"{len(failures)} de {total} mensagem(ns) falharam: {'; '.join(failures)}")
+
+
+def _settle_message_id(message_id: str, turn: asyncio.Future):
+    """Turno entregue: confirma o ID. Falhou ou foi cancelado: libera o ID para a nova tentativa da fila."""
+    if not turn.cancelled() and turn.exception() is None:
+        dedup_store.confirm(message_id)
+    else:
+        dedup_store.forget(message_id)
+
+
+async def handle_whatsapp_event(payload: Dict[str, Any], redelivery: bool = False) -> Optional[asyncio.Future]:
     """
     Processa eventos recebidos do WhatsApp Business API.
+    A Meta pode agrupar várias entradas/mudanças/mensagens no mesmo POST,
+    então percorremos todas elas e despachamos por usuário.
+    redelivery=True quando a fila entrega o evento de novo (falha ou reinício):
+    mensagens que ficaram sem resposta são processadas outra vez.
     """
     print("Handling WhatsApp Event")
+    jobs = []
+    for entry in payload.get('entry', []):
+        for change in entry.get('changes', []):
+            value = change.get('value', {})
+            for message in value.get('messages', []):
+                user_key = f"whatsapp:{message.get('from')}"
+                jobs.append((user_key, partial(process_whatsapp_message, message, redelivery)))
+
+    if len(jobs) > 1:
+        print(f"📬 Payload com {len(jobs)} mensagens. Despachando em paralelo por usuário.")
+    return await dispatch_by_user(jobs)
+
+
+async def process_whatsapp_message(message: Dict[str, Any], redelivery: bool = False):
+    """
+    Processa uma única mensagem do WhatsApp (texto ou áudio).
+    """
     try:
-        entry = payload.get('entry', [])[0]
-        changes = entry.get('changes', [])[0]
-        value = changes.get('value', {})
-        
-        if 'messages' in value:
-            message = value['messages'][0]
-            message_id = message.get('id')
-            
-            # 1. Deduplicação
-            if message_id in PROCESSED_MESSAGES:
-                print(f"🔄 Mensagem duplicada ignorada: {message_id}")
-                return
-            
-            # Marca como processada
-            PROCESSED_MESSAGES[message_id] = True
-            
-            # Limpeza simples do cache (se crescer muito)
-            if len(PROCESSED_MESSAGES) > 1000:
-                PROCESSED_MESSAGES.clear()
-
-            user_id = message['from']
-            msg_type = message.get('type')
-            
-            print(f"📩 Mensagem recebida. Tipo: {msg_type}")
-            print(f"📦 Payload da mensagem: {message}")
-            
-            text_to_process = ""
-
-            if msg_type == 'text':
-                text_to_process = message.get('text', {}).get('body', '')
-            
-            elif msg_type == 'audio':
-                audio_id = message.get('audio', {}).get('id')
-                if audio_id:
-                    print(f"🎧 Áudio recebido (ID: {audio_id}). Buscando URL...")
-                    
-                    # 1. Obtém URL de download
-                    audio_url = await meta_client.get_media_url(audio_id)
-                    print(f"🔗 URL do Áudio: {audio_url}")
-                    
-                    if audio_url:
-                        # 2. Baixa o áudio (bytes)
-                        print("⬇️ Baixando áudio...")
-                        audio_bytes = await meta_client.download_media(audio_url)
-                        
-                        if audio_bytes:
-                            print(f"✅ Áudio baixado: {len(audio_bytes)} bytes. Salvando temp...")
-                            # 3. Salva em arquivo temporário para o Gemini processar
-                            import tempfile
-                            from app.services.audio_service import audio_service
-                            
-                            with tempfile.NamedTemporaryFile(suffix=".ogg", delete=False) as temp_audio:
-                                temp_audio.write(audio_bytes)
-                                temp_path = temp_audio.name
-                            
-                            print(f"📁 Arquivo temp salvo: {temp_path}. Transcrevendo...")
-                            # 4. Transcreve
-                            transcription = audio_service.transcribe_audio(temp_path)
-                            print(f"📝 Transcrição Resultante: {transcription}")
-                            
-                            # 5. Adiciona prefixo para o Brain saber que é áudio
-                            text_to_process = f"[TRANSCRIÇÃO DE ÁUDIO]: {transcription}"
-                        else:
-                            print("❌ Falha crítica: Download retornou bytes vazios.")
-                            await send_messages_with_delay(
-                                ["Tive um problema técnico para ouvir seu áudio.", "Pode escrever para mim?"],
-                                user_id, 'whatsapp'
+        message_id = message.get('id')
+
+        # 1. Deduplicação (checa e marca como pendente até a resposta sair)
+        if message_id and dedup_store.seen(message_id, reclaim=redelivery):
+            print(f"🔄 Mensagem duplicada ignorada: {message_id}")
+            return
+
+        user_id = message['from']
+        msg_type = message.get('type')
+
+        print(f"📩 Mensagem recebida. Tipo: {msg_type}")
+        print(f"📦 Payload da mensagem: {message}")
+
+        text_to_process = ""
+
+        if msg_type == 'text':
+            text_to_process = message.get('text', {}).get('body', '')
+
+        elif msg_type == 'audio':
+            audio_id = message.get('audio', {}).get('id')
+            if audio_id:
+                print(f"🎧 Áudio recebido (ID: {audio_id}). Buscando URL...")
+
+                # 1. Obtém URL de download
+                audio_url = await meta_client.get_media_url(audio_id)
+                print(f"🔗 URL do Áudio: {audio_url}")
+
+                if audio_url:
+                    # 2. Baixa o áudio (bytes)
+                    print("⬇️ Baixando áudio...")
+                    audio_bytes = await meta_client.download_media(audio_url)
+
+                    if audio_bytes:
+                        print(f"✅ Áudio baixado: {len(audio_bytes)} bytes. Salvando temp...")
+                        # 3. Salva em arquivo temporário para o Gemini processar
+                        from app.services.audio_service import audio_service, AUDIO_MODEL, AUDIO_TOKENS_ESTIMATE
+
+                        with tempfile.NamedTemporaryFile(suffix=".ogg", delete=False) as temp_audio:
+                            temp_audio.write(audio_bytes)
+                            temp_path = temp_audio.name
+
+                        print(f"📁 Arquivo temp salvo: {temp_path}. Transcrevendo...")
+                        # 4. Transcreve (SDK síncrono: roda numa thread, dentro de uma vaga do gateway)
+                        try:
+                            transcription = await llm_gateway.run_sync(
+                                AUDIO_MODEL, 'whatsapp', AUDIO_TOKENS_ESTIMATE,
+                                audio_service.transcribe_audio, temp_path
                             )
+                        except asyncio.TimeoutError:
+                            os.unlink(temp_path)
+                            transcription = "Desculpe, não consegui ouvir seu áudio."
+                        print(f"📝 Transcrição Resultante: {transcription}")
+
+                        # 5. Adiciona prefixo para o Brain saber que é áudio
+                        text_to_process = f"[TRANSCRIÇÃO DE ÁUDIO]: {transcription}"
                     else:
-                        print("❌ Falha ao obter URL do áudio.")
+                        print("❌ Falha crítica: Download retornou bytes vazios.")
                         await send_messages_with_delay(
-                            ["Não consegui carregar seu áudio.", "Pode digitar por favor?"],
+                            ["Tive um problema técnico para ouvir seu áudio.", "Pode escrever para mim?"],
                             user_id, 'whatsapp'
                         )
-            
-            if text_to_process:
-                result = await process_user_intent(text_to_process, user_id, 'whatsapp')
-                messages = result.get('messages', [])
-                images = result.get('images', [])
-
-                # Envia as mensagens com delay
-                await send_messages_with_delay(messages, user_id, 'whatsapp')
-                
-                # Envia imagens (se houver) APÓS as mensagens de texto
-                # Isso garante que o contexto textual chegue antes da foto
-                if images:
-                    for img_url in images:
-                        print(f"Enviando imagem para {user_id}: {img_url}")
-                        await meta_client.send_whatsapp_image(user_id, img_url)
-                        # Pequeno delay entre imagem e próxima ação (se houvesse)
-                        await asyncio.sleep(1)
-                
+                else:
+                    print("❌ Falha ao obter URL do áudio.")
+                    await send_messages_with_delay(
+                        ["Não consegui carregar seu áudio.", "Pode digitar por favor?"],
+                        user_id, 'whatsapp'
+                    )
+
+        if text_to_process:
+            # Entrega ao coalescer: mensagens em rajada viram um único turno
+            turn = coalescer.add(
+                f"whatsapp:{user_id}",
+                text_to_process,
+                partial(generate_reply, user_id=user_id, channel='whatsapp'),
+                partial(deliver_reply, user_id=user_id, channel='whatsapp')
+            )
+            if message_id:
+                turn.add_done_callback(partial(_settle_message_id, message_id))
+            return turn
+
+        if message_id:
+            dedup_store.confirm(message_id)
+
     except (IndexError, KeyError) as e:
         print(f"Erro ao processar payload do WhatsApp: {e}")
+        if message.get('id'):
+            # Payload malformado: outra tentativa não adianta
+            dedup_store.confirm(message['id'])
+    except Exception:
+        # Falha de verdade (Meta, transcrição...): libera o ID para a nova tentativa da fila
+        if message.get('id'):
+            dedup_store.forget(message['id'])
+        raise
 
 
-async def handle_instagram_event(payload: Dict[str, Any]):
+async def handle_instagram_event(payload: Dict[str, Any], redelivery: bool = False) -> Optional[asyncio.Future]:
     """
     Processa eventos recebidos da Instagram Graph API.
     Diferencia entre Mensagens Diretas (DM) e Comentários.
+    Todas as entradas do payload são percorridas e despachadas por usuário.
     """
     print("Handling Instagram Event")
-    try:
-        entry = payload.get('entry', [])[0]
-        
-        if 'messaging' in entry:
-            # Direct Message
-            messaging_event = entry['messaging'][0]
+    jobs = []
+    for entry in payload.get('entry', []):
+        # Direct Messages
+        for messaging_event in entry.get('messaging', []):
             sender_id = messaging_event.get('sender', {}).get('id')
-            message = messaging_event.get('message', {})
-            text = message.get('text', '')
-            
-            if text:
-                result = await process_user_intent(text, sender_id, 'instagram_dm')
+            jobs.append((f"instagram:{sender_id}", partial(process_instagram_dm, messaging_event)))
+
+        # Feed comments
+        for change in entry.get('changes', []):
+            user_id = change.get('value', {}).get('from', {}).get('id')
+            jobs.append((f"instagram:{user_id}", partial(process_instagram_comment, change)))
+
+    return await dispatch_by_user(jobs)
+
+
+async def process_instagram_dm(messaging_event: Dict[str, Any]):
+    """
+    Processa uma mensagem direta (DM) do Instagram.
+    """
+    try:
+        sender_id = messaging_event.get('sender', {}).get('id')
+        message = messaging_event.get('message', {})
+        text = message.get('text', '')
+
+        if text:
+            return coalescer.add(
+                f"instagram:{sender_id}",
+                text,
+                partial(generate_reply, user_id=sender_id, channel='instagram_dm'),
+                partial(deliver_reply, user_id=sender_id, channel='instagram_dm')
+            )
+
+    except (IndexError, KeyError) as e:
+        print(f"Erro ao processar payload do Instagram: {e}")
+
+
+async def process_instagram_comment(change: Dict[str, Any]):
+    """
+    Processa um comentário no feed do Instagram.
+    """
+    try:
+        field = change.get('field')
+        value = change.get('value', {})
+
+        if field == 'comments':
+            text = value.get('text', '')
+            from_user = value.get('from', {})
+            user_id = from_user.get('id')
+
+            # Palavras-chave para gatilho
+            keywords = ["preço", "eu quero", "valor", "info"]
+            if any(keyword in text.lower() for keyword in keywords):
+                print(f"Comentário de interesse detectado: {text}")
+                result = await process_user_intent(text, user_id, 'instagram_comment')
                 messages = result.get('messages', [])
-                await send_messages_with_delay(messages, sender_id, 'instagram_dm')
-                
-        elif 'changes' in entry:
-            # Feed comments
-            changes = entry['changes'][0]
-            field = changes.get('field')
-            value = changes.get('value', {})
-            
-            if field == 'comments':
-                text = value.get('text', '')
-                from_user = value.get('from', {})
-                user_id = from_user.get('id')
-                
-                # Palavras-chave para gatilho
-                keywords = ["preço", "eu quero", "valor", "info"]
-                if any(keyword in text.lower() for keyword in keywords):
-                    print(f"Comentário de interesse detectado: {text}")
-                    result = await process_user_intent(text, user_id, 'instagram_comment')
-                    messages = result.get('messages', [])
-                    await send_messages_with_delay(messages, user_id, 'instagram_comment')
-                    
+                await send_messages_with_delay(messages, user_id, 'instagram_comment')
+
     except (IndexError, KeyError) as e:
         print(f"Erro ao processar payload do Instagram: {e}")
@@ -0,0 +1,105 @@
+import os
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Micro-batching das buscas concorrentes no RAG
+RAG_BATCHING = os.getenv("RAG_BATCHING", "true").lower() not in ("0", "false", "no")
+# Quanto (ms) o primeiro pedido espera por companhia antes de o lote sair
+RAG_BATCH_WINDOW_MS = float(os.getenv("RAG_BATCH_WINDOW_MS", "5"))
+# Lote cheio sai na hora, sem esperar a janela
+RAG_BATCH_MAX_SIZE = int(os.getenv("RAG_BATCH_MAX_SIZE", "32"))
+
+
+class MicroBatcher:
+    """
+    Junta pedidos concorrentes num lote só.
+
+    O primeiro pedido abre uma janela de RAG_BATCH_WINDOW_MS; o que chegar
+    nela entra no mesmo lote, que sai quando a janela fecha ou quando junta
+    RAG_BATCH_MAX_SIZE pedidos. run_batch recebe a lista de itens e devolve a
+    lista de resultados na mesma ordem; cada chamador recebe o seu.
+
+    Quem desistiu (prazo estourado) antes de o lote sair não entra nele; se
+    desistir depois, o resultado é descartado. Um erro no lote chega a todos
+    os chamadores do lote.
+    """
+    def __init__(
+        self,
+        name: str,
+        run_batch: Callable[[List[Any]], Awaitable[List[Any]]],
+        window_ms: float = RAG_BATCH_WINDOW_MS,
+        max_size: int = RAG_BATCH_MAX_SIZE
+    ):
+        self.name = name
+        self.run_batch = run_batch
+        self.window = window_ms / 1000
+        self.max_size = max(1, max_size)
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._running: Set[asyncio.Task] = set()
+        self.requests = 0
+        self.batches = 0
+        self.batched_items = 0
+        self.max_batch = 0
+        self.errors = 0
+        self.total_batch_ms = 0.0
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.requests += 1
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]):
+        live = [(item, future) for item, future in batch if not future.done()]
+        if not live:
+            return
+        started = time.perf_counter()
+        try:
+            results = await self.run_batch([item for item, _ in live])
+        except Exception as e:
+            self.errors += 1
+            for _, future in live:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.batches += 1
+            self.batched_items += len(live)
+            self.max_batch = max(self.max_batch, len(live))
+            self.total_batch_ms += (time.perf_counter() - started) * 1000
+
+        for (_, future), result in zip(live, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "avg_batch_size": round(self.batched_items / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_batch,
+            "avg_batch_ms": round(self.total_batch_ms / self.batches, 2) if self.batches else 0.0,
+            "errors": self.errors,
+            "window_ms": self.window * 1000,
+            "max_size": self.max_size,
+        }
@@ -1,74 +1,637 @@
 import os
-import pickle
-import faiss
+import json
+import time
+import asyncio
 import numpy as np
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Tuple
 from dotenv import load_dotenv
 
+from app.core.llm_gateway import llm_gateway, PRIORITIES, DEFAULT_PRIORITY
+from app.core.text_utils import estimate_tokens
+from app.services.embedding_cache import get_embedding_cache
+from app.services.embedding_provider import get_embedding_provider, EMBEDDING_PROVIDER
+from app.services.lexical_index import BM25Index, analyze, reciprocal_rank_fusion
+from app.services.catalog_index import CatalogColumns, package_key
+from app.services.diversity import RAG_DIVERSITY, mmr, collapse_departures, departure_order, is_upcoming
+from app.services.index_store import MetadataStore, read_faiss_index, resolve_index_files
+from app.services.ann_index import configure_search, describe, search_subset
+from app.services.query_batcher import MicroBatcher, RAG_BATCHING
+
 load_dotenv()
 
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "data")
-INDEX_FILE = os.path.join(DATA_DIR, "index.faiss")
-METADATA_FILE = os.path.join(DATA_DIR, "index.pkl")
+# Threads dedicadas às chamadas síncronas do RAG (embedding + FAISS), fora do event loop
+RAG_EXECUTOR_WORKERS = int(os.getenv("RAG_EXECUTOR_WORKERS", "4"))
+# Prazo (s) da busca assíncrona completa (embedding + índice)
+RAG_TIMEOUT_SECONDS = float(os.getenv("RAG_TIMEOUT_SECONDS", "3"))
+# Busca híbrida: BM25 (lexical) + FAISS (denso), unidos por reciprocal rank fusion
+RAG_HYBRID = os.getenv("RAG_HYBRID", "true").lower() not in ("0", "false", "no")
+# Candidatos de cada lado antes da fusão, e a constante k do RRF
+RAG_CANDIDATES = int(os.getenv("RAG_CANDIDATES", "10"))
+RAG_RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+# Trechos (roteiro, inclusões, embarques...) de cada pacote que vão para o prompt
+RAG_PASSAGES_PER_ITEM = int(os.getenv("RAG_PASSAGES_PER_ITEM", "2"))
+
+def candidates(k: int) -> int:
+    """Pacotes buscados antes do corte em k (sobra para juntar saídas e diversificar)."""
+    return max(k, RAG_CANDIDATES) if RAG_DIVERSITY else k
+
+
+class IndexSnapshot:
+    """
+    Uma versão do índice, imutável depois de carregada: FAISS, metadados,
+    BM25, colunas tipadas e o catálogo da mesma versão. A busca pega a
+    referência uma vez e usa só ela, então um reload no meio não mistura versões.
+
+    No FAISS, cada vetor é um trecho de um pacote ('passages' + 'parents', na
+    ordem dos pacotes). Índices antigos têm um vetor por pacote: aí não há
+    trechos e o pai de cada vetor é ele mesmo.
+    """
+    def __init__(
+        self,
+        version: Optional[str] = None,
+        index=None,
+        metadata=None,
+        lexical: Optional[BM25Index] = None,
+        columns: Optional[CatalogColumns] = None,
+        catalog: Optional[List[Dict[str, Any]]] = None,
+        load_ms: float = 0.0,
+        passages: Optional[MetadataStore] = None,
+        parents: Optional[np.ndarray] = None
+    ):
+        self.version = version
+        self.index = index
+        self.metadata = metadata if metadata is not None else []
+        self.lexical = lexical
+        self.columns = columns
+        self.catalog = catalog or []
+        self.load_ms = load_ms
+        self.loaded_at = time.time()
+        self.passages = passages
+        self.parents = parents if parents is not None else np.arange(len(self.metadata), dtype=np.int64)
+        # Trechos de cada pacote: posições [starts[p], starts[p+1]) no FAISS
+        self._starts = np.searchsorted(self.parents, np.arange(len(self.metadata) + 1))
+        # Buscando k * fanout trechos, sempre sobram k pacotes distintos
+        self.fanout = int(np.diff(self._starts).max()) if len(self.metadata) else 1
+        # Viagem canônica -> posições das suas saídas (mesma viagem em outras datas)
+        self._trips: Dict[str, List[int]] = {}
+        for position, item in enumerate(self.metadata):
+            self._trips.setdefault(package_key(item), []).append(position)
+
+    @classmethod
+    def load(cls, provider_name: str) -> "IndexSnapshot":
+        """Carrega a versão ativa do índice do backend. Levanta FileNotFoundError se não houver."""
+        started = time.perf_counter()
+        version, files = resolve_index_files(provider_name)
+        if not (os.path.exists(files["index"]) and os.path.exists(files["metadata"])):
+            raise FileNotFoundError(f"Índice não encontrado ({files['index']})")
+
+        # Os dois arquivos são mapeados em memória: os workers dividem as páginas
+        index = configure_search(read_faiss_index(files["index"]))
+        metadata = MetadataStore(files["metadata"])
+        lexical = BM25Index.from_items(metadata) if len(metadata) else None
+        columns = cls._load_columns(files["columns"], metadata) if len(metadata) else None
+        passages, parents = cls._load_passages(files["passages"], index, metadata)
+        catalog = []
+        if os.path.exists(files["catalog"]):
+            with open(files["catalog"], "r", encoding="utf-8") as f:
+                catalog = json.load(f)
+        load_ms = (time.perf_counter() - started) * 1000
+        return cls(version, index, metadata, lexical, columns, catalog, load_ms, passages, parents)
+
+    @staticmethod
+    def _load_passages(path: str, index, metadata) -> Tuple[Optional[MetadataStore], Optional[np.ndarray]]:
+        """Trechos gravados no build; sem eles (índice antigo), um vetor por pacote."""
+        if not os.path.exists(path):
+            if index.ntotal != len(metadata):
+                raise ValueError(f"Índice com {index.ntotal} vetores e {len(metadata)} pacotes, sem arquivo de trechos")
+            return None, None
+        passages = MetadataStore(path)
+        if len(passages) != index.ntotal:
+            raise ValueError(f"Índice com {index.ntotal} vetores e {len(passages)} trechos")
+        parents = np.fromiter((passages.field(i, "parent") for i in range(len(passages))), dtype=np.int64, count=len(passages))
+        return passages, parents
+
+    @staticmethod
+    def _load_columns(path: str, metadata) -> CatalogColumns:
+        """Colunas tipadas gravadas no build; índices antigos são analisados na hora."""
+        if os.path.exists(path):
+            try:
+                columns = CatalogColumns.load(path)
+                if len(columns) == len(metadata):
+                    return columns
+                print("RAG: Colunas de metadados desatualizadas. Recalculando.")
+            except Exception as e:
+                print(f"RAG: Erro ao carregar colunas de metadados ({e}). Recalculando.")
+        return CatalogColumns.from_items(metadata)
+
+    def select(self, filters: Optional[Dict[str, Any]]):
+        """Posições que passam nos filtros (max_price, min_price, month, boarding_city); None = todas."""
+        if not filters or self.columns is None:
+            return None
+        return self.columns.select(**filters)
+
+    def passage_ids(self, ids: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        """Pacotes -> posições dos seus trechos no FAISS."""
+        if ids is None or self.passages is None:
+            return ids
+        return np.flatnonzero(np.isin(self.parents, ids))
+
+    def group(self, hits: List[Tuple[int, float]], k: int) -> List[Tuple[int, float, List[Tuple[int, float]]]]:
+        """
+        Trechos do FAISS [(posição, distância)] -> até k pacotes, na ordem do
+        melhor trecho: [(pacote, melhor distância, trechos do pacote)].
+        """
+        packages: Dict[int, Tuple[float, List[Tuple[int, float]]]] = {}
+        for position, distance in hits:
+            parent = int(self.parents[position])
+            if parent not in packages:
+                if len(packages) == k:
+                    continue
+                packages[parent] = (distance, [])
+            packages[parent][1].append((position, distance))
+        return [(parent, distance, found) for parent, (distance, found) in packages.items()]
+
+    def departures(self, doc_id: int) -> List[int]:
+        """Posições de todas as saídas da mesma viagem do pacote (ele incluso)."""
+        return self._trips.get(package_key(self.metadata[doc_id]), [doc_id])
+
+    def package_vector(self, doc_id: int) -> Optional[np.ndarray]:
+        """Média dos vetores dos trechos do pacote, lidos do próprio índice (None se o tipo não reconstrói)."""
+        start, end = int(self._starts[doc_id]), int(self._starts[doc_id + 1])
+        try:
+            return self.index.reconstruct_n(start, end - start).mean(axis=0)
+        except RuntimeError:
+            return None
+
+    def best_passages(
+        self,
+        doc_id: int,
+        hits: Optional[List[Tuple[int, float]]] = None,
+        query: Optional[str] = None,
+        limit: int = RAG_PASSAGES_PER_ITEM
+    ) -> List[Dict[str, str]]:
+        """
+        Trechos do pacote para o prompt: os que a busca densa achou e, se
+        faltar (pacote veio só do BM25), os que mais repetem termos da pergunta.
+        """
+        if self.passages is None or limit <= 0:
+            return []
+        chosen = [position for position, _ in (hits or [])[:limit]]
+        if len(chosen) < limit and query:
+            terms = set(analyze(query))
+            scored = [
+                (len(terms & set(analyze(self.passages.field(position, "text")))), position)
+                for position in range(self._starts[doc_id], self._starts[doc_id + 1])
+                if position not in chosen
+            ]
+            scored.sort(key=lambda pair: (-pair[0], pair[1]))
+            chosen += [position for overlap, position in scored if overlap > 0][:limit - len(chosen)]
+        return [
+            {"kind": self.passages.field(position, "kind"), "text": self.passages.field(position, "text")}
+            for position in chosen
+        ]
+
 
 class RAGService:
-    def __init__(self):
-        self.index = None
-        self.metadata = []
-        self.embeddings_model = None
+    def __init__(self, provider_name: str = EMBEDDING_PROVIDER):
+        self.provider_name = provider_name
+        self.snapshot = IndexSnapshot()
+        self.provider = None
+        self.query_cache = None
+        # Pool limitado: um pico de buscas enfileira aqui em vez de abrir threads sem fim
+        self._executor = ThreadPoolExecutor(max_workers=RAG_EXECUTOR_WORKERS, thread_name_prefix="rag")
+        # Buscas concorrentes viram um embedding em lote e um FAISS com várias linhas
+        self.batching = RAG_BATCHING
+        self._embed_batcher = MicroBatcher("embedding", self._embed_batch)
+        self._search_batcher = MicroBatcher("faiss", self._search_batch)
         self._load_resources()
 
-    def _load_resources(self):
-        """Carrega o índice FAISS e os metadados."""
-        # if not GOOGLE_API_KEY:
-        #     print("RAG: GOOGLE_API_KEY não configurada.")
-        #     return
+    # Atalhos para a versão ativa (scripts e código antigo)
+    @property
+    def index(self):
+        return self.snapshot.index
+
+    @property
+    def metadata(self):
+        return self.snapshot.metadata
+
+    @property
+    def lexical(self) -> Optional[BM25Index]:
+        return self.snapshot.lexical
 
-        # Inicializa Embeddings (Gemini API - Mais leve para Cloud Run)
+    @property
+    def columns(self) -> Optional[CatalogColumns]:
+        return self.snapshot.columns
+
+    def _load_resources(self):
+        """Carrega o backend de embeddings e a versão ativa do índice."""
+        # Backend configurado em EMBEDDING_PROVIDER (Gemini remoto ou fastembed local).
+        # Se falhar, o índice ainda carrega: a busca lexical segue funcionando.
         try:
-            self.embeddings_model = GoogleGenerativeAIEmbeddings(model="models/embedding-001", google_api_key=GOOGLE_API_KEY)
+            self.provider = get_embedding_provider(self.provider_name)
+            # Embeddings de consultas já vistas (texto normalizado), sem recalcular
+            self.query_cache = get_embedding_cache(f"{self.provider.name}:query")
         except Exception as e:
             print(f"RAG: Erro ao carregar modelo de embeddings: {e}")
-            return
+            self.provider = None
+
+        try:
+            self.swap(IndexSnapshot.load(self.provider_name))
+        except FileNotFoundError:
+            print("RAG: Arquivos de índice não encontrados. O sistema funcionará sem memória de longo prazo.")
+        except Exception as e:
+            print(f"RAG: Erro ao carregar índice: {e}")
+
+    def swap(self, snapshot: IndexSnapshot):
+        """Troca a versão ativa (atribuição atômica; buscas em andamento seguem na antiga)."""
+        self.snapshot = snapshot
+        print(
+            f"RAG: Índice {snapshot.version} ativo com {len(snapshot.metadata)} pacotes e {snapshot.index.ntotal} vetores "
+            f"({self.provider_name}, {describe(snapshot.index)}, dim {snapshot.index.d}, "
+            f"{len(snapshot.lexical.postings) if snapshot.lexical else 0} termos BM25, "
+            f"carregado em {snapshot.load_ms:.0f} ms)."
+        )
+
+    def select(self, filters: Optional[Dict[str, Any]]):
+        """Posições da versão ativa que passam nos filtros; None = todas."""
+        return self.snapshot.select(filters)
+
+    def embed_query(self, query: str):
+        """Gera o embedding da query (float32). Retorna None se o RAG estiver indisponível."""
+        if not self.snapshot.index or not self.provider:
+            return None
+
+        cached = self.query_cache.get(query)
+        if cached is not None:
+            return cached
+        return self._compute_query_embedding(query)
+
+    def _compute_query_embedding(self, query: str):
+        """Chama o modelo (sem olhar o cache) e guarda o resultado no cache."""
+        try:
+            query_embedding = self.provider.embed_query(query)
+            self.query_cache.put(query, query_embedding)
+            return query_embedding
+        except Exception as e:
+            print(f"RAG: Erro ao gerar embedding: {e}")
+            return None
 
-        if os.path.exists(INDEX_FILE) and os.path.exists(METADATA_FILE):
+    def _compute_query_embeddings(self, queries: List[str]) -> List[Optional[np.ndarray]]:
+        """Versão em lote: uma chamada ao modelo para todas as consultas."""
+        try:
+            vectors = self.provider.embed_queries(queries)
+        except Exception as e:
+            print(f"RAG: Erro ao gerar embeddings em lote ({len(queries)} consultas): {e}")
+            return [None] * len(queries)
+        for query, vector in zip(queries, vectors):
+            self.query_cache.put(query, vector)
+        return list(vectors)
+
+    def _check_dimension(self, snap: IndexSnapshot, dim: int) -> bool:
+        if dim == snap.index.d:
+            return True
+        print(
+            f"RAG: Embedding com dimensão {dim} e índice com {snap.index.d}. "
+            f"Reconstrua o índice com: python scripts/build_vector_store.py --provider {self.provider_name}"
+        )
+        return False
+
+    def _dense_hits(self, snap: IndexSnapshot, query_vector, k: int, ids=None):
+        """
+        Trechos [(posição no índice, distância)] mais próximos no FAISS, em
+        quantidade suficiente para k pacotes (snap.group junta por pacote).
+        Com 'ids' (pacotes), a busca fica restrita aos trechos deles (pré-filtro).
+        """
+        query_np = np.asarray(query_vector, dtype='float32').reshape(1, -1)
+        if not self._check_dimension(snap, query_np.shape[1]):
+            return []
+        fetch = k * snap.fanout
+        if ids is None:
+            distances, indices = snap.index.search(query_np, fetch)
+        else:
+            positions = snap.passage_ids(ids)
+            if len(positions) == 0:
+                return []
+            distances, indices = search_subset(snap.index, query_np, fetch, positions)
+        return [
+            (int(idx), float(distances[0][i]))
+            for i, idx in enumerate(indices[0])
+            if idx != -1 and idx < len(snap.parents)
+        ]
+
+    def _dense_batch(self, requests: List[Tuple[IndexSnapshot, Any, int]]) -> List[List[Tuple[int, float]]]:
+        """
+        Vários [(snapshot, embedding, k)] numa busca só no FAISS (uma matriz
+        com uma linha por consulta). Devolve os trechos de cada pedido, como _dense_hits.
+        """
+        results: List[List[Tuple[int, float]]] = [[] for _ in requests]
+        by_snapshot: Dict[int, List[int]] = {}
+        for position, (snap, _, _) in enumerate(requests):
+            # Normalmente é uma versão só; durante um reload podem ser duas
+            by_snapshot.setdefault(id(snap), []).append(position)
+
+        for positions in by_snapshot.values():
+            snap = requests[positions[0]][0]
+            vectors = {p: np.asarray(requests[p][1], dtype='float32').reshape(-1) for p in positions}
+            rows = [p for p in positions if self._check_dimension(snap, vectors[p].shape[0])]
+            if not rows:
+                continue
+            matrix = np.vstack([vectors[p] for p in rows])
+            distances, indices = snap.index.search(matrix, max(requests[p][2] for p in rows) * snap.fanout)
+            for row, p in enumerate(rows):
+                fetch = requests[p][2] * snap.fanout
+                results[p] = [
+                    (int(idx), float(distances[row][i]))
+                    for i, idx in enumerate(indices[row][:fetch])
+                    if idx != -1 and idx < len(snap.parents)
+                ]
+        return results
+
+    def search_by_vector(
+        self,
+        query_vector,
+        k: int = 3,
+        filters: Optional[Dict[str, Any]] = None,
+        snap: Optional[IndexSnapshot] = None,
+        dense: Optional[List[Tuple[int, float]]] = None
+    ):
+        """
+        Busca os k pacotes mais próximos de um embedding já calculado, cada
+        um com os trechos que casaram. 'dense' traz os trechos já buscados
+        (lote do micro-batching).
+        """
+        snap = snap or self.snapshot
+        ids = snap.select(filters)
+        if dense is None:
+            if not snap.index or query_vector is None:
+                return []
             try:
-                self.index = faiss.read_index(INDEX_FILE)
-                with open(METADATA_FILE, 'rb') as f:
-                    self.metadata = pickle.load(f)
-                print(f"RAG: Índice carregado com {self.index.ntotal} itens.")
+                dense = self._dense_hits(snap, query_vector, candidates(k), ids)
             except Exception as e:
-                print(f"RAG: Erro ao carregar índice: {e}")
+                print(f"RAG: Erro na busca: {e}")
+                return []
+
+        grouped = snap.group(dense, candidates(k))
+        ranked = [(doc_id, {"item": snap.metadata[doc_id], "distance": distance}) for doc_id, distance, _ in grouped]
+        passage_hits = {doc_id: hits for doc_id, _, hits in grouped}
+        results = []
+        for doc_id, result in self._diversify(snap, ranked, k, ids):
+            result["passages"] = snap.best_passages(doc_id, passage_hits.get(doc_id))
+            results.append(result)
+        return results
+
+    def search_lexical(self, query: str, k: int = 3, filters: Optional[Dict[str, Any]] = None):
+        """Busca BM25 no catálogo (sem rede)."""
+        snap = self.snapshot
+        if not snap.lexical:
+            return []
+        return [
+            {"item": snap.metadata[doc_id], "bm25": round(score, 4), "passages": snap.best_passages(doc_id, query=query)}
+            for doc_id, score in snap.lexical.search(query, k, snap.select(filters))
+        ]
+
+    def search_hybrid(
+        self,
+        query: str,
+        query_vector,
+        k: int = 3,
+        filters: Optional[Dict[str, Any]] = None,
+        snap: Optional[IndexSnapshot] = None,
+        dense: Optional[List[Tuple[int, float]]] = None
+    ):
+        """
+        Funde o ranking do FAISS com o do BM25 (RRF). Sem embedding (backend
+        fora do ar ou lento), sobra só o lexical; sem termos conhecidos na
+        query, só o denso. Os filtros restringem os dois lados antes da busca.
+        'snap'/'dense' vêm do micro-batching (vizinhos já buscados nessa versão).
+        """
+        snap = snap or self.snapshot
+        if not RAG_HYBRID or not snap.lexical:
+            return self.search_by_vector(query_vector, k, filters, snap, dense)
+
+        ids = snap.select(filters)
+        if ids is not None:
+            print(f"RAG: Filtros {filters} -> {len(ids)} pacotes.")
+            if len(ids) == 0:
+                return []
+
+        if dense is None:
+            dense = []
+            if snap.index and query_vector is not None:
+                try:
+                    dense = self._dense_hits(snap, query_vector, RAG_CANDIDATES, ids)
+                except Exception as e:
+                    print(f"RAG: Erro na busca densa ({e}). Usando só a lexical.")
+        grouped = snap.group(dense, RAG_CANDIDATES)
+        lexical = snap.lexical.search(query, RAG_CANDIDATES, ids)
+        distances = {doc_id: distance for doc_id, distance, _ in grouped}
+        passage_hits = {doc_id: hits for doc_id, _, hits in grouped}
+        bm25 = dict(lexical)
+
+        rankings = [[doc_id for doc_id, _, _ in grouped], [doc_id for doc_id, _ in lexical]]
+        fused = reciprocal_rank_fusion(rankings, RAG_RRF_K)[:candidates(k)]
+        if ids is not None and len(fused) < k:
+            # Pergunta quase só de filtros ("viagens até 500 reais em dezembro"):
+            # completa com o resto do subconjunto
+            chosen = {doc_id for doc_id, _ in fused}
+            fused += [(int(doc_id), 0.0) for doc_id in ids if int(doc_id) not in chosen][:k - len(fused)]
+
+        ranked = []
+        for doc_id, score in fused:
+            result = {"item": snap.metadata[doc_id], "rrf": round(score, 5)}
+            if doc_id in distances:
+                result["distance"] = distances[doc_id]
+            if doc_id in bm25:
+                result["bm25"] = round(bm25[doc_id], 4)
+            ranked.append((doc_id, result))
+
+        results = []
+        for doc_id, result in self._diversify(snap, ranked, k, ids):
+            result["passages"] = snap.best_passages(doc_id, passage_hits.get(doc_id), query)
+            results.append(result)
+        return results
+
+    def _diversify(
+        self,
+        snap: IndexSnapshot,
+        ranked: List[Tuple[int, Dict[str, Any]]],
+        k: int,
+        ids: Optional[np.ndarray] = None
+    ) -> List[Tuple[int, Dict[str, Any]]]:
+        """
+        Pós-busca: saídas da mesma viagem viram uma entrada só e o MMR sobre os
+        vetores já no índice evita k pacotes quase iguais. A entrada de cada
+        viagem é a próxima saída que passa nos filtros (com 'dates' de todas as
+        saídas futuras); viagem sem saída futura vem marcada com 'closed'.
+        """
+        if not RAG_DIVERSITY or not ranked:
+            return ranked[:k]
+        allowed = None if ids is None else {int(i) for i in ids}
+        trips: Dict[str, List[Tuple[int, Dict[str, Any]]]] = {}
+        for doc_id, result in ranked:
+            trips.setdefault(package_key(result["item"]), []).append((doc_id, result))
+
+        heads = []
+        upcoming_by_head: Dict[int, List[int]] = {}
+        for members in trips.values():
+            departures = [p for p in snap.departures(members[0][0]) if allowed is None or p in allowed]
+            upcoming = sorted(
+                (p for p in departures if is_upcoming(snap.metadata[p])),
+                key=lambda p: departure_order(snap.metadata[p])
+            )
+            if not upcoming:
+                # Todas as saídas já passaram: o modelo pode citar, mas não vender
+                heads.append((members[0][0], {**members[0][1], "closed": True}))
+                upcoming_by_head[members[0][0]] = []
+                continue
+            head = upcoming[0]
+            # Relevância (distância, bm25, rrf) vem da saída mais bem colocada da viagem
+            found = dict(members)
+            result = found.get(head) or {**members[0][1], "item": snap.metadata[head]}
+            heads.append((head, result))
+            upcoming_by_head[head] = upcoming
+
+        relevance = [1 - position / len(heads) for position in range(len(heads))]
+        chosen = [heads[i] for i in mmr(relevance, [snap.package_vector(doc_id) for doc_id, _ in heads], k)]
+        for doc_id, result in chosen:
+            if len(upcoming_by_head[doc_id]) > 1:
+                result["dates"] = collapse_departures([snap.metadata[p] for p in upcoming_by_head[doc_id]])
+        return chosen
+
+    def search(
+        self,
+        query: str,
+        k: int = 3,
+        max_price: Optional[float] = None,
+        min_price: Optional[float] = None,
+        month: Optional[int] = None,
+        boarding_city: Optional[str] = None
+    ):
+        """
+        Busca os k itens mais relevantes para a query (síncrona, usada pelos scripts).
+        Os filtros opcionais limitam a busca aos pacotes que batem com eles.
+        """
+        filters = {
+            name: value for name, value in (
+                ("max_price", max_price), ("min_price", min_price), ("month", month), ("boarding_city", boarding_city)
+            ) if value is not None
+        }
+        return self.search_hybrid(query, self.embed_query(query), k, filters)
+
+    # --- API assíncrona (usada pelo bot) ---
+    # As chamadas síncronas rodam no executor dedicado. Cancelar/estourar o prazo
+    # libera o chamador na hora; trabalho que ainda estava na fila do executor é
+    # descartado, e o que já estava rodando termina em background e é ignorado.
+
+    async def aembed_query(self, query: str, channel: str = "whatsapp"):
+        """embed_query fora do event loop (backends remotos ocupam uma vaga do gateway do Gemini)."""
+        if not self.snapshot.index or not self.provider:
+            return None
+        # Acerto no cache não gasta vaga nem thread
+        cached = self.query_cache.get(query)
+        if cached is not None:
+            return cached
+        if self.batching:
+            return await self._embed_batcher.submit((query, channel))
+        if not self.provider.remote:
+            # Modelo local: só CPU, não consome cota do Gemini
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._compute_query_embedding, query)
+        return await llm_gateway.run_sync(
+            self.provider.name, channel, estimate_tokens(query), self._compute_query_embedding, query,
+            executor=self._executor
+        )
+
+    async def _embed_batch(self, requests: List[Tuple[str, str]]) -> List[Optional[np.ndarray]]:
+        """Lote de [(consulta, canal)] -> embeddings, com uma chamada ao modelo."""
+        queries = list(dict.fromkeys(query for query, _ in requests))
+        if self.provider.remote:
+            # Uma vaga do gateway para o lote todo, na prioridade do canal mais urgente
+            channel = min((c for _, c in requests), key=lambda c: PRIORITIES.get(c, DEFAULT_PRIORITY))
+            vectors = await llm_gateway.run_sync(
+                self.provider.name, channel, sum(estimate_tokens(q) for q in queries),
+                self._compute_query_embeddings, queries, executor=self._executor
+            )
         else:
-            print("RAG: Arquivos de índice não encontrados. O sistema funcionará sem memória de longo prazo.")
+            loop = asyncio.get_running_loop()
+            vectors = await loop.run_in_executor(self._executor, self._compute_query_embeddings, queries)
+        by_query = dict(zip(queries, vectors))
+        return [by_query[query] for query, _ in requests]
+
+    async def _search_batch(self, requests: List[Tuple[IndexSnapshot, Any, int]]) -> List[List[Tuple[int, float]]]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._dense_batch, requests)
 
-    def search(self, query: str, k: int = 3):
-        """Busca os k itens mais similares à query."""
-        if not self.index or not self.embeddings_model:
+    async def _adense(self, snap: IndexSnapshot, query_vector, k: int) -> Optional[List[Tuple[int, float]]]:
+        """Vizinhos pelo micro-batching; None quando a busca deve ser feita do jeito normal."""
+        if not self.batching or not snap.index or query_vector is None:
+            return None
+        return await self._search_batcher.submit((snap, query_vector, k))
+
+    async def asearch_by_vector(self, query_vector, k: int = 3):
+        """search_by_vector fora do event loop."""
+        snap = self.snapshot
+        if not snap.index or query_vector is None:
             return []
+        dense = await self._adense(snap, query_vector, candidates(k))
+        if dense is not None:
+            return self.search_by_vector(query_vector, k, snap=snap, dense=dense)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.search_by_vector, query_vector, k)
+
+    async def _ahybrid(self, query: str, query_vector, k: int, filters: Optional[Dict[str, Any]]):
+        snap = self.snapshot
+        dense = None
+        if not filters:
+            # Com filtro, cada consulta tem o seu subconjunto: não dá para juntar no lote
+            try:
+                dense = await self._adense(snap, query_vector, RAG_CANDIDATES if RAG_HYBRID and snap.lexical else candidates(k))
+            except Exception as e:
+                print(f"RAG: Erro na busca densa em lote ({e}). Buscando sozinho.")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.search_hybrid, query, query_vector, k, filters, snap, dense)
 
+    async def aretrieve(
+        self,
+        query: str,
+        k: int = 3,
+        timeout: Optional[float] = RAG_TIMEOUT_SECONDS,
+        channel: str = "whatsapp",
+        filters: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Busca híbrida assíncrona. Retorna (embedding, resultados). O prazo vale
+        para o embedding: se ele estourar ou falhar, a busca segue só com o
+        BM25 e o embedding volta None.
+        """
+        query_vector = None
         try:
-            # Gera embedding da query
-            query_embedding = self.embeddings_model.embed_query(query)
-            query_np = np.array([query_embedding]).astype('float32')
-
-            # Busca no FAISS
-            distances, indices = self.index.search(query_np, k)
-
-            results = []
-            for i, idx in enumerate(indices[0]):
-                if idx != -1 and idx < len(self.metadata):
-                    item = self.metadata[idx]
-                    results.append({
-                        "item": item,
-                        "distance": float(distances[0][i])
-                    })
-            
-            return results
+            query_vector = await asyncio.wait_for(self.aembed_query(query, channel), timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"RAG: Embedding passou de {timeout}s. Seguindo só com a busca lexical.")
         except Exception as e:
-            print(f"RAG: Erro na busca: {e}")
-            return []
+            print(f"RAG: Erro no embedding ({e}). Seguindo só com a busca lexical.")
+        if not self.snapshot.metadata:
+            return query_vector, []
+        return query_vector, await self._ahybrid(query, query_vector, k, filters)
+
+    async def asearch(self, query: str, k: int = 3, timeout: Optional[float] = RAG_TIMEOUT_SECONDS, channel: str = "whatsapp"):
+        """
+        Versão assíncrona de search. Levanta asyncio.TimeoutError se passar de
+        'timeout' segundos (None = sem prazo).
+        """
+        async def run():
+            return await self._ahybrid(query, await self.aembed_query(query, channel), k, None)
+        return await asyncio.wait_for(run(), timeout=timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batching": self.batching,
+            "embedding_batches": self._embed_batcher.stats(),
+            "faiss_batches": self._search_batcher.stats(),
+        }
+
 
 # Instância global
 rag_service = RAGService()
@@ -0,0 +1,148 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple, List
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "data")
+CATALOG_FILE = os.path.join(DATA_DIR, "catalog.json")
+
+# Similaridade de cosseno mínima para considerar duas perguntas "a mesma"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.93"))
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "3600"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+# De quanto em quanto tempo (s) olhamos o mtime do catálogo
+CATALOG_CHECK_INTERVAL = 5.0
+
+
+class SemanticCache:
+    """
+    Cache de respostas para perguntas quase idênticas ("qual o valor do Beto
+    Carrero?" / "quanto custa beto carrero").
+
+    A chave tem duas partes:
+      - o grupo exato: pacotes recuperados pelo RAG + saudação do horário;
+      - o embedding normalizado da pergunta, comparado por cosseno dentro do grupo.
+
+    Só deve ser usado em perguntas que não dependem do histórico (primeiro turno).
+    Todo o cache é invalidado quando o data/catalog.json muda.
+    """
+    def __init__(
+        self,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        ttl: float = SEMANTIC_CACHE_TTL_SECONDS,
+        max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+        catalog_path: str = CATALOG_FILE
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.catalog_path = catalog_path
+        self._lock = threading.Lock()
+        # entry_id -> (group_key, vetor normalizado, resposta, criado_em)
+        self._entries: "OrderedDict[int, Tuple[Tuple, np.ndarray, str, float]]" = OrderedDict()
+        self._groups: Dict[Tuple, List[int]] = {}
+        self._next_id = 0
+        self._catalog_mtime = self._read_catalog_mtime()
+        self._last_catalog_check = time.time()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(vector) -> Optional[np.ndarray]:
+        vec = np.asarray(vector, dtype='float32').reshape(-1)
+        norm = float(np.linalg.norm(vec))
+        if norm == 0.0:
+            return None
+        return vec / norm
+
+    def _read_catalog_mtime(self) -> float:
+        try:
+            return os.path.getmtime(self.catalog_path)
+        except OSError:
+            return 0.0
+
+    def _check_catalog(self, now: float):
+        if now - self._last_catalog_check < CATALOG_CHECK_INTERVAL:
+            return
+        self._last_catalog_check = now
+        mtime = self._read_catalog_mtime()
+        if mtime != self._catalog_mtime:
+            self._catalog_mtime = mtime
+            self._drop_all()
+            print("SEMANTIC CACHE: Catálogo alterado. Cache invalidado.")
+
+    def clear(self):
+        """Descarta todas as respostas (ex: catálogo atualizado)."""
+        with self._lock:
+            self._drop_all()
+
+    def _drop_all(self):
+        self._entries.clear()
+        self._groups.clear()
+        self.invalidations += 1
+
+    def _remove(self, entry_id: int):
+        group_key = self._entries.pop(entry_id)[0]
+        ids = self._groups.get(group_key, [])
+        if entry_id in ids:
+            ids.remove(entry_id)
+        if not ids:
+            self._groups.pop(group_key, None)
+
+    def get(self, vector, group_key: Tuple) -> Optional[str]:
+        """Retorna a resposta em cache mais parecida (acima do limiar) ou None."""
+        now = time.time()
+        query = self._normalize(vector)
+        with self._lock:
+            self._check_catalog(now)
+            best_id, best_score = None, self.threshold
+            if query is not None:
+                for entry_id in list(self._groups.get(group_key, [])):
+                    _, cached_vec, _, created_at = self._entries[entry_id]
+                    if now - created_at > self.ttl:
+                        self._remove(entry_id)
+                        continue
+                    score = float(np.dot(query, cached_vec))
+                    if score >= best_score:
+                        best_id, best_score = entry_id, score
+
+            if best_id is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(best_id)
+            return self._entries[best_id][2]
+
+    def put(self, vector, group_key: Tuple, response: str):
+        """Guarda uma resposta, descartando as menos usadas se passar do limite."""
+        vec = self._normalize(vector)
+        if vec is None:
+            return
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (group_key, vec, response, time.time())
+            self._groups.setdefault(group_key, []).append(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+
+# Instância global
+semantic_cache = SemanticCache()
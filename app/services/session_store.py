@@ -0,0 +1,333 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import threading
+from typing import Dict, Any, Optional, Tuple, List, Callable, Iterator
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "data")
+# 'sqlite' (padrão, compartilhado entre workers) ou 'memory' (volátil, útil em scripts)
+SESSION_STORE_BACKEND = os.getenv("SESSION_STORE_BACKEND", "sqlite")
+SESSION_DB_FILE = os.getenv("SESSION_DB_PATH", os.path.join(DATA_DIR, "sessions.db"))
+# Por quanto tempo uma leitura em cache é considerada fresca (outros processos podem ter escrito)
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "2.0"))
+# Intervalo entre flushes em lote das escritas pendentes
+SESSION_FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", "0.5"))
+
+
+class SessionStore:
+    """
+    Interface do armazenamento de sessões (memória de conversa, pausas etc.).
+    Valores são JSON; cada chave tem uma versão que cresce a cada escrita.
+
+    As versões são contadores por processo: quando uma escrita local perde um
+    conflito, o número que ela usou passa a ser o da escrita do outro processo.
+    'generation' muda nesses casos, para quem guarda objetos por versão
+    (SessionMap) descartá-los.
+    """
+    generation = 0
+
+    def get(self, namespace: str, key: str) -> Optional[Tuple[Any, int]]:
+        """Retorna (valor, versão) ou None."""
+        raise NotImplementedError
+
+    def put(self, namespace: str, key: str, value: Any, durable: bool = False) -> int:
+        """Grava o valor e retorna a nova versão. durable=True grava no disco na hora."""
+        raise NotImplementedError
+
+    def delete(self, namespace: str, key: str):
+        raise NotImplementedError
+
+    def keys(self, namespace: str) -> List[str]:
+        raise NotImplementedError
+
+    async def start(self):
+        """Inicia tarefas de background (ex: flush). Opcional."""
+
+    async def stop(self):
+        """Grava o que estiver pendente e encerra tarefas de background. Opcional."""
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class InMemorySessionStore(SessionStore):
+    """Backend volátil: cada processo tem o seu estado (comportamento antigo)."""
+    def __init__(self):
+        self._data: Dict[Tuple[str, str], Tuple[Any, int]] = {}
+
+    def get(self, namespace, key):
+        return self._data.get((namespace, key))
+
+    def put(self, namespace, key, value, durable=False):
+        current = self._data.get((namespace, key))
+        version = (current[1] if current else 0) + 1
+        self._data[(namespace, key)] = (value, version)
+        return version
+
+    def delete(self, namespace, key):
+        self._data.pop((namespace, key), None)
+
+    def keys(self, namespace):
+        return [key for ns, key in self._data if ns == namespace]
+
+    def stats(self):
+        return {"backend": "memory", "keys": len(self._data)}
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Backend SQLite (WAL) compartilhado por todos os workers da máquina.
+
+    - Leituras passam por um cache em processo com validade curta (SESSION_CACHE_TTL).
+    - Escritas vão para um buffer e são gravadas em lote a cada
+      SESSION_FLUSH_INTERVAL (write-behind). Sem o loop de flush rodando
+      (ex: scripts), as escritas são gravadas na hora.
+    - Cada chave tem versão: o flush só grava se a versão no disco ainda for a
+      que lemos. Se outro processo escreveu antes, a escrita local é descartada,
+      o cache é invalidado e o conflito é contabilizado.
+    """
+    def __init__(self, path: str = SESSION_DB_FILE, cache_ttl: float = SESSION_CACHE_TTL, flush_interval: float = SESSION_FLUSH_INTERVAL):
+        self.path = path
+        self.cache_ttl = cache_ttl
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # (ns, key) -> (valor, versão, lido_em)
+        self._cache: Dict[Tuple[str, str], Tuple[Any, int, float]] = {}
+        # (ns, key) -> (valor, versão_base); valor None significa remoção
+        self._dirty: Dict[Tuple[str, str], Tuple[Any, int]] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.conflicts = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+        """)
+
+    def get(self, namespace, key):
+        cache_key = (namespace, key)
+        now = time.time()
+        with self._lock:
+            if cache_key in self._dirty:
+                value, base_version = self._dirty[cache_key]
+                return None if value is None else (value, base_version + 1)
+
+            cached = self._cache.get(cache_key)
+            if cached and now - cached[2] < self.cache_ttl:
+                return cached[0], cached[1]
+
+            row = self._conn.execute(
+                "SELECT value, version FROM sessions WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            if row is None:
+                self._cache.pop(cache_key, None)
+                return None
+            value = json.loads(row[0])
+            self._cache[cache_key] = (value, row[1], now)
+            return value, row[1]
+
+    def _base_version(self, cache_key: Tuple[str, str]) -> int:
+        if cache_key in self._dirty:
+            return self._dirty[cache_key][1]
+        cached = self._cache.get(cache_key)
+        if cached:
+            return cached[1]
+        row = self._conn.execute(
+            "SELECT version FROM sessions WHERE namespace = ? AND key = ?", cache_key
+        ).fetchone()
+        return row[0] if row else 0
+
+    def put(self, namespace, key, value, durable=False):
+        cache_key = (namespace, key)
+        with self._lock:
+            base_version = self._base_version(cache_key)
+            self._dirty[cache_key] = (value, base_version)
+            self._cache[cache_key] = (value, base_version + 1, time.time())
+        if durable or self._flusher is None:
+            self.flush()
+        return base_version + 1
+
+    def delete(self, namespace, key):
+        cache_key = (namespace, key)
+        with self._lock:
+            self._dirty[cache_key] = (None, self._base_version(cache_key))
+            self._cache.pop(cache_key, None)
+        if self._flusher is None:
+            self.flush()
+
+    def keys(self, namespace):
+        with self._lock:
+            stored = {row[0] for row in self._conn.execute(
+                "SELECT key FROM sessions WHERE namespace = ?", (namespace,)
+            )}
+            for (ns, key), (value, _) in self._dirty.items():
+                if ns != namespace:
+                    continue
+                if value is None:
+                    stored.discard(key)
+                else:
+                    stored.add(key)
+        return sorted(stored)
+
+    def flush(self):
+        """Grava todas as escritas pendentes em uma única transação."""
+        with self._lock:
+            if not self._dirty:
+                return
+            batch, self._dirty = self._dirty, {}
+            now = time.time()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for (namespace, key), (value, base_version) in batch.items():
+                    if value is None:
+                        self._conn.execute(
+                            "DELETE FROM sessions WHERE namespace = ? AND key = ?", (namespace, key)
+                        )
+                        continue
+                    payload = json.dumps(value, ensure_ascii=False)
+                    if base_version == 0:
+                        cursor = self._conn.execute(
+                            "INSERT OR IGNORE INTO sessions (namespace, key, value, version, updated_at) VALUES (?, ?, ?, 1, ?)",
+                            (namespace, key, payload, now)
+                        )
+                    else:
+                        cursor = self._conn.execute(
+                            "UPDATE sessions SET value = ?, version = version + 1, updated_at = ? WHERE namespace = ? AND key = ? AND version = ?",
+                            (payload, now, namespace, key, base_version)
+                        )
+                    if cursor.rowcount == 0:
+                        # Outro processo escreveu esta chave depois da nossa leitura
+                        self.conflicts += 1
+                        self.generation += 1
+                        self._cache.pop((namespace, key), None)
+                        print(f"SESSION STORE: Conflito de versão em {namespace}:{key}. Mantida a versão do disco.")
+                self._conn.execute("COMMIT")
+                self.flushes += 1
+            except Exception as e:
+                self._conn.execute("ROLLBACK")
+                # Devolve o lote ao buffer (sem sobrescrever escritas mais novas)
+                for cache_key, entry in batch.items():
+                    self._dirty.setdefault(cache_key, entry)
+                print(f"SESSION STORE: Erro no flush: {e}")
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"SESSION STORE: Erro no loop de flush: {e}")
+
+    async def start(self):
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        self.flush()
+
+    def stats(self):
+        return {
+            "backend": "sqlite",
+            "pending_writes": len(self._dirty),
+            "cached_keys": len(self._cache),
+            "flushes": self.flushes,
+            "conflicts": self.conflicts,
+        }
+
+
+class SessionMap:
+    """
+    Visão tipo dicionário de um namespace do SessionStore.
+    Mantém os objetos já decodificados por versão, então leituras repetidas
+    devolvem o mesmo objeto enquanto ninguém mais tiver escrito a chave.
+    Depois de um conflito no store (generation mudou), a versão local pode ter
+    o mesmo número da escrita do outro processo: o objeto é decodificado de novo.
+    """
+    def __init__(
+        self,
+        store: SessionStore,
+        namespace: str,
+        encode: Callable[[Any], Any] = lambda value: value,
+        decode: Callable[[Any], Any] = lambda value: value,
+        durable: bool = False
+    ):
+        self.store = store
+        self.namespace = namespace
+        self.encode = encode
+        self.decode = decode
+        self.durable = durable
+        # key -> (versão, geração do store, objeto)
+        self._objects: Dict[str, Tuple[int, int, Any]] = {}
+
+    def get(self, key: str, default: Any = None) -> Any:
+        found = self.store.get(self.namespace, key)
+        if found is None:
+            self._objects.pop(key, None)
+            return default
+        value, version = found
+        cached = self._objects.get(key)
+        if cached and cached[0] == version and cached[1] == self.store.generation:
+            return cached[2]
+        obj = self.decode(value)
+        self._objects[key] = (version, self.store.generation, obj)
+        return obj
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, obj: Any):
+        version = self.store.put(self.namespace, key, self.encode(obj), durable=self.durable)
+        self._objects[key] = (version, self.store.generation, obj)
+
+    def __delitem__(self, key: str):
+        self.store.delete(self.namespace, key)
+        self._objects.pop(key, None)
+
+    def __contains__(self, key: str) -> bool:
+        return self.store.get(self.namespace, key) is not None
+
+    def keys(self) -> List[str]:
+        return self.store.keys(self.namespace)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+
+_MISSING = object()
+
+
+def get_session_store() -> SessionStore:
+    """Cria o backend configurado em SESSION_STORE_BACKEND (cai para memória em caso de erro)."""
+    if SESSION_STORE_BACKEND == "sqlite":
+        try:
+            return SQLiteSessionStore(SESSION_DB_FILE)
+        except Exception as e:
+            print(f"SESSION STORE: Falha ao abrir SQLite ({e}). Usando memória.")
+    return InMemorySessionStore()
+
+
+# Instância global
+session_store = get_session_store()
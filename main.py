@@ -1,7 +1,24 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from app.routes import webhook
+from app.services.session_store import session_store
+from app.services.embedding_cache import flush_embedding_caches
+from app.services.index_reloader import index_reloader
 
-app = FastAPI(title="Marcinho Tur AI Agent Backend")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Flush em lote das sessões e workers que drenam a fila de entrada do webhook
+    await session_store.start()
+    await webhook.ingress_pool.start()
+    # Watcher que troca o índice/catálogo quando sai uma versão nova
+    await index_reloader.start()
+    yield
+    await index_reloader.stop()
+    await webhook.ingress_pool.stop()
+    await session_store.stop()
+    flush_embedding_caches()
+
+app = FastAPI(title="Marcinho Tur AI Agent Backend", lifespan=lifespan)
 
 # Incluir rotas
 app.include_router(webhook.router)
@@ -0,0 +1,135 @@
+"""
+Compara os tipos de índice FAISS (Flat, HNSW, IVF, PQ, SQ8) em recall@k
+(contra a busca exata do Flat), latência por consulta e memória, em corpora
+sintéticos de vários tamanhos.
+
+Os vetores são gerados em grupos (como embeddings de textos parecidos) na
+dimensão do índice do bot. Para cada tipo com parâmetro de busca, varia
+nprobe (IVF) ou efSearch (HNSW).
+
+Uso:
+    python scripts/benchmark_ann.py
+    python scripts/benchmark_ann.py --sizes 1000 100000 1000000 --factories Flat HNSW32 "IVF,PQ64" --k 10
+"""
+import argparse
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+# Add project root to path
+sys.path.append(os.getcwd())
+
+from app.services.ann_index import build_index, describe, resolve_factory
+
+DEFAULT_FACTORIES = ["Flat", "HNSW32", "IVF,Flat", "IVF,SQ8", "IVF,PQ64", "SQ8", "HNSW32,SQ8"]
+NPROBES = [1, 4, 8, 16, 32, 64]
+EF_SEARCHES = [16, 32, 64, 128, 256]
+
+
+def synthetic_corpus(n: int, dim: int, queries: int, seed: int = 0):
+    """Vetores em torno de ~sqrt(n) centros; as consultas vêm da mesma distribuição."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(8, int(np.sqrt(n))), dim)).astype('float32')
+
+    def sample(count: int) -> np.ndarray:
+        out = np.empty((count, dim), dtype='float32')
+        # Em blocos, para 1M x 768 não dobrar a memória
+        for start in range(0, count, 50000):
+            end = min(count, start + 50000)
+            picks = rng.integers(0, len(centers), end - start)
+            out[start:end] = centers[picks] + 0.35 * rng.standard_normal((end - start, dim), dtype='float32')
+        return out
+
+    return sample(n), sample(queries)
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray, k: int) -> float:
+    hits = sum(len(set(f[:k]) & set(t[:k])) for f, t in zip(found, truth))
+    return hits / (len(truth) * k)
+
+
+def measure(index, queries: np.ndarray, truth: np.ndarray, k: int):
+    # Uma consulta por vez (como o bot sem lote)
+    latencies = []
+    found = []
+    for query in queries:
+        started = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        found.append(ids[0])
+    # Todas de uma vez (como um lote do micro-batching)
+    started = time.perf_counter()
+    index.search(queries, k)
+    batch_qps = len(queries) / (time.perf_counter() - started)
+    return {
+        "recall": recall_at_k(np.array(found), truth, k),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "batch_qps": batch_qps,
+    }
+
+
+def search_settings(index):
+    """[(rótulo, função que aplica)] para variar nprobe/efSearch."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return [(f"nprobe={p}", lambda p=p: setattr(ivf, "nprobe", p)) for p in NPROBES if p <= ivf.nlist]
+    if isinstance(index, faiss.IndexHNSW):
+        return [(f"efSearch={ef}", lambda ef=ef: setattr(index.hnsw, "efSearch", ef)) for ef in EF_SEARCHES]
+    return [("-", lambda: None)]
+
+
+def benchmark_size(n: int, dim: int, factories, queries_count: int, k: int):
+    print(f"\n=== {n} vetores, dim {dim}, {queries_count} consultas, k={k} ===")
+    vectors, queries = synthetic_corpus(n, dim, queries_count)
+    exact = faiss.IndexFlatL2(dim)
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+    del exact
+
+    print(f"{'índice':<28} {'busca':<13} {'recall@k':>8} {'p50 ms':>8} {'p99 ms':>8} {'lote q/s':>10} {'MB':>9} {'build s':>8}")
+    for factory in factories:
+        started = time.perf_counter()
+        try:
+            index = build_index(vectors, factory)
+        except Exception as e:
+            print(f"{factory:<28} erro: {e}")
+            continue
+        build_seconds = time.perf_counter() - started
+        megabytes = faiss.serialize_index(index).nbytes / 1e6
+        name = resolve_factory(factory, n)
+        if name != factory.strip():
+            name = f"{factory} ({name})"
+        if describe(index).startswith("IndexFlat") and factory.strip() != "Flat":
+            name = f"{factory} (caiu p/ Flat)"
+        for label, apply in search_settings(index):
+            apply()
+            result = measure(index, queries, truth, k)
+            print(
+                f"{name:<28} {label:<13} {result['recall']:>8.3f} {result['p50_ms']:>8.3f} "
+                f"{result['p99_ms']:>8.3f} {result['batch_qps']:>10.0f} {megabytes:>9.1f} {build_seconds:>8.1f}"
+            )
+        del index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de recall/latência/memória dos índices FAISS")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="Tamanhos do corpus (ex.: 1000 1000000)")
+    parser.add_argument("--dim", type=int, default=768, help="Dimensão dos vetores (768 = Gemini)")
+    parser.add_argument("--factories", nargs="+", default=DEFAULT_FACTORIES, help="Tipos no formato do index_factory")
+    parser.add_argument("--queries", type=int, default=200, help="Consultas por tamanho")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=0, help="Threads do FAISS (0 = padrão)")
+    args = parser.parse_args()
+
+    if args.threads:
+        faiss.omp_set_num_threads(args.threads)
+    for n in args.sizes:
+        benchmark_size(n, args.dim, args.factories, args.queries, args.k)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Compara os backends de embedding (Gemini remoto x fastembed local) em
+latência por consulta e recall@k sobre o catálogo atual.
+
+Para cada backend, embeda os pacotes (com o cache de documentos), monta um
+índice FAISS em memória e roda as consultas rotuladas de data/eval_queries.json
+(as mesmas da avaliação offline; acerto = URL certa no top-k).
+
+Uso:
+    python scripts/benchmark_embeddings.py --providers google,fastembed --k 3
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+# Add project root to path
+sys.path.append(os.getcwd())
+
+from app.services.catalog_index import document_text
+from app.services.embedding_cache import get_embedding_cache
+from app.services.embedding_provider import get_embedding_provider
+
+CATALOG_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "catalog.json")
+# Mesmas consultas rotuladas da avaliação offline (scripts/evaluate_retrieval.py)
+QUERIES_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "eval_queries.json")
+
+
+def benchmark(provider_name: str, catalog, labelled, k: int):
+    print(f"\n--- {provider_name} ---")
+    try:
+        provider = get_embedding_provider(provider_name)
+    except Exception as e:
+        print(f"Backend indisponível: {e}")
+        return None
+
+    texts = [document_text(item) for item in catalog]
+    cache = get_embedding_cache(f"{provider.name}:document")
+    started = time.perf_counter()
+    vectors = cache.get_many(texts)
+    missing = [i for i, vec in enumerate(vectors) if vec is None]
+    try:
+        if missing:
+            fresh = provider.embed_documents([texts[i] for i in missing])
+            for i, vec in zip(missing, fresh):
+                vectors[i] = vec
+                cache.put(texts[i], vec)
+    except Exception as e:
+        print(f"Erro ao embedar o catálogo: {e}")
+        return None
+    build_seconds = time.perf_counter() - started
+    matrix = np.vstack(vectors).astype("float32")
+    index = faiss.IndexFlatL2(matrix.shape[1])
+    index.add(matrix)
+    print(f"Índice: {index.ntotal} pacotes, dim {index.d}, {len(missing)} embedados agora em {build_seconds:.1f}s")
+
+    latencies = []
+    hits = 0
+    reciprocal_ranks = []
+    for entry in labelled:
+        query, relevant = entry["query"], set(entry["relevant"])
+        t0 = time.perf_counter()
+        try:
+            # Sem cache de consultas: medimos o custo real de cada mensagem nova
+            query_vec = provider.embed_query(query)
+        except Exception as e:
+            print(f"Erro ao embedar '{query}': {e}")
+            return None
+        _, ids = index.search(query_vec.reshape(1, -1).astype("float32"), k)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        found = [catalog[i] for i in ids[0] if i != -1]
+        rank = next((pos for pos, item in enumerate(found, 1) if item.get("url") in relevant), None)
+        if rank:
+            hits += 1
+            reciprocal_ranks.append(1 / rank)
+        else:
+            reciprocal_ranks.append(0.0)
+            print(f"  errou: '{query}' -> {[item.get('title') for item in found]}")
+
+    latencies.sort()
+    result = {
+        "provider": provider.name,
+        "dim": index.d,
+        f"recall@{k}": round(hits / len(labelled), 3),
+        "mrr": round(sum(reciprocal_ranks) / len(reciprocal_ranks), 3),
+        "p50_ms": round(latencies[len(latencies) // 2], 1),
+        "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 1),
+    }
+    print(result)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dos backends de embedding")
+    parser.add_argument("--providers", default="google,fastembed")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--queries", default=QUERIES_FILE, help="Arquivo JSON [{query, relevant: [urls]}]")
+    args = parser.parse_args()
+
+    with open(CATALOG_FILE, "r", encoding="utf-8") as f:
+        catalog = json.load(f)
+    with open(args.queries, "r", encoding="utf-8") as f:
+        labelled = json.load(f)
+
+    results = [benchmark(name.strip(), catalog, labelled, args.k) for name in args.providers.split(",")]
+    print("\n=== RESUMO ===")
+    for result in results:
+        if result:
+            print(result)
+
+
+if __name__ == "__main__":
+    main()
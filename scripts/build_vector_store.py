@@ -1,26 +1,45 @@
 import os
+import sys
 import json
-import pickle
+import argparse
+import shutil
 import numpy as np
 import faiss
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from dotenv import load_dotenv
 import time
 
+# Add project root to path
+sys.path.append(os.getcwd())
+
+from app.services.embedding_cache import get_embedding_cache
+from app.services.embedding_provider import get_embedding_provider, EMBEDDING_PROVIDER, EMBEDDING_BATCH_SIZE
+from app.services.catalog_index import catalog_passages, CatalogColumns
+from app.services.index_store import MetadataStore, write_metadata_store, staging_dir, version_files, publish_version
+from app.services.ann_index import FAISS_INDEX_FACTORY, build_index, describe
+
 # Carrega variáveis de ambiente
 load_dotenv()
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
 CATALOG_FILE = os.path.join(DATA_DIR, "catalog.json")
-INDEX_FILE = os.path.join(DATA_DIR, "index.faiss")
-METADATA_FILE = os.path.join(DATA_DIR, "index.pkl")
 
-def main():
-    if not GOOGLE_API_KEY:
+def main(provider_name: str = EMBEDDING_PROVIDER, factory: str = FAISS_INDEX_FACTORY, chunks: bool = True):
+    if provider_name == "google" and not GOOGLE_API_KEY:
         print("Erro: GOOGLE_API_KEY não encontrada no .env")
         return
 
+    # Cada backend tem as suas versões (a dimensão dos vetores é diferente).
+    # O build acontece numa pasta de staging; o bot só vê a versão quando ela é publicada.
+    staging = staging_dir(provider_name)
+    os.makedirs(staging, exist_ok=True)
+    files = version_files(staging)
+    index_file = files["index"]
+    metadata_file = files["metadata"]
+    columns_file = files["columns"]
+    passages_file = files["passages"]
+    print(f"Backend de embeddings: {provider_name} -> {staging}")
+
     print("Carregando catálogo...")
     if not os.path.exists(CATALOG_FILE):
         print(f"Erro: Arquivo {CATALOG_FILE} não encontrado. Rode o scraper primeiro.")
@@ -33,72 +52,110 @@ def main():
         print("Catálogo vazio.")
         return
 
+    # Um vetor por trecho (resumo, dias do roteiro, inclusões, embarques,
+    # pagamento), com o pacote pai; --no-chunks volta a um vetor por pacote
+    passages, texts = catalog_passages(catalog, chunks)
+    print(f"{len(catalog)} pacotes -> {len(passages)} trechos.")
+
     # Verifica se já existe um índice parcial
-    if os.path.exists(INDEX_FILE) and os.path.exists(METADATA_FILE):
-        print("Índice existente encontrado. Carregando para retomar...")
-        index = faiss.read_index(INDEX_FILE)
-        with open(METADATA_FILE, 'rb') as f:
-            metadatas = pickle.load(f)
-        # Recalcula embeddings já processados (assumindo ordem fixa do catálogo)
-        # Isso é simplificado. O ideal seria salvar IDs.
-        # Vamos pular os primeiros N itens
-        start_index = len(metadatas)
-        print(f"Retomando do item {start_index + 1}...")
+    if os.path.exists(index_file) and os.path.exists(passages_file):
+        print("Build parcial encontrado. Carregando para retomar...")
+        index = faiss.read_index(index_file)
+        done = list(MetadataStore(passages_file))
+        # Retoma só se os trechos já gravados são os mesmos de agora (mesmo catálogo e mesmo corte)
+        if done == passages[:len(done)] and index.ntotal == len(done):
+            start_index = len(done)
+            print(f"Retomando do trecho {start_index + 1}...")
+        else:
+            print("Catálogo mudou desde o build parcial. Começando do zero.")
+            index = None
+            start_index = 0
     else:
         index = None
-        metadatas = []
         start_index = 0
 
-    # Inicializa Embeddings (Gemini API)
-    embeddings_model = GoogleGenerativeAIEmbeddings(model="models/embedding-001", google_api_key=GOOGLE_API_KEY)
-
-    texts = []
-    # Prepara textos
-    for item in catalog:
-        # Monta o texto rico para embedding
-        embarques_str = ", ".join(item.get('embarques', []))
-        content = (
-            f"Pacote: {item['title']}\n"
-            f"Preço: {item['price']}\n"
-            f"Descrição: {item['description']}\n"
-            f"Roteiro: {item.get('roteiro', '')}\n"
-            f"Inclusões: {item.get('inclusoes', '')}\n"
-            f"Embarques: {embarques_str}"
-        )
-        texts.append(content)
-
-    # Processamento em lote (agora pode ser maior pois é local)
-    batch_size = 10 
+    # Inicializa Embeddings (Gemini API ou fastembed local)
+    try:
+        provider = get_embedding_provider(provider_name)
+    except Exception as e:
+        print(f"Erro ao carregar o backend de embeddings '{provider_name}': {e}")
+        return
+    # Textos que não mudaram desde o último build não são embedados de novo
+    cache = get_embedding_cache(f"{provider.name}:document")
+
+    # Processamento em lote (local aguenta lotes maiores; a API do Gemini, lotes menores)
+    batch_size = EMBEDDING_BATCH_SIZE if not provider.remote else 10
     
     for i in range(start_index, len(texts), batch_size):
         batch = texts[i:i+batch_size]
         print(f"Processando lote {i//batch_size + 1}...")
         
         try:
-            batch_embeddings = embeddings_model.embed_documents(batch)
+            batch_embeddings = cache.get_many(batch)
+            missing = [j for j, vec in enumerate(batch_embeddings) if vec is None]
+            if missing:
+                fresh = provider.embed_documents([batch[j] for j in missing])
+                for j, vec in zip(missing, fresh):
+                    batch_embeddings[j] = np.asarray(vec, dtype='float32')
+                    cache.put(batch[j], vec)
+            print(f"  {len(batch) - len(missing)} de {len(batch)} embeddings vieram do cache.")
             
             # Adiciona ao índice
-            embeddings_np = np.array(batch_embeddings).astype('float32')
+            embeddings_np = np.vstack(batch_embeddings).astype('float32')
             
             if index is None:
                 dimension = embeddings_np.shape[1]
                 index = faiss.IndexFlatL2(dimension)
             
             index.add(embeddings_np)
-            # Adiciona metadados correspondentes
-            end_idx = min(i + batch_size, len(catalog))
-            metadatas.extend(catalog[i:end_idx])
-            
+
             # Salva checkpoint
-            faiss.write_index(index, INDEX_FILE)
-            with open(METADATA_FILE, 'wb') as f:
-                pickle.dump(metadatas, f)
+            faiss.write_index(index, index_file)
+            write_metadata_store(passages_file, passages[:index.ntotal])
             
         except Exception as e:
             print(f"Erro no lote {i}: {e}")
             break
 
+    cache.flush()
+
+    if index is None or index.ntotal < len(passages):
+        print(f"Build incompleto ({index.ntotal if index else 0} de {len(passages)} trechos). Rode de novo para retomar; nada foi publicado.")
+        return
+    write_metadata_store(metadata_file, catalog)
+
+    # Os checkpoints são Flat (dá para retomar lote a lote); IVF/PQ precisam de
+    # todos os vetores para treinar, então a conversão acontece no fim
+    if factory.strip() != "Flat":
+        started = time.time()
+        index = build_index(index.reconstruct_n(0, index.ntotal), factory)
+        faiss.write_index(index, index_file)
+        print(f"Índice {describe(index)} ({factory}) montado em {time.time() - started:.1f}s.")
+
+    # Colunas tipadas (preço, data, embarques) para os filtros da busca
+    CatalogColumns.from_items(catalog).save(columns_file)
+    # O catálogo vai junto, para o bot carregar catálogo e índice da mesma versão
+    shutil.copyfile(CATALOG_FILE, files["catalog"])
+    version = publish_version(provider_name, staging, {
+        "provider": provider_name,
+        "model": provider.name,
+        "dim": index.d,
+        "factory": factory,
+        "index_type": describe(index),
+        "items": len(catalog),
+        "vectors": index.ntotal,
+        "chunks": chunks,
+    })
+    print(f"Versão {version} publicada. Os workers em execução trocam de índice sozinhos (ou via POST /admin/api/reload).")
     print("Processamento concluído!")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Gera o índice FAISS do catálogo")
+    parser.add_argument("--provider", default=EMBEDDING_PROVIDER, help="google ou fastembed (padrão: EMBEDDING_PROVIDER)")
+    parser.add_argument(
+        "--index-factory", default=FAISS_INDEX_FACTORY,
+        help="Tipo do índice FAISS (Flat, HNSW32, IVF,Flat, IVF,PQ64, SQ8...; padrão: FAISS_INDEX_FACTORY)"
+    )
+    parser.add_argument("--no-chunks", action="store_true", help="Um vetor por pacote (texto inteiro), sem trechos")
+    args = parser.parse_args()
+    main(args.provider, args.index_factory, not args.no_chunks)
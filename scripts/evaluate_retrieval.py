@@ -0,0 +1,189 @@
+"""
+Avaliação offline da busca do RAG: roda as consultas rotuladas de
+data/eval_queries.json (pergunta -> URLs certas do catálogo) contra uma ou
+mais configurações do índice e mede recall@k, MRR e latência (p50/p99).
+
+Cada configuração (tipo do índice x com/sem trechos) é montada em memória a
+partir do catálogo, com o mesmo código do build e do bot (trechos, FAISS,
+BM25, fusão, diversificação). Com o backend 'hashing' (padrão) não há rede
+nem download de modelo: o resultado é determinístico e dá para rodar no CI.
+
+Uso:
+    python scripts/evaluate_retrieval.py
+    python scripts/evaluate_retrieval.py --factories Flat HNSW32 "IVF,Flat" --chunking both --k 1 3 5
+    python scripts/evaluate_retrieval.py --json resultado.json --min-recall 0.8   # sai com erro se piorar
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Add project root to path
+sys.path.append(os.getcwd())
+
+from app.services.ann_index import build_index, describe
+from app.services.catalog_index import catalog_passages, CatalogColumns
+from app.services.embedding_cache import EmbeddingCache
+from app.services.embedding_provider import EMBEDDING_BATCH_SIZE
+from app.services.index_store import MetadataStore, write_metadata_store
+from app.services.lexical_index import BM25Index
+from app.services.rag_service import RAGService, IndexSnapshot
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+CATALOG_FILE = os.path.join(DATA_DIR, "catalog.json")
+QUERIES_FILE = os.path.join(DATA_DIR, "eval_queries.json")
+MODES = ("hybrid", "dense", "lexical")
+
+
+def build_snapshot(catalog, provider, factory: str, chunks: bool, workdir: str) -> IndexSnapshot:
+    """Índice completo em memória para uma configuração (nada é publicado)."""
+    passages, texts = catalog_passages(catalog, chunks)
+    vectors = np.vstack([
+        provider.embed_documents(texts[i:i + EMBEDDING_BATCH_SIZE])
+        for i in range(0, len(texts), EMBEDDING_BATCH_SIZE)
+    ]).astype('float32')
+    index = build_index(vectors, factory)
+
+    # Trechos pelo mesmo formato do build (o snapshot lê campo a campo)
+    passages_path = os.path.join(workdir, f"{factory.replace(',', '_')}-{int(chunks)}.passages")
+    write_metadata_store(passages_path, passages)
+    store = MetadataStore(passages_path)
+    parents = np.array([passage["parent"] for passage in passages], dtype=np.int64)
+    return IndexSnapshot(
+        version=f"eval:{factory}:{'trechos' if chunks else 'pacote'}",
+        index=index,
+        metadata=catalog,
+        lexical=BM25Index.from_items(catalog),
+        columns=CatalogColumns.from_items(catalog),
+        catalog=catalog,
+        passages=store,
+        parents=parents,
+    )
+
+
+def result_urls(result) -> set:
+    """URLs de um resultado: o pacote e as outras saídas da mesma viagem."""
+    urls = {result["item"].get("url")}
+    urls.update(entry.get("url") for entry in result.get("dates", []))
+    return urls
+
+
+def run_query(rag: RAGService, mode: str, query: str, k: int):
+    if mode == "hybrid":
+        return rag.search(query, k=k)
+    if mode == "dense":
+        return rag.search_by_vector(rag.embed_query(query), k)
+    return rag.search_lexical(query, k)
+
+
+def evaluate(rag: RAGService, labelled, mode: str, ks, repeat: int):
+    """recall@k (alguma URL certa no top-k), MRR e latência de cada consulta."""
+    k_max = max(ks)
+    hits = {k: 0 for k in ks}
+    reciprocal_ranks = []
+    latencies = []
+    misses = []
+    for entry in labelled:
+        relevant = set(entry["relevant"])
+        for _ in range(repeat):
+            started = time.perf_counter()
+            results = run_query(rag, mode, entry["query"], k_max)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        rank = next((position for position, result in enumerate(results, 1) if result_urls(result) & relevant), None)
+        for k in ks:
+            if rank is not None and rank <= k:
+                hits[k] += 1
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+        if rank is None or rank > min(ks):
+            misses.append((entry["query"], [result["item"].get("title") for result in results[:3]]))
+
+    return {
+        "recall": {k: hits[k] / len(labelled) for k in ks},
+        "mrr": float(np.mean(reciprocal_ranks)),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "misses": misses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Avaliação offline da busca do RAG com consultas rotuladas")
+    parser.add_argument("--provider", default="hashing", help="Backend de embeddings (padrão: hashing, determinístico e offline)")
+    parser.add_argument("--factories", nargs="+", default=["Flat"], help="Tipos do índice FAISS (formato do index_factory)")
+    parser.add_argument("--chunking", choices=["on", "off", "both"], default="both", help="Trechos por pacote, um vetor por pacote ou os dois")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--repeat", type=int, default=3, help="Execuções de cada consulta para a latência")
+    parser.add_argument("--queries", default=QUERIES_FILE, help="Arquivo JSON [{query, relevant: [urls]}]")
+    parser.add_argument("--json", help="Grava os resultados neste arquivo (para comparar execuções)")
+    parser.add_argument("--min-recall", type=float, help="Falha (código 1) se o recall@k máximo do modo híbrido ficar abaixo disso")
+    parser.add_argument("--verbose", action="store_true", help="Mostra as consultas que erraram")
+    args = parser.parse_args()
+
+    with open(CATALOG_FILE, "r", encoding="utf-8") as f:
+        catalog = json.load(f)
+    with open(args.queries, "r", encoding="utf-8") as f:
+        labelled = json.load(f)
+    ks = sorted(set(args.k))
+
+    # Serviço próprio do backend escolhido; o índice vem de cada configuração
+    rag = RAGService(args.provider)
+    if rag.provider is None:
+        print(f"Erro: backend '{args.provider}' indisponível.")
+        sys.exit(1)
+    print(f"{len(labelled)} consultas, {len(catalog)} pacotes, backend {rag.provider.name}")
+
+    chunkings = {"on": [True], "off": [False], "both": [True, False]}[args.chunking]
+    report = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for factory in args.factories:
+            for chunks in chunkings:
+                started = time.perf_counter()
+                snapshot = build_snapshot(catalog, rag.provider, factory, chunks, workdir)
+                build_seconds = time.perf_counter() - started
+                rag.swap(snapshot)
+                for mode in args.modes:
+                    # Cache de consultas vazio (e só em memória) a cada rodada: a latência inclui o embedding
+                    rag.query_cache = EmbeddingCache(f"{rag.provider.name}:query")
+                    result = evaluate(rag, labelled, mode, ks, args.repeat)
+                    report.append({
+                        "factory": factory,
+                        "index_type": describe(snapshot.index),
+                        "chunks": chunks,
+                        "vectors": snapshot.index.ntotal,
+                        "mode": mode,
+                        "build_s": round(build_seconds, 2),
+                        **result,
+                    })
+
+    header = " ".join(f"{'R@' + str(k):>6}" for k in ks)
+    print(f"\n{'índice':<16} {'trechos':<8} {'modo':<8} {header} {'MRR':>6} {'p50 ms':>8} {'p99 ms':>8}")
+    for row in report:
+        recalls = " ".join(f"{row['recall'][k]:>6.3f}" for k in ks)
+        print(
+            f"{row['factory']:<16} {'sim' if row['chunks'] else 'não':<8} {row['mode']:<8} {recalls} "
+            f"{row['mrr']:>6.3f} {row['p50_ms']:>8.2f} {row['p99_ms']:>8.2f}"
+        )
+        if args.verbose:
+            for query, titles in row["misses"]:
+                print(f"    errou: '{query}' -> {titles}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nResultados gravados em {args.json}")
+
+    if args.min_recall is not None:
+        worst = min((row["recall"][ks[-1]] for row in report if row["mode"] == "hybrid"), default=0.0)
+        if worst < args.min_recall:
+            print(f"\nFALHOU: recall@{ks[-1]} do híbrido = {worst:.3f} < {args.min_recall}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Converte os metadados antigos do índice (data/index*.pkl, pickle) para o
+formato colunar mapeado em memória (data/index*.meta) e confere o resultado.
+
+Uso:
+    python scripts/migrate_index_metadata.py          # converte e apaga o .pkl
+    python scripts/migrate_index_metadata.py --keep   # mantém o .pkl
+"""
+import argparse
+import glob
+import os
+import pickle
+import sys
+
+# Add project root to path
+sys.path.append(os.getcwd())
+
+from app.services.index_store import MetadataStore, write_metadata_store
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+
+
+def migrate(pkl_path: str, keep: bool):
+    meta_path = pkl_path[:-len(".pkl")] + ".meta"
+    # Arquivo gerado por nós mesmos no build; pickle de fonte desconhecida não deve ser aberto
+    with open(pkl_path, "rb") as f:
+        items = pickle.load(f)
+
+    write_metadata_store(meta_path, items)
+    store = MetadataStore(meta_path)
+    mismatched = [i for i, item in enumerate(items) if store[i] != {k: v for k, v in item.items() if v is not None}]
+    if len(store) != len(items) or mismatched:
+        print(f"Erro: {meta_path} não confere com {pkl_path} (registros divergentes: {mismatched[:5]}). Mantendo o .pkl.")
+        return
+    print(f"{pkl_path} -> {meta_path}: {len(items)} registros, {os.path.getsize(pkl_path)} -> {os.path.getsize(meta_path)} bytes.")
+    if not keep:
+        os.remove(pkl_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migra os metadados do índice de pickle para o formato colunar")
+    parser.add_argument("--keep", action="store_true", help="Não apaga o .pkl depois de migrar")
+    args = parser.parse_args()
+
+    legacy = sorted(glob.glob(os.path.join(DATA_DIR, "index*.pkl")))
+    if not legacy:
+        print("Nenhum arquivo .pkl para migrar.")
+        return
+    for path in legacy:
+        migrate(path, args.keep)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Simula o SLO guard offline, com LLMs falsos de latência configurável.
+
+Exemplo (cauda lenta de 5% em 15s, prazo de 8s):
+    python scripts/simulate_slo.py --primary "bimodal:0.8,15,0.05" --deadline 8
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+# Add project root to path
+sys.path.append(os.getcwd())
+
+from app.core.llm_gateway import LLMGateway
+from app.core.slo_guard import SLOGuard, percentile
+from app.core.stub_llm import StubChain
+
+
+async def run(args):
+    gateway = LLMGateway(queue_timeout=args.deadline)
+    gateway.configure("primary", args.concurrency, 100000, 10**9)
+    gateway.configure("fallback", args.concurrency, 100000, 10**9)
+    guard = SLOGuard(
+        "primary", StubChain(args.primary, failure_rate=args.failure_rate, seed=1, name="primary"),
+        "fallback", StubChain(args.fallback, seed=2, name="fallback"),
+        deadline=args.deadline,
+        fallback_deadline=args.fallback_deadline,
+        hedging=not args.no_hedge,
+        gateway=gateway
+    )
+
+    latencies = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            started = time.monotonic()
+            await guard.invoke({"user_text": f"pergunta {i}"}, "whatsapp", 500, lambda: "resposta pronta")
+            latencies.append(time.monotonic() - started)
+
+    print(f"--- {args.requests} requisições | principal={args.primary} | fallback={args.fallback} | prazo={args.deadline}s ---")
+    started = time.monotonic()
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    elapsed = time.monotonic() - started
+
+    stats = guard.stats()
+    print(f"Tempo total: {elapsed:.1f}s")
+    print(f"Latência ponta a ponta: p50={percentile(latencies, 0.5):.2f}s p95={percentile(latencies, 0.95):.2f}s "
+          f"p99={percentile(latencies, 0.99):.2f}s máx={max(latencies):.2f}s")
+    print(f"Desfechos: {stats['outcomes']}")
+    print(f"Hedges disparados: {stats['hedges_sent']} | Prazos estourados: {stats['deadline_misses']} | "
+          f"Erros do principal: {stats['primary_errors']}")
+    print(f"p95 do principal (usado no hedge): {stats['primary_p95_s']}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulação offline do SLO guard")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--primary", default="bimodal:0.8,15,0.05", help="Latência do modelo principal")
+    parser.add_argument("--fallback", default="lognormal:1.0,0.3", help="Latência do modelo secundário")
+    parser.add_argument("--failure-rate", type=float, default=0.01)
+    parser.add_argument("--deadline", type=float, default=8.0)
+    parser.add_argument("--fallback-deadline", type=float, default=4.0)
+    parser.add_argument("--no-hedge", action="store_true")
+    asyncio.run(run(parser.parse_args()))
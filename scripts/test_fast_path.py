@@ -0,0 +1,74 @@
+"""
+Checagens do fast path e dos filtros da busca contra o catálogo atual (sem
+LLM e sem rede): perguntas que ele deve responder sozinho, perguntas que
+devem seguir para o LLM e filtros extraídos da pergunta.
+
+Uso:
+    python scripts/test_fast_path.py
+"""
+import json
+import os
+import re
+import sys
+from datetime import date
+
+# Add project root to path
+sys.path.append(os.getcwd())
+
+from app.core.fast_path import FastPathRouter
+from app.services.catalog_index import CatalogColumns, extract_month, parse_search_filters
+
+CATALOG_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "catalog.json")
+
+
+def check(label: str, ok: bool, detail=None):
+    print(f"{'✅' if ok else '❌'} {label}" + (f" -> {detail}" if not ok and detail is not None else ""))
+    return ok
+
+
+def _past_dates(result) -> list:
+    """Datas dd/mm/aaaa já passadas citadas na resposta do fast path."""
+    if not result:
+        return []
+    found = re.findall(r"\b(\d{2})/(\d{2})/(\d{4})\b", " ".join(result["messages"]))
+    return [f"{d}/{m}/{y}" for d, m, y in found if date(int(y), int(m), int(d)) < date.today()]
+
+
+def main():
+    with open(CATALOG_FILE, "r", encoding="utf-8") as f:
+        catalog = json.load(f)
+    router = FastPathRouter(enabled=True)
+    router.set_catalog(catalog)
+    columns = CatalogColumns.from_items(catalog)
+
+    results = [
+        # "janeiro" de "Rio de Janeiro" não é o mês da viagem
+        check("'rio de janeiro' não vira janeiro", extract_month("quais viagens pro rio de janeiro?") is None),
+        check("'em janeiro' continua sendo janeiro", extract_month("viagens em janeiro pro rio de janeiro") == 1),
+        check(
+            "'quais viagens pro rio de janeiro?' segue para o LLM",
+            router.route("quais viagens pro rio de janeiro?") is None,
+            router.route("quais viagens pro rio de janeiro?"),
+        ),
+        check("preço não cita saídas passadas", not _past_dates(router.route("quanto custa o chile")), router.route("quanto custa o chile")),
+        check(
+            "embarque não cita saídas passadas",
+            not _past_dates(router.route("horario de embarque do chile saindo do tatuape")),
+            router.route("horario de embarque do chile saindo do tatuape"),
+        ),
+        # Filtros da busca do RAG (mesma extração de mês)
+        check("'tem viagem pro rio de janeiro?' não filtra por mês", "month" not in parse_search_filters("tem viagem pro rio de janeiro?")),
+        check(
+            "filtro de mês só traz saídas futuras",
+            all(date.fromordinal(int(columns.departure[i])) >= date.today() for i in columns.select(month=12)),
+            [str(date.fromordinal(int(columns.departure[i]))) for i in columns.select(month=12)],
+        ),
+    ]
+
+    failed = results.count(False)
+    print(f"\n{len(results) - failed}/{len(results)} checagens ok.")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()